@@ -0,0 +1,182 @@
+import asyncio
+import os
+import time
+
+import aiohttp
+
+from segment_downloader import (DEFAULT_CONNECTIONS, DEFAULT_SEGMENT_SIZE, READ_CHUNK_SIZE, DEFAULT_TIMEOUT,
+                                FileWriter, load_state, save_state, split_ranges)
+from rate_limiter import TRANSFER_BASE_DELAY, Backoff, acquire_async, get_bucket, get_error_response, get_retry_delay, is_retryable
+from throughput_stats import ThroughputRecorder
+
+DEFAULT_STREAMS = 1
+MAX_RETRY_DELAY = 8
+
+def create_session(limit_per_host=DEFAULT_CONNECTIONS):
+    connector = aiohttp.TCPConnector(limit=0, limit_per_host=limit_per_host)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=DEFAULT_TIMEOUT, sock_read=DEFAULT_TIMEOUT)
+    # Media is never compressed; identity keeps byte counts equal to what went over the wire
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, auto_decompress=False,
+                                 headers={'Accept-Encoding': 'identity'})
+
+def check_proxy(proxy):
+    if proxy and not proxy.startswith(('http://', 'https://')):
+        raise ValueError(f"The asyncio engine only supports HTTP proxies, got: {proxy}")
+    return proxy
+
+async def stream_until_deadline(session, url, deadline, recorder, proxy=None):
+    # One HTTP stream that reconnects with non-blocking backoff until the deadline. Its time to
+    # first byte and stalls are timed apart from the other streams sharing the recorder.
+    stream = recorder.add_stream()
+    bucket = get_bucket(url, proxy)
+    backoff = Backoff(TRANSFER_BASE_DELAY, max_delay=MAX_RETRY_DELAY)
+    bucket_deadline = time.monotonic() + (deadline - time.perf_counter())
+    while time.perf_counter() < deadline:
+        if not await acquire_async(bucket, bucket_deadline):
+            return
+        try:
+            stream.request_started()
+            async with session.get(url, proxy=proxy) as r:
+                r.raise_for_status()
+                chunk_start = time.perf_counter()
+                async for chunk in r.content.iter_chunked(READ_CHUNK_SIZE):
+                    current_time = time.perf_counter()
+                    stream.record_chunk(len(chunk), current_time - chunk_start, current_time)
+                    if current_time >= deadline:
+                        return
+                    chunk_start = current_time
+            bucket.on_success()
+            backoff.reset()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            await asyncio.sleep(get_retry_delay(e, bucket, backoff, deadline=bucket_deadline))
+
+async def measure_download_speed_async(url, duration, proxy=None, streams=DEFAULT_STREAMS, recorder=None):
+    recorder = recorder or ThroughputRecorder()
+    proxy = check_proxy(proxy)
+    cpu_start = time.process_time()
+    start_time = recorder.start()
+    deadline = start_time + duration
+    async with create_session(limit_per_host=streams) as session:
+        tasks = [asyncio.create_task(stream_until_deadline(session, url, deadline, recorder, proxy))
+                 for _ in range(streams)]
+        # Streams stuck in a slow read are cancelled at the deadline rather than waited for
+        done, pending = await asyncio.wait(tasks, timeout=duration)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    total_time = recorder.finish() - start_time
+    recorder.cpu_time += time.process_time() - cpu_start
+    avg_speed = recorder.total_bytes / total_time / 1024 / 1024  # MB/s
+    return avg_speed, recorder.total_bytes / 1024 / 1024, recorder.peak_speed  # avg speed in MB/s, downloaded in MB, peak speed in MB/s
+
+async def get_content_length_async(session, url, proxy=None):
+    async with session.get(url, headers={'Range': 'bytes=0-0'}, proxy=proxy) as r:
+        r.raise_for_status()
+        content_range = r.headers.get('Content-Range')
+        if r.status == 206 and content_range and '/' in content_range:
+            total = content_range.rsplit('/', 1)[1]
+            if total != '*':
+                return int(total), True
+        return r.content_length, False
+
+async def fetch_range_async(session, url, start, end, sink, proxy=None):
+    headers = {'Range': f"bytes={start}-{end}"} if end is not None else {'Range': f"bytes={start}-"}
+    received = 0
+    async with session.get(url, headers=headers, proxy=proxy) as r:
+        r.raise_for_status()
+        if r.status != 206 and start > 0:
+            raise aiohttp.ClientResponseError(r.request_info, r.history, status=r.status,
+                                              message="Server ignored range request")
+        async for chunk in r.content.iter_chunked(READ_CHUNK_SIZE):
+            sink(start + received, chunk)
+            received += len(chunk)
+    return received
+
+async def download_file_async(url, output_filename, connections=DEFAULT_CONNECTIONS,
+                              segment_size=DEFAULT_SEGMENT_SIZE, proxy=None, max_retries=3):
+    # Same on-disk layout and .part.json resume state as segment_downloader.download_file
+    proxy = check_proxy(proxy)
+    async with create_session(limit_per_host=connections) as session:
+        total_size, supports_ranges = await get_content_length_async(session, url, proxy)
+        if not total_size or not supports_ranges:
+            # Fall back to one plain stream when the server cannot split the file
+            connections = 1
+            segment_size = total_size or 0
+
+        if total_size and os.path.exists(output_filename) and os.path.getsize(output_filename) == total_size:
+            return total_size
+
+        part_filename = output_filename + '.part'
+        state_filename = part_filename + '.json'
+
+        if not total_size:
+            with open(part_filename, 'wb') as f:
+                received = await fetch_range_async(session, url, 0, None, lambda offset, data: f.write(data), proxy)
+            os.replace(part_filename, output_filename)
+            return received
+
+        segments = load_state(state_filename, part_filename, total_size, segment_size) if supports_ranges else {0: 0}
+        ranges = dict(split_ranges(total_size, segment_size))
+        writer = FileWriter(part_filename, total_size)
+        slots = asyncio.Semaphore(connections)
+        bucket = get_bucket(url, proxy)
+        backoff = Backoff(TRANSFER_BASE_DELAY)
+
+        async def fetch_segment(start):
+            def sink(offset, data):
+                writer.write(offset, data)
+                segments[start] += len(data)
+
+            async with slots:
+                await acquire_async(bucket)
+                await fetch_range_async(session, url, start + segments[start], ranges[start], sink, proxy)
+            save_state(state_filename, total_size, segment_size, segments)
+            if segments[start] < ranges[start] - start + 1:
+                raise aiohttp.ClientPayloadError(f"Segment {start}-{ranges[start]} ended early")
+            bucket.on_success()
+
+        try:
+            for attempt in range(max_retries):
+                if not supports_ranges:
+                    segments[0] = 0  # Without ranges a retry can only start over
+                pending = [start for start, done in segments.items() if done < ranges[start] - start + 1]
+                if not pending:
+                    break
+                results = await asyncio.gather(*(fetch_segment(start) for start in pending), return_exceptions=True)
+                errors = [result for result in results if isinstance(result, Exception)]
+                if not errors:
+                    break
+                error = max(errors, key=lambda e: get_error_response(e)[0] == 429)
+                if attempt < max_retries - 1 and is_retryable(error):
+                    print(f"{len(errors)} segment(s) failed: {error}. Resuming... (Attempt {attempt + 1}/{max_retries})")
+                    await asyncio.sleep(get_retry_delay(error, bucket, backoff, quiet=True))
+                else:
+                    raise error
+        finally:
+            writer.close()
+            save_state(state_filename, total_size, segment_size, segments)
+
+    if any(done < ranges[start] - start + 1 for start, done in segments.items()):
+        raise aiohttp.ClientPayloadError(f"Download of {output_filename} is incomplete")
+    # State first, as in segment_downloader.download_file
+    os.remove(state_filename)
+    os.replace(part_filename, output_filename)
+    return total_size
+
+# Synchronous wrappers so the existing thread-based CLIs can use the asyncio core
+
+def measure_download_speed_sync(url, duration, proxy=None, streams=DEFAULT_STREAMS, recorder=None):
+    return asyncio.run(measure_download_speed_async(url, duration, proxy=proxy, streams=streams, recorder=recorder))
+
+def download_file_sync(url, output_filename, connections=DEFAULT_CONNECTIONS, segment_size=DEFAULT_SEGMENT_SIZE,
+                       proxy=None, max_retries=3):
+    return asyncio.run(download_file_async(url, output_filename, connections=connections,
+                                           segment_size=segment_size, proxy=proxy, max_retries=max_retries))
+
+def download_files_sync(downloads, connections=DEFAULT_CONNECTIONS, segment_size=DEFAULT_SEGMENT_SIZE, proxy=None):
+    # downloads is a list of (url, output_filename); all of them share one event loop
+    async def run():
+        return await asyncio.gather(*(download_file_async(url, output_filename, connections=connections,
+                                                          segment_size=segment_size, proxy=proxy)
+                                      for url, output_filename in downloads))
+    return asyncio.run(run())
@@ -0,0 +1,92 @@
+import copy
+import threading
+import time
+
+from format_selector import SelectionPolicy
+from speed_test import measure_download_speed
+
+DEFAULT_SMOOTHING = 0.3  # Weight of the newest sample in the moving average
+DEFAULT_PROBE_SECONDS = 3
+MIN_SAMPLE_BYTES = 256 * 1024  # Smaller transfers are mostly latency and say little about bandwidth
+MIN_SAMPLE_SECONDS = 0.2
+SAFETY_FACTOR = 0.8  # Plan against a bit less than the measured rate so slow patches do not blow the schedule
+
+def get_moving_average(old, sample, smoothing=DEFAULT_SMOOTHING):
+    # Exponentially weighted moving average; the first sample starts it
+    return sample if old is None else old + smoothing * (sample - old)
+
+class BandwidthEstimator:
+    # Exponentially weighted moving average of the throughput of single downloads, in bytes/s
+
+    def __init__(self, smoothing=DEFAULT_SMOOTHING):
+        self.smoothing = smoothing
+        self.rate = None
+        self.samples = 0
+        self.lock = threading.Lock()
+
+    def update(self, nbytes, seconds):
+        if nbytes < MIN_SAMPLE_BYTES or seconds < MIN_SAMPLE_SECONDS:
+            return self.rate
+        sample = nbytes / seconds
+        with self.lock:
+            self.rate = get_moving_average(self.rate, sample, self.smoothing)
+            self.samples += 1
+            return self.rate
+
+class QualityPlanner:
+    # Turns the measured throughput into a size budget per video, so that each video finishes
+    # within target_time seconds, or the whole batch within deadline seconds from now.
+    # Formats are re-selected against the current budget right before each download, so queued
+    # videos are downgraded when the link slows down and upgraded again when it recovers.
+
+    def __init__(self, target_time=None, deadline=None, jobs=1, estimator=None):
+        self.target_time = target_time
+        self.deadline_time = time.monotonic() + deadline if deadline else None
+        self.jobs = max(1, jobs)
+        self.estimator = estimator or BandwidthEstimator()
+        self.total_videos = None
+        self.finished_videos = 0
+        self.lock = threading.Lock()
+        self.probe_lock = threading.Lock()
+
+    def set_total(self, total_videos):
+        self.total_videos = total_videos
+
+    def video_finished(self):
+        with self.lock:
+            self.finished_videos += 1
+
+    def record_transfer(self, nbytes, seconds):
+        return self.estimator.update(nbytes, seconds)
+
+    def probe(self, url, proxy=None, duration=DEFAULT_PROBE_SECONDS):
+        # Short quiet speed test on the first media URL, so the first video already has a budget
+        with self.probe_lock:
+            if self.estimator.rate is None:
+                _, downloaded, _ = measure_download_speed(url, duration=duration, proxy=proxy, quiet=True)
+                self.estimator.update(downloaded * 1024 * 1024, duration)
+        return self.estimator.rate
+
+    def seconds_per_video(self):
+        if self.target_time:
+            return self.target_time
+        if self.deadline_time is None:
+            return None
+        with self.lock:
+            remaining = max(1, (self.total_videos or 1) - self.finished_videos)
+        # Each of the jobs workers handles its share of the remaining videos one after another
+        return max(0, self.deadline_time - time.monotonic()) * self.jobs / remaining
+
+    def byte_budget(self):
+        seconds = self.seconds_per_video()
+        if seconds is None or self.estimator.rate is None:
+            return None
+        return max(1.0, self.estimator.rate * SAFETY_FACTOR * seconds)
+
+    def policy(self, base_policy=None):
+        # A copy of base_policy whose size budget also fits the current byte budget
+        policy = copy.copy(base_policy) if base_policy else SelectionPolicy()
+        budget = self.byte_budget()
+        if budget is not None:
+            policy.max_total_size = min(policy.max_total_size, budget) if policy.max_total_size else budget
+        return policy
@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+from ffmpeg_merger import get_ffmpeg_exe
+
+DEFAULT_MEDIA_DIR = os.path.join(".cache", "benchmark")
+DEFAULT_MEDIA_SECONDS = 10
+DEFAULT_VIDEO_BITRATE = "8M"
+WRITE_CHUNK_SIZE = 64 * 1024
+URL_LIFETIME = 24 * 60 * 60  # expire= put in media URLs, so the metadata cache treats them like real ones
+
+def make_media(media_dir=DEFAULT_MEDIA_DIR, seconds=DEFAULT_MEDIA_SECONDS, video_bitrate=DEFAULT_VIDEO_BITRATE,
+               fragmented=False):
+    # Real H.264 and AAC files, so the merge stage does the same stream copy as with YouTube media.
+    # Noise keeps the encoder from compressing the test pattern below the requested bitrate.
+    # fragmented=True writes fragmented MP4 like YouTube's DASH formats, which can be merged while streaming.
+    suffix = "-frag" if fragmented else ""
+    video_path = os.path.join(media_dir, f"video-{seconds}s-{video_bitrate}{suffix}.mp4")
+    audio_path = os.path.join(media_dir, f"audio-{seconds}s{suffix}.m4a")
+    movflags = ['-movflags', 'frag_keyframe+empty_moov+default_base_moof'] if fragmented else []
+    ffmpeg = get_ffmpeg_exe()
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg executable not found")
+    os.makedirs(media_dir, exist_ok=True)
+    if not os.path.exists(video_path):
+        subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'lavfi',
+                        '-i', f"testsrc2=size=1280x720:rate=30:duration={seconds},noise=alls=30:allf=t",
+                        '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', video_bitrate, '-maxrate', video_bitrate,
+                        '-bufsize', video_bitrate, '-pix_fmt', 'yuv420p', '-an'] + movflags + [video_path + '.tmp.mp4'],
+                       check=True)
+        os.replace(video_path + '.tmp.mp4', video_path)
+    if not os.path.exists(audio_path):
+        subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'lavfi',
+                        '-i', f"sine=frequency=440:duration={seconds}", '-c:a', 'aac', '-b:a', '128k'] + movflags +
+                       [audio_path + '.tmp.m4a'], check=True)
+        os.replace(audio_path + '.tmp.m4a', audio_path)
+    return video_path, audio_path
+
+def make_video_id(index):
+    # YouTube IDs are 11 characters; the URL parsers in this repo rely on that
+    return f"bench{index:06d}"
+
+class FakeYouTubeServer:
+    # Local stand-in for YouTube and its CDN. /info/<id> and /playlist/<name> return
+    # yt-dlp-style metadata (read by run_tool.FakeYoutubeDL), /media/<name> serves the media files
+    # with Range support. Bandwidth, latency, 429s, dropped connections and Range support are configurable.
+
+    def __init__(self, video_path, audio_path, videos=4, playlists=2, playlist_size=25, rate=0, latency=0.0,
+                 throttle_every=0, disconnect_rate=0.0, ranges=True, host='127.0.0.1', port=0, seed=1):
+        self.media = {'video.mp4': video_path, 'audio.m4a': audio_path}
+        self.video_ids = [make_video_id(index) for index in range(max(videos, playlists * playlist_size))]
+        self.videos = videos
+        self.playlists = playlists
+        self.playlist_size = playlist_size
+        self.rate = rate  # Bytes per second per connection, 0 for unlimited
+        self.latency = latency  # Seconds before every response
+        self.throttle_every = throttle_every  # Every Nth metadata request gets HTTP 429
+        self.disconnect_rate = disconnect_rate  # Share of media responses cut off part way
+        self.ranges = ranges  # False answers every media request with the whole file, like servers without Range support
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.handle(self)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {'requests': 0, 'metadata_requests': 0, 'media_requests': 0, 'bytes_sent': 0,
+                          'throttled': 0, 'disconnects': 0}
+            self.request_seconds = []
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats), list(self.request_seconds)
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def video_urls(self):
+        return [f"https://www.youtube.com/watch?v={video_id}" for video_id in self.video_ids[:self.videos]]
+
+    def playlist_urls(self):
+        return [f"https://www.youtube.com/playlist?list=BENCH{index}" for index in range(self.playlists)]
+
+    def make_info(self, video_id):
+        expire = int(time.time()) + URL_LIFETIME
+        duration = DEFAULT_MEDIA_SECONDS
+        formats = [
+            {'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128, 'tbr': 128,
+             'filesize': os.path.getsize(self.media['audio.m4a'])},
+            {'format_id': '136', 'ext': 'mp4', 'vcodec': 'avc1.64001f', 'acodec': 'none', 'height': 720,
+             'width': 1280, 'fps': 30, 'filesize': os.path.getsize(self.media['video.mp4'])},
+        ]
+        for f in formats:
+            name = 'audio.m4a' if f['vcodec'] == 'none' else 'video.mp4'
+            f['url'] = f"{self.base_url}/media/{name}?id={video_id}&itag={f['format_id']}&expire={expire}"
+            f['tbr'] = f.get('tbr') or round(f['filesize'] * 8 / 1000 / duration, 1)
+            f['protocol'] = 'https'
+        return {'id': video_id, 'title': f"Benchmark video {video_id}", 'duration': duration,
+                'webpage_url': f"https://www.youtube.com/watch?v={video_id}", 'formats': formats}
+
+    def make_playlist(self, name):
+        index = int(name.replace('BENCH', '') or 0)
+        video_ids = self.video_ids[index * self.playlist_size:(index + 1) * self.playlist_size]
+        return {'_type': 'playlist', 'id': name, 'title': f"Benchmark playlist {name}",
+                'entries': [{'_type': 'url', 'url': f"https://www.youtube.com/watch?v={video_id}"}
+                            for video_id in video_ids]}
+
+    def handle(self, request):
+        start_time = time.perf_counter()
+        self.count('requests')
+        if self.latency:
+            time.sleep(self.latency)
+        path = urlparse(request.path).path
+        try:
+            if path.startswith('/media/'):
+                self.count('media_requests')
+                self.send_media(request, path[len('/media/'):])
+            elif path.startswith('/info/') or path.startswith('/playlist/'):
+                self.count('metadata_requests')
+                self.send_metadata(request, path)
+            else:
+                self.send_json(request, 404, {'error': 'not found'})
+        except (BrokenPipeError, ConnectionResetError):
+            request.close_connection = True
+        with self.lock:
+            self.request_seconds.append(time.perf_counter() - start_time)
+
+    def send_json(self, request, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(data)
+
+    def send_metadata(self, request, path):
+        with self.lock:
+            throttled = self.throttle_every and self.stats['metadata_requests'] % self.throttle_every == 0
+        if throttled:
+            self.count('throttled')
+            self.send_json(request, 429, {'error': 'Too Many Requests'}, {'Retry-After': '1'})
+            return
+        kind, name = path.strip('/').split('/', 1)
+        if kind == 'info':
+            if name not in self.video_ids:
+                self.send_json(request, 404, {'error': 'unknown video'})
+                return
+            self.send_json(request, 200, self.make_info(name))
+        else:
+            self.send_json(request, 200, self.make_playlist(name))
+
+    def send_media(self, request, name):
+        path = self.media.get(name)
+        if not path:
+            self.send_json(request, 404, {'error': 'unknown media'})
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d+)-(\d*)$', request.headers.get('Range', '')) if self.ranges else None
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            if start >= size:
+                request.send_response(416)
+                request.send_header('Content-Range', f"bytes */{size}")
+                request.send_header('Content-Length', '0')
+                request.end_headers()
+                return
+            request.send_response(206)
+            request.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        else:
+            request.send_response(200)
+        length = end - start + 1
+        request.send_header('Content-Type', 'video/mp4' if name.endswith('.mp4') else 'audio/mp4')
+        request.send_header('Content-Length', str(length))
+        request.send_header('Accept-Ranges', 'bytes' if self.ranges else 'none')
+        request.end_headers()
+
+        with self.lock:
+            cut_at = int(length * self.random.random()) if self.random.random() < self.disconnect_rate else None
+        sent = 0
+        send_start = time.perf_counter()
+        with open(path, 'rb') as f:
+            f.seek(start)
+            while sent < length:
+                data = f.read(min(WRITE_CHUNK_SIZE, length - sent))
+                if cut_at is not None and sent + len(data) > cut_at:
+                    request.wfile.write(data[:cut_at - sent])
+                    self.count('bytes_sent', cut_at - sent)
+                    self.count('disconnects')
+                    request.close_connection = True
+                    return
+                request.wfile.write(data)
+                sent += len(data)
+                self.count('bytes_sent', len(data))
+                if self.rate:
+                    # Sleep until the connection is back on its rate, which also absorbs timer jitter
+                    delay = sent / self.rate - (time.perf_counter() - send_start)
+                    if delay > 0:
+                        time.sleep(delay)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fake YouTube metadata and media for benchmarks")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    parser.add_argument("--rate", type=float, default=0, help="Bandwidth per connection in MB/s, 0 for unlimited")
+    parser.add_argument("--latency", type=float, default=0, help="Seconds of delay before every response")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer every Nth metadata request with HTTP 429")
+    parser.add_argument("--disconnect-rate", type=float, default=0, help="Share of media responses cut off part way")
+    parser.add_argument("--no-ranges", action="store_true", help="Ignore Range headers and always send whole media files")
+    parser.add_argument("--fragmented", action="store_true", help="Serve fragmented MP4 like YouTube's DASH formats")
+    args = parser.parse_args()
+
+    video_path, audio_path = make_media(fragmented=args.fragmented)
+    server = FakeYouTubeServer(video_path, audio_path, rate=args.rate * 1024 * 1024, latency=args.latency,
+                               throttle_every=args.throttle_every, disconnect_rate=args.disconnect_rate,
+                               ranges=not args.no_ranges, port=args.port).start()
+    print(f"Serving on {server.base_url}, set FAKE_YOUTUBE_SERVER={server.base_url} for benchmarks.run_tool")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
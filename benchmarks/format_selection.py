@@ -0,0 +1,91 @@
+import argparse
+import random
+import time
+
+from format_selector import SelectionPolicy, select_format
+from format_table import FormatTable, select_formats
+
+DEFAULT_VIDEOS = 5000
+DEFAULT_REPEAT = 3
+
+VIDEO_CODECS = ['avc1.64001F', 'avc1.4d401e', 'vp09.00.40.08', 'vp9', 'av01.0.08M.08']
+AUDIO_CODECS = ['mp4a.40.2', 'opus']
+HEIGHTS = [144, 240, 360, 480, 720, 1080, 1440, 2160]
+
+def make_info(rng, index):
+    # A format list shaped like yt-dlp's: audio-only, video-only per height and codec, one muxed format
+    duration = rng.randint(30, 3600)
+    formats = []
+    for acodec in AUDIO_CODECS:
+        for abr in (48, 128, 160):
+            formats.append({'format_id': f"a{abr}{acodec[:4]}", 'url': f"https://cdn.invalid/{index}/a{abr}",
+                            'ext': 'm4a' if acodec.startswith('mp4a') else 'webm', 'vcodec': 'none',
+                            'acodec': acodec, 'abr': abr + rng.random(), 'tbr': abr + rng.random()})
+    for height in HEIGHTS[:rng.randint(3, len(HEIGHTS))]:
+        for vcodec in rng.sample(VIDEO_CODECS, 3):
+            tbr = height * rng.uniform(1.5, 4.0)
+            formats.append({'format_id': f"v{height}{vcodec[:4]}", 'url': f"https://cdn.invalid/{index}/v{height}{vcodec[:4]}",
+                            'ext': 'mp4' if not vcodec.startswith('vp') else 'webm', 'vcodec': vcodec,
+                            'acodec': 'none', 'height': height, 'fps': 30, 'tbr': tbr,
+                            'filesize': int(tbr * 125 * duration) if rng.random() < 0.7 else None})
+    formats.append({'format_id': '18', 'url': f"https://cdn.invalid/{index}/18", 'ext': 'mp4',
+                    'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2', 'height': 360, 'tbr': 500.0})
+    formats.append({'format_id': 'sb0', 'url': f"https://cdn.invalid/{index}/sb0", 'ext': 'mhtml',
+                    'vcodec': 'none', 'acodec': 'none', 'height': 90})
+    rng.shuffle(formats)
+    return {'id': f"video{index:07d}", 'title': f"Video {index}", 'duration': duration, 'formats': formats}
+
+def select_with_max(info):
+    # The per-video scan the selector replaces
+    formats = info.get('formats', [])
+    video_formats = [f for f in formats if f.get('vcodec') != 'none' and f.get('height') is not None]
+    best_video = max(video_formats, key=lambda x: (x['height'], x.get('tbr', 0) or 0)) if video_formats else None
+    audio_formats = [f for f in formats if f.get('acodec') != 'none']
+    best_audio = max(audio_formats, key=lambda x: (x.get('abr', 0) or 0, x.get('tbr', 0) or 0)) if audio_formats else None
+    return best_video, best_audio
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark format selection on synthetic format lists")
+    parser.add_argument("--videos", type=int, default=DEFAULT_VIDEOS, help="Number of synthetic videos")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per measurement, the fastest is reported")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the format lists")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    infos = [make_info(rng, index) for index in range(args.videos)]
+    total_formats = sum(len(info['formats']) for info in infos)
+    print(f"{args.videos} videos, {total_formats} formats")
+
+    max_time, expected = best_of(args.repeat, lambda: [select_with_max(info) for info in infos])
+    table_time, table = best_of(args.repeat, lambda: FormatTable.from_infos(infos))
+    select_time, selected = best_of(args.repeat, lambda: select_formats(table))
+    policy = SelectionPolicy(codec_priority=['av01', 'vp09', 'avc1'], max_height=1080, max_total_size=200 * 1024 * 1024,
+                             codec_max_tbr={'av01': 3000})
+    policy_time, batch_selected = best_of(args.repeat, lambda: select_formats(table, policy))
+    # What main_download does: one video at a time, without a table
+    single_time, single_selected = best_of(args.repeat, lambda: [select_format(info, policy) for info in infos])
+
+    mismatches = sum(1 for got, want in zip(selected, expected)
+                     if got[0] is not want[0] or got[1] is not want[1])
+    print(f"{'Method':<28}{'Seconds':>10}{'Videos/s':>14}")
+    for name, seconds in [("max() per video", max_time),
+                          ("build table", table_time),
+                          ("select (default policy)", select_time),
+                          ("select (budget policy)", policy_time),
+                          ("build + select", table_time + select_time),
+                          ("select_format per video", single_time)]:
+        print(f"{name:<28}{seconds:>10.4f}{args.videos / seconds:>14.0f}")
+    print(f"Selections differing from max(): {mismatches}")
+    print(f"select_format differing from select_formats: "
+          f"{sum(1 for got, want in zip(single_selected, batch_selected) if got[0] is not want[0] or got[1] is not want[1])}")
+
+if __name__ == "__main__":
+    main()
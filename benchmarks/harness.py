@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_server import FakeYouTubeServer, make_media
+from throughput_stats import percentile
+
+SCENARIOS = ['ping', 'download', 'analyze']
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.10
+DEFAULT_PING_DURATION = 5
+# Metrics compared against the baseline; True where higher is better
+COMPARED_METRICS = {
+    'throughput_mb_s': True,
+    'items_per_second': True,
+    'wall_seconds': False,
+    'cpu_seconds': False,
+    'peak_rss_mb': False,
+}
+
+def get_scenario_command(scenario, server, work_dir, args):
+    tool = [sys.executable, '-m', 'benchmarks.run_tool']
+    if scenario == 'ping':
+        return tool + ['main_ping', '--url', server.video_urls()[0], '--duration', str(args.ping_duration),
+                       '--connections', str(args.connections), '--no-cache']
+    if scenario == 'download':
+        input_file = os.path.join(work_dir, 'videos.txt')
+        with open(input_file, 'w', encoding='utf-8') as f:
+            f.write("\n".join(server.video_urls()) + "\n")
+        return tool + ['main_download', '--input', input_file, '--output-dir', os.path.join(work_dir, 'output'),
+                       '--output-result', os.path.join(work_dir, 'done.txt'), '--jobs', str(args.jobs),
+                       '--connections', str(args.connections), '--restart', '--no-cache']
+    if scenario == 'analyze':
+        input_file = os.path.join(work_dir, 'urls.txt')
+        with open(input_file, 'w', encoding='utf-8') as f:
+            f.write("\n".join(server.playlist_urls() + server.video_urls()) + "\n")
+        return tool + ['main_analyze', '--input', input_file, '--output-result', os.path.join(work_dir, 'video.txt')]
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+def count_successes(scenario, work_dir):
+    if scenario == 'download':
+        with open(os.path.join(work_dir, 'done.txt'), 'r', encoding='utf-8') as f:
+            return sum(1 for line in f if ',SUCCESS,' in line)
+    if scenario == 'analyze':
+        with open(os.path.join(work_dir, 'video.txt'), 'r', encoding='utf-8') as f:
+            return sum(1 for line in f if line.strip())
+    return None
+
+def run_once(scenario, server, args):
+    # One run of a tool in a child process; wait4 gives its own CPU time and peak RSS
+    work_dir = tempfile.mkdtemp(prefix=f"benchmark-{scenario}-")
+    try:
+        command = get_scenario_command(scenario, server, work_dir, args)
+        env = dict(os.environ, FAKE_YOUTUBE_SERVER=server.base_url,
+                   BENCHMARK_CACHE_DIR=os.path.join(work_dir, 'cache'))
+        server.reset_stats()
+        log_path = os.path.join(work_dir, 'output.log')
+        start_time = time.perf_counter()
+        with open(log_path, 'w', encoding='utf-8') as log:
+            process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, env=env)
+            _, status, usage = os.wait4(process.pid, 0)
+        wall_seconds = time.perf_counter() - start_time
+        process.returncode = os.waitstatus_to_exitcode(status)
+        stats, request_seconds = server.get_stats()
+        if process.returncode != 0:
+            with open(log_path, 'r', encoding='utf-8') as log:
+                print(log.read()[-2000:])
+            raise RuntimeError(f"{scenario} exited with code {process.returncode}")
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak_rss = usage.ru_maxrss / 1024 if sys.platform != 'darwin' else usage.ru_maxrss / 1024 / 1024
+        return {
+            'wall_seconds': wall_seconds,
+            'cpu_seconds': usage.ru_utime + usage.ru_stime,
+            'peak_rss_mb': peak_rss,
+            'bytes': stats['bytes_sent'],
+            'successes': count_successes(scenario, work_dir),
+            'server': stats,
+            'request_seconds': request_seconds,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def summarize(runs):
+    request_seconds = sorted(seconds for run in runs for seconds in run['request_seconds'])
+    wall_seconds = statistics.median(run['wall_seconds'] for run in runs)
+    total_bytes = statistics.median(run['bytes'] for run in runs)
+    return {
+        'runs': len(runs),
+        'wall_seconds': wall_seconds,
+        'throughput_mb_s': total_bytes / wall_seconds / 1024 / 1024,
+        'cpu_seconds': statistics.median(run['cpu_seconds'] for run in runs),
+        'peak_rss_mb': max(run['peak_rss_mb'] for run in runs),
+        'bytes': total_bytes,
+        'successes': runs[-1]['successes'],
+        # Videos downloaded or URLs found per second; None for ping
+        'items_per_second': None if runs[-1]['successes'] is None else runs[-1]['successes'] / wall_seconds,
+        'request_latency': {
+            'p50': percentile(request_seconds, 0.50),
+            'p95': percentile(request_seconds, 0.95),
+            'p99': percentile(request_seconds, 0.99),
+            'count': len(request_seconds),
+        },
+        'server': {key: sum(run['server'][key] for run in runs) for key in runs[0]['server']},
+        'wall_seconds_all': [run['wall_seconds'] for run in runs],
+    }
+
+def compare(results, baseline, tolerance):
+    # Returns (scenario, metric, baseline, current, change, regressed) for every compared metric
+    rows = []
+    for scenario, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(scenario)
+        if not previous:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            regressed = change < -tolerance if higher_is_better else change > tolerance
+            rows.append((scenario, metric, old, new, change, regressed))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ping, download and analyze against a local fake YouTube server")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated scenarios (default: {','.join(SCENARIOS)})")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help=f"Runs per scenario (default: {DEFAULT_REPEAT})")
+    parser.add_argument("--videos", type=int, default=4, help="Videos downloaded by the download scenario (default: 4)")
+    parser.add_argument("--jobs", type=int, default=2, help="--jobs passed to main_download (default: 2)")
+    parser.add_argument("--connections", type=int, default=4, help="--connections passed to main_ping and main_download (default: 4)")
+    parser.add_argument("--ping-duration", type=int, default=DEFAULT_PING_DURATION, help="Seconds per ping run (default: 5)")
+    parser.add_argument("--rate", type=float, default=0, help="Server bandwidth per connection in MB/s, 0 for unlimited")
+    parser.add_argument("--latency", type=float, default=0, help="Server delay before every response in seconds")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer every Nth metadata request with HTTP 429")
+    parser.add_argument("--disconnect-rate", type=float, default=0, help="Share of media responses cut off part way")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against results previously written with --output")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative change that counts as a regression (default: 0.10)")
+    args = parser.parse_args()
+
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(',') if scenario.strip()]
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"Unknown scenario: {scenario}")
+
+    video_path, audio_path = make_media()
+    server = FakeYouTubeServer(video_path, audio_path, videos=args.videos, rate=args.rate * 1024 * 1024,
+                               latency=args.latency, throttle_every=args.throttle_every,
+                               disconnect_rate=args.disconnect_rate).start()
+    results = {
+        'time': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': vars(args),
+        'scenarios': {},
+    }
+    try:
+        for scenario in scenarios:
+            runs = []
+            for run in range(args.repeat):
+                print(f"Running {scenario} ({run + 1}/{args.repeat})...")
+                runs.append(run_once(scenario, server, args))
+            results['scenarios'][scenario] = summarize(runs)
+    finally:
+        server.stop()
+
+    print(f"\n{'Scenario':<10}{'Wall s':>9}{'MB/s':>9}{'Items/s':>9}{'CPU s':>8}{'RSS MB':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'OK':>5}")
+    for scenario, summary in results['scenarios'].items():
+        latency = summary['request_latency']
+        successes = '-' if summary['successes'] is None else summary['successes']
+        items = '-' if summary['items_per_second'] is None else f"{summary['items_per_second']:.2f}"
+        print(f"{scenario:<10}{summary['wall_seconds']:>9.2f}{summary['throughput_mb_s']:>9.2f}{items:>9}"
+              f"{summary['cpu_seconds']:>8.2f}{summary['peak_rss_mb']:>9.1f}{latency['p50'] * 1000:>9.1f}"
+              f"{latency['p95'] * 1000:>9.1f}{latency['p99'] * 1000:>9.1f}{successes:>5}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.tolerance)
+        ignored = {'output', 'baseline', 'tolerance', 'repeat', 'scenarios'}
+        changed = sorted(key for key, value in vars(args).items()
+                         if key not in ignored and baseline.get('config', {}).get(key) != value)
+        if changed:
+            print(f"\nWarning: the baseline was recorded with different settings: {', '.join(changed)}")
+        print(f"\nCompared with {args.baseline} (tolerance {args.tolerance:.0%}):")
+        for scenario, metric, old, new, change, regressed in rows:
+            print(f"  {scenario:<10}{metric:<17}{old:>10.2f} -> {new:>10.2f} ({change:+.1%}){'  REGRESSION' if regressed else ''}")
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import json
+import os
+import runpy
+import sys
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse, parse_qs
+
+import yt_dlp
+
+from metadata_cache import metadata_cache
+
+TOOLS = ['main_ping', 'main_download', 'main_analyze']
+
+class FakeYoutubeDL:
+    # Drop-in for yt_dlp.YoutubeDL that asks the fake server instead of YouTube,
+    # so extraction keeps its request latency and 429s but needs no network
+
+    def __init__(self, params=None):
+        self.params = params or {}
+        self.server = os.environ['FAKE_YOUTUBE_SERVER']
+
+    def extract_info(self, url, download=False):
+        query = parse_qs(urlparse(url).query)
+        if 'list' in query:
+            path = f"/playlist/{query['list'][0]}"
+        elif 'v' in query:
+            path = f"/info/{query['v'][0]}"
+        else:
+            raise yt_dlp.utils.DownloadError(f"ERROR: Unsupported URL: {url}")
+        proxy = self.params.get('proxy')
+        opener = urllib.request.build_opener(urllib.request.ProxyHandler({'http': proxy} if proxy else {}))
+        try:
+            with opener.open(self.server + path, timeout=self.params.get('socket_timeout', 30)) as r:
+                return json.load(r)
+        except urllib.error.HTTPError as e:
+            # Like yt-dlp, keep the HTTP error so callers can read its status and Retry-After
+            raise yt_dlp.utils.DownloadError(f"ERROR: Unable to download webpage: HTTP Error {e.code}: {e.reason}",
+                                             exc_info=sys.exc_info())
+        except urllib.error.URLError as e:
+            raise yt_dlp.utils.DownloadError(f"ERROR: Unable to download webpage: {e.reason}")
+
+    def close(self):
+        pass
+
+def main():
+    # python -m benchmarks.run_tool <tool> [tool arguments...]
+    if len(sys.argv) < 2 or sys.argv[1] not in TOOLS:
+        print(f"Usage: python -m benchmarks.run_tool <{'|'.join(TOOLS)}> [arguments...]")
+        sys.exit(2)
+    yt_dlp.YoutubeDL = FakeYoutubeDL
+    if os.environ.get('BENCHMARK_CACHE_DIR'):
+        metadata_cache.cache_dir = os.environ['BENCHMARK_CACHE_DIR']
+    tool = sys.argv[1]
+    sys.argv = [f"{tool}.py"] + sys.argv[2:]
+    runpy.run_module(tool, run_name='__main__', alter_sys=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+import time
+
+def get_journal_path(result_path):
+    # done.txt -> done.journal.jsonl, kept next to the human-readable result file
+    return f"{os.path.splitext(result_path)[0]}.journal.jsonl"
+
+class CheckpointJournal:
+    # Append-only JSON lines journal of finished videos. Each record is written with a single
+    # O_APPEND write followed by fsync, so a crash can at worst leave one torn last line,
+    # which load() ignores.
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        self.lock = threading.Lock()
+        self.fd = None
+
+    def load(self):
+        self.records = {}
+        if not os.path.exists(self.path):
+            return self.records
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('video_id'):
+                    self.records[record['video_id']] = record
+        return self.records
+
+    def open(self, restart=False):
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        if restart:
+            flags |= os.O_TRUNC
+            self.records = {}
+        else:
+            self.load()
+        self.fd = os.open(self.path, flags, 0o644)
+        if not restart and os.path.getsize(self.path) > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # Terminate a torn record so the next one starts on its own line
+                    os.write(self.fd, b"\n")
+        return self
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def is_complete(self, video_id):
+        # A video counts as done only if its output is still on disk with the recorded size
+        record = self.records.get(video_id)
+        if not record or record.get('status') != "SUCCESS":
+            return False
+        output_path = record.get('output_path')
+        if not output_path or not os.path.exists(output_path):
+            return False
+        return os.path.getsize(output_path) == record.get('size')
+
+    def record(self, video_id, video_url, status, output_path):
+        size = os.path.getsize(output_path) if output_path and os.path.exists(output_path) else None
+        record = {
+            'video_id': video_id,
+            'video_url': video_url,
+            'status': status,
+            'output_path': output_path,
+            'size': size,
+            'time': time.time(),
+        }
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+        with self.lock:
+            self.records[video_id] = record
+            os.write(self.fd, line)
+            os.fsync(self.fd)
@@ -0,0 +1,132 @@
+import atexit
+import threading
+from contextlib import contextmanager
+
+import requests
+import yt_dlp
+
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 32
+DEFAULT_MAX_HOSTS = 16
+
+class YoutubeDLPool:
+    # Long-lived YoutubeDL instances keyed by their options (which include the proxy).
+    # A YoutubeDL is not safe to share between threads, so each caller checks one out
+    # and returns it when done; idle instances are reused instead of re-initialized.
+
+    def __init__(self):
+        self.idle = {}
+        self.all_instances = []
+        self.lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def make_key(opts):
+        return tuple(sorted((key, repr(value)) for key, value in opts.items()))
+
+    @contextmanager
+    def acquire(self, opts):
+        key = self.make_key(opts)
+        with self.lock:
+            instances = self.idle.setdefault(key, [])
+            if instances:
+                ydl = instances.pop()
+                self.reused += 1
+            else:
+                ydl = None
+                self.created += 1
+        if ydl is None:
+            ydl = yt_dlp.YoutubeDL(dict(opts))
+            with self.lock:
+                self.all_instances.append(ydl)
+        try:
+            yield ydl
+        finally:
+            with self.lock:
+                self.idle[key].append(ydl)
+
+    def close(self):
+        with self.lock:
+            instances, self.all_instances, self.idle = self.all_instances, [], {}
+        for ydl in instances:
+            ydl.close()
+
+class SessionPool:
+    # One keep-alive requests.Session per proxy, with a hard cap on connections per host
+
+    def __init__(self, max_connections_per_host=DEFAULT_MAX_CONNECTIONS_PER_HOST, max_hosts=DEFAULT_MAX_HOSTS):
+        self.max_connections_per_host = max_connections_per_host
+        self.max_hosts = max_hosts
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, proxy=None):
+        with self.lock:
+            session = self.sessions.get(proxy)
+            if session is None:
+                session = requests.Session()
+                # pool_block makes extra requests wait for a free connection instead of opening more
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.max_hosts,
+                                                        pool_maxsize=self.max_connections_per_host,
+                                                        pool_block=True)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                if proxy:
+                    session.proxies = {'http': proxy, 'https': proxy}
+                self.sessions[proxy] = session
+            return session
+
+    def stats(self):
+        requests_sent = 0
+        connections_opened = 0
+        with self.lock:
+            sessions = list(self.sessions.values())
+        for session in sessions:
+            for adapter in {id(adapter): adapter for adapter in session.adapters.values()}.values():
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is not None:
+                        requests_sent += pool.num_requests
+                        connections_opened += pool.num_connections
+        return {'requests': requests_sent, 'connections': connections_opened}
+
+    def close(self):
+        with self.lock:
+            sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            session.close()
+
+ydl_pool = YoutubeDLPool()
+session_pool = SessionPool()
+
+def configure(max_connections_per_host=None):
+    # Only affects sessions created afterwards, so call it before the first request
+    if max_connections_per_host:
+        session_pool.max_connections_per_host = max(session_pool.max_connections_per_host, max_connections_per_host)
+
+def get_session(proxy=None):
+    return session_pool.get(proxy)
+
+def get_stats():
+    http_stats = session_pool.stats()
+    return {
+        'ydl_created': ydl_pool.created,
+        'ydl_reused': ydl_pool.reused,
+        'http_requests': http_stats['requests'],
+        'http_connections': http_stats['connections'],
+    }
+
+def report():
+    stats = get_stats()
+    if stats['ydl_created'] + stats['ydl_reused']:
+        print(f"YoutubeDL instances: {stats['ydl_created']} created, {stats['ydl_reused']} reused")
+    if stats['http_requests']:
+        print(f"HTTP: {stats['http_requests']} requests over {stats['http_connections']} connections "
+              f"({stats['http_requests'] - stats['http_connections']} reused a kept-alive connection)")
+
+def close_all():
+    ydl_pool.close()
+    session_pool.close()
+
+atexit.register(close_all)
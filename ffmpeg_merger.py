@@ -0,0 +1,48 @@
+import os
+import re
+import shutil
+import subprocess
+
+def get_ffmpeg_exe():
+    # moviepy ships an ffmpeg binary through imageio-ffmpeg; prefer it so no extra install is needed
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return shutil.which('ffmpeg')
+
+def probe_media(filename):
+    # Duration in seconds (None if unknown) and the stream types that actually hold data. The header
+    # alone can list a stream without frames, so every packet is read (stream copy to the null muxer).
+    ffmpeg = get_ffmpeg_exe()
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg executable not found")
+    command = [ffmpeg, '-hide_banner', '-nostdin', '-i', filename, '-map', '0', '-c', 'copy', '-f', 'null', '-']
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors='replace')
+    match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', result.stderr)
+    duration = int(match.group(1)) * 3600 + int(match.group(2)) * 60 + float(match.group(3)) if match else None
+    # Summary line, e.g. "video:298KiB audio:30KiB subtitle:0KiB ..."
+    sizes = re.findall(r'\b(video|audio):(\d+)[kK]i?B', result.stderr)
+    kinds = {kind for kind, size in sizes if int(size) > 0}
+    return duration, kinds
+
+def merge_video_audio_ffmpeg(video_url, audio_url, output_filename, proxy=None):
+    ffmpeg = get_ffmpeg_exe()
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg executable not found")
+
+    print("Downloading and remuxing with ffmpeg (stream copy)...")
+    command = [ffmpeg, '-y', '-loglevel', 'error', '-i', video_url]
+    if audio_url:
+        command += ['-i', audio_url, '-map', '0:v:0', '-map', '1:a:0']
+    else:
+        command += ['-map', '0']
+    # Copy the already-compressed streams into the new container without decoding them
+    command += ['-c', 'copy', output_filename]
+
+    # ffmpeg reads remote inputs through the proxy in http_proxy (HTTP proxies only)
+    env = dict(os.environ, http_proxy=proxy) if proxy else None
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed with exit code {result.returncode}: {result.stderr.strip()}")
+    print(f"Video saved as {output_filename}")
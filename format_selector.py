@@ -0,0 +1,108 @@
+import math
+
+from video_format_utils import (VIDEO_CODEC_FAMILIES, AUDIO_CODEC_FAMILIES, get_codec_family,
+                                is_stream_copy_compatible)
+
+CODEC_FAMILIES = VIDEO_CODEC_FAMILIES + AUDIO_CODEC_FAMILIES
+UNKNOWN_FAMILY = len(CODEC_FAMILIES)  # Code of codecs outside CODEC_FAMILIES, and of 'none'
+family_codes = {}  # Codec string -> family code; YouTube uses few distinct codec strings
+
+class SelectionPolicy:
+    # Ranking rules applied to every video of a batch. With the defaults the best video is the
+    # highest resolution, then the highest bitrate, and the best audio the highest audio bitrate.
+
+    def __init__(self, codec_priority=None, max_height=None, max_video_tbr=None, max_total_size=None,
+                 container=None, codec_max_height=None, codec_max_tbr=None):
+        self.codec_priority = list(codec_priority or [])  # Breaks ties between formats of the same height
+        self.max_height = max_height  # Hard limit: videos with nothing at or below it get no format
+        self.max_video_tbr = max_video_tbr  # kbit/s; faster formats are used only if nothing else fits
+        self.max_total_size = max_total_size  # Bytes for video plus audio; same fallback as max_video_tbr
+        self.container = container  # Prefer formats that can be stream-copied into this container
+        # A preferred codec loses its preference above these limits, e.g. {'av01': 1080}
+        self.codec_max_height = dict(codec_max_height or {})
+        self.codec_max_tbr = dict(codec_max_tbr or {})
+
+def get_family_code(codec, cache):
+    family = get_codec_family(codec) if codec != 'none' else None
+    code = CODEC_FAMILIES.index(family) if family else UNKNOWN_FAMILY
+    cache[codec] = code
+    return code
+
+def get_format_row(f, duration, family_cache=family_codes):
+    # (height, tbr, abr, size, has_video, has_audio, video_family, audio_family) of one format
+    height = f.get('height')
+    tbr = f.get('tbr') or 0
+    size = f.get('filesize') or f.get('filesize_approx') or tbr * 125 * duration or math.nan  # kbit/s to bytes
+    vcodec = f.get('vcodec')
+    acodec = f.get('acodec')
+    video_family = family_cache.get(vcodec)
+    if video_family is None:
+        video_family = get_family_code(vcodec, family_cache)
+    audio_family = family_cache.get(acodec)
+    if audio_family is None:
+        audio_family = get_family_code(acodec, family_cache)
+    return (math.nan if height is None else height, tbr, f.get('abr') or 0, size,
+            vcodec != 'none', acodec != 'none', video_family, audio_family)
+
+def get_codec_preferences(policy):
+    # preference[code] of every codec family: higher for earlier families in policy.codec_priority
+    preference = [0] * (UNKNOWN_FAMILY + 1)
+    for rank, family in enumerate(policy.codec_priority):
+        if family in CODEC_FAMILIES:
+            preference[CODEC_FAMILIES.index(family)] = len(policy.codec_priority) - rank
+    return preference
+
+def get_codec_limits(limits):
+    return {CODEC_FAMILIES.index(family): limit for family, limit in limits.items() if family in CODEC_FAMILIES}
+
+def get_compatibility_table(container, kind):
+    # compatible[code] tells whether a codec family can be stream-copied into the container
+    compatible = [False] * (UNKNOWN_FAMILY + 1)
+    for code, family in enumerate(CODEC_FAMILIES):
+        if kind == 'video':
+            compatible[code] = family in VIDEO_CODEC_FAMILIES and is_stream_copy_compatible(container, family)
+        else:
+            compatible[code] = family in AUDIO_CODEC_FAMILIES and is_stream_copy_compatible(container, None, family)
+    return compatible
+
+def select_format(info, policy=None):
+    # Best (video, audio) format dicts of one video, as plain max() scans over its format rows.
+    # format_table.select_formats() ranks whole batches by the same keys.
+    policy = policy or SelectionPolicy()
+    formats = info.get('formats') or []
+    duration = info.get('duration') or 0
+    rows = [get_format_row(f, duration) for f in formats]
+    if policy.container:
+        video_compatible = get_compatibility_table(policy.container, 'video')
+        audio_compatible = get_compatibility_table(policy.container, 'audio')
+    else:
+        video_compatible = audio_compatible = [True] * (UNKNOWN_FAMILY + 1)
+
+    # Ties go to the earliest format, hence the negated index
+    audio_rows = [i for i, row in enumerate(rows) if row[5]]
+    best_audio = max(audio_rows, key=lambda i: (audio_compatible[rows[i][7]], rows[i][2], rows[i][1], -i), default=None)
+    audio_size = 0.0 if best_audio is None or math.isnan(rows[best_audio][3]) else rows[best_audio][3]
+
+    preference = get_codec_preferences(policy)
+    codec_max_height = get_codec_limits(policy.codec_max_height)
+    codec_max_tbr = get_codec_limits(policy.codec_max_tbr)
+
+    def get_video_key(i):
+        height, tbr, abr, size, has_video, has_audio, video_family, audio_family = rows[i]
+        fits = not policy.max_video_tbr or tbr <= policy.max_video_tbr
+        if policy.max_total_size:
+            total_size = size if has_audio else size + audio_size
+            fits = fits and (math.isnan(total_size) or total_size <= policy.max_total_size)
+            overshoot = 0 if fits else -math.inf if math.isnan(total_size) else -total_size
+        else:
+            overshoot = 0 if fits else -tbr
+        codec_preference = preference[video_family]
+        if height > codec_max_height.get(video_family, math.inf) or tbr > codec_max_tbr.get(video_family, math.inf):
+            codec_preference = 0
+        return fits, overshoot, video_compatible[video_family], height, codec_preference, tbr, -i
+
+    video_rows = [i for i, row in enumerate(rows)
+                  if row[4] and not math.isnan(row[0]) and (not policy.max_height or row[0] <= policy.max_height)]
+    best_video = max(video_rows, key=get_video_key, default=None)
+    return (formats[best_video] if best_video is not None else None,
+            formats[best_audio] if best_audio is not None else None)
@@ -0,0 +1,102 @@
+import numpy as np
+
+from format_selector import (SelectionPolicy, get_codec_limits, get_codec_preferences, get_compatibility_table,
+                             get_format_row)
+
+class FormatTable:
+    # The format lists of many videos flattened into parallel numpy columns, one row per format
+
+    def __init__(self, infos):
+        self.video_count = len(infos)
+        self.formats = []
+        rows = []
+
+        # One tuple per format, converted to columns in a single numpy call
+        for index, info in enumerate(infos):
+            duration = info.get('duration') or 0
+            formats = info.get('formats') or []
+            self.formats.extend(formats)
+            for f in formats:
+                rows.append((index,) + get_format_row(f, duration))
+
+        columns = np.array(rows, dtype=np.float64).reshape(-1, 9).T
+        self.video_index = columns[0].astype(np.int64)
+        self.height = columns[1]
+        self.tbr = columns[2]
+        self.abr = columns[3]
+        self.size = columns[4]
+        self.has_video = columns[5].astype(bool)
+        self.has_audio = columns[6].astype(bool)
+        self.video_family = columns[7].astype(np.int64)
+        self.audio_family = columns[8].astype(np.int64)
+
+    @classmethod
+    def from_infos(cls, infos):
+        return cls(infos)
+
+    def __len__(self):
+        return len(self.formats)
+
+def pick_best(table, mask, keys):
+    # Row of the highest ranked format of every video, or -1 where no row is in mask.
+    # keys go from least to most significant; the row number comes first so that ties
+    # go to the earliest format, as with max().
+    best = np.full(table.video_count, -1, dtype=np.int64)
+    rows = np.flatnonzero(mask)
+    if rows.size:
+        sort_keys = [-rows] + [key[rows] for key in keys] + [table.video_index[rows]]
+        ordered = rows[np.lexsort(sort_keys)]
+        groups = table.video_index[ordered]
+        last = np.append(groups[1:] != groups[:-1], True)
+        best[groups[last]] = ordered[last]
+    return best
+
+def select_formats(infos, policy=None):
+    # Returns a (best_video, best_audio) pair of format dicts, or None, for every info.
+    # Building the table costs more than one max() scan, so single videos go through
+    # format_selector.select_format.
+    policy = policy or SelectionPolicy()
+    table = infos if isinstance(infos, FormatTable) else FormatTable.from_infos(infos)
+    if not len(table):
+        return [(None, None)] * table.video_count
+
+    if policy.container:
+        video_compatible = np.array(get_compatibility_table(policy.container, 'video'))[table.video_family]
+        audio_compatible = np.array(get_compatibility_table(policy.container, 'audio'))[table.audio_family]
+    else:
+        video_compatible = audio_compatible = np.ones(len(table), dtype=bool)
+
+    best_audio = pick_best(table, table.has_audio, [table.tbr, table.abr, audio_compatible])
+    audio_size = np.zeros(table.video_count)
+    with_audio = best_audio >= 0
+    audio_size[with_audio] = np.nan_to_num(table.size[best_audio[with_audio]])
+
+    video_mask = table.has_video & ~np.isnan(table.height)
+    if policy.max_height:
+        video_mask &= table.height <= policy.max_height
+
+    # Formats over a budget rank below every format within it, smallest first. Overshoot is measured
+    # in bytes under a size budget (unknown sizes last), otherwise in kbit/s.
+    fits = np.ones(len(table), dtype=bool)
+    if policy.max_video_tbr:
+        fits &= table.tbr <= policy.max_video_tbr
+    if policy.max_total_size:
+        # Muxed formats already carry their audio
+        total_size = table.size + np.where(table.has_audio, 0, audio_size[table.video_index])
+        fits &= np.isnan(total_size) | (total_size <= policy.max_total_size)
+        overshoot = np.where(fits, 0, -np.nan_to_num(total_size, nan=np.inf))
+    else:
+        overshoot = np.where(fits, 0, -table.tbr)
+
+    codec_preference = np.array(get_codec_preferences(policy), dtype=np.float64)[table.video_family]
+    for code, limit in get_codec_limits(policy.codec_max_height).items():
+        codec_preference[(table.video_family == code) & (table.height > limit)] = 0
+    for code, limit in get_codec_limits(policy.codec_max_tbr).items():
+        codec_preference[(table.video_family == code) & (table.tbr > limit)] = 0
+
+    best_video = pick_best(table, video_mask, [table.tbr, codec_preference, table.height,
+                                               video_compatible, overshoot, fits])
+
+    return [(table.formats[video_row] if video_row >= 0 else None,
+             table.formats[audio_row] if audio_row >= 0 else None)
+            for video_row, audio_row in zip(best_video.tolist(), best_audio.tolist())]
@@ -1,25 +1,58 @@
 import argparse
-from url_analyzer import collect_all_video_urls
+from url_analyzer import iter_all_video_urls, DEFAULT_WORKERS
+import client_pool
+from proxy_pool import ProxyPool
+from video_index import VideoIndex
+import rate_limiter
+import tracing
 
 def main():
     parser = argparse.ArgumentParser(description="Analyze YouTube URLs and collect video links.")
     parser.add_argument("--input", required=True, help="Input file containing URLs to analyze")
     parser.add_argument("--output-result", default="video.txt", help="Output file for video URLs (default: video.txt)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Number of URLs to analyze concurrently (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--index", help="File of video IDs found by earlier runs: those are skipped, new ones are appended")
+    parser.add_argument("--proxy", help="Proxy server to use (e.g., socks5://127.0.0.1:9150 for Tor)")
+    parser.add_argument("--proxies", nargs='+',
+                        help="Spread the work over these proxies ('direct' for no proxy), favoring those with fewer errors and evicting throttled ones")
+    parser.add_argument("--trace", help="Write a JSON lines trace of per-video stage spans to this file and print a summary")
+    parser.add_argument("--profile-stage", help="Comma-separated spans to profile, e.g. analyze,extract")
+    parser.add_argument("--profiler", choices=["cprofile", "sample"], default="cprofile",
+                        help="cProfile (one span at a time, exact calls) or a stack sampler (all threads, includes waits)")
     args = parser.parse_args()
 
+    if args.trace or args.profile_stage:
+        tracing.configure(trace_path=args.trace, profiler=args.profiler,
+                          profile_stages=args.profile_stage.split(',') if args.profile_stage else None)
+
+    pool = ProxyPool(args.proxies + ([args.proxy] if args.proxy else [])) if args.proxies else None
+
     # Read URLs from input file
     with open(args.input, 'r', encoding='utf-8') as f:
         urls = [line.strip() for line in f if line.strip()]
+    if pool and urls:
+        pool.check(urls[0])
 
-    all_video_urls = collect_all_video_urls(urls)
-    print(f"\nTotal number of videos found: {len(all_video_urls)}")
-
-    # Write video URLs to output file
-    with open(args.output_result, 'w', encoding='utf-8') as f:
-        for video_url in all_video_urls:
+    # Write video URLs to output file as soon as each input is expanded
+    total_videos = 0
+    with open(args.output_result, 'w', encoding='utf-8') as f, VideoIndex(args.index).open() as index:
+        for video_url in iter_all_video_urls(urls, workers=args.workers, proxy=args.proxy, proxy_pool=pool, index=index):
             f.write(f"{video_url}\n")
+            f.flush()
+            total_videos += 1
 
+    print(f"\nTotal number of videos found: {total_videos}")
+    if index.duplicates:
+        print(f"Skipped {index.duplicates} videos already found" + (" here or by earlier runs" if args.index else ""))
     print(f"List of video URLs saved to '{args.output_result}'")
+    client_pool.report()
+    rate_limiter.report()
+    if pool:
+        pool.report()
+    tracing.close()
+    tracing.report()
+    if args.trace:
+        print(f"Trace saved to {args.trace}")
 
 if __name__ == "__main__":
     main()
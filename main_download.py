@@ -1,168 +1,432 @@
 import argparse
 import os
 import sys
-from video_format_utils import select_best_format
+import threading
+from video_format_utils import get_remux_container
 from moviepy_merger import merge_video_audio_moviepy
-from url_analyzer import collect_all_video_urls
-import yt_dlp
-import requests
-import time
+from ffmpeg_merger import merge_video_audio_ffmpeg, get_ffmpeg_exe
+from segment_downloader import download_file, DEFAULT_CONNECTIONS
+from async_transfer import download_files_sync
+from streaming_merger import merge_video_audio_streaming, is_streaming_supported, is_streamable
+from metadata_cache import metadata_cache
+from media_store import MediaStore, DEFAULT_STORE_DIRNAME
+import client_pool
+from proxy_pool import ProxyPool
+import rate_limiter
+from url_analyzer import iter_all_video_urls, DEFAULT_WORKERS as DEFAULT_ANALYZE_WORKERS
+from pipeline import run_stage, DEFAULT_BUFFER_SIZE
+from checkpoint_journal import CheckpointJournal, get_journal_path
+from format_selector import SelectionPolicy
+from bandwidth_planner import QualityPlanner
+import tracing
+from video_index import VideoIndex
+from utils import extract_video_id, get_video_info, select_best_video_and_audio
+import itertools
 import re
+import time
 
 # Constants
 DEFAULT_OUTPUT_DIR = "output"
 DEFAULT_OUTPUT_RESULT = "done.txt"
+DEFAULT_JOBS = 1
+DEFAULT_MERGER = "ffmpeg"
 DEBUG = False
+ENGINE = "threads"
 
 def debug_print(*args, **kwargs):
     if DEBUG:
         print(*args, **kwargs)
 
-def extract_video_id(url):
-    patterns = [
-        r'(?:v=|\/)([0-9A-Za-z_-]{11}).*',
-        r'(?:embed\/|v\/|youtu.be\/)([0-9A-Za-z_-]{11})',
-        r'(?:watch\?v=)([0-9A-Za-z_-]{11})'
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
-
-def get_best_video_and_audio_url(video_url, proxy=None, max_retries=3, max_quality=None):
+def get_video_info_for_url(video_url, proxy=None, max_retries=3):
     video_id = extract_video_id(video_url)
     if not video_id:
         raise ValueError(f"Could not extract video ID from URL: {video_url}")
 
     debug_print(f"Extracted video ID: {video_id}")
-    ydl_opts = {
-        'format': 'bestvideo+bestaudio/best',
-        'quiet': True,
-        'socket_timeout': 30,
-    }
-    if proxy:
-        ydl_opts['proxy'] = proxy
-
-    for attempt in range(max_retries):
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
-                formats = info.get('formats', [])
-
-                video_formats = [f for f in formats if f.get('vcodec') != 'none' and f.get('height') is not None]
-                if not video_formats:
-                    raise ValueError("No valid video formats found")
-
-                debug_print("\nAvailable video formats:")
-                for i, format in enumerate(video_formats, 1):
-                    debug_print(f"{i}. Resolution: {format.get('height')}p, "
-                                f"Codec: {format.get('vcodec')}, "
-                                f"FPS: {format.get('fps')}, "
-                                f"Bitrate: {format.get('tbr')}k, "
-                                f"Audio Codec: {format.get('acodec')}")
-                debug_print()  # Add an empty line for better readability
-
-                if max_quality:
-                    video_formats = [f for f in video_formats if f['height'] <= max_quality]
-                    if not video_formats:
-                        raise ValueError(f"No video formats found with quality {max_quality}p or lower")
-
-                best_video = max(video_formats, key=lambda x: (x['height'], x.get('tbr', 0)))
-                video_has_audio = best_video.get('acodec') != 'none'
-
-                audio_formats = [f for f in formats if f.get('acodec') != 'none']
-                has_separate_audio = bool(audio_formats)
-
-                if has_separate_audio:
-                    best_audio = max(audio_formats, key=lambda x: (x.get('abr', 0) or 0, x.get('tbr', 0) or 0))
-                    audio_url = best_audio['url']
-                    audio_ext = best_audio['ext']
-                else:
-                    audio_url = None
-                    audio_ext = None
-
-                video_url = best_video['url']
-                resolution = f"{best_video['height']}p"
-                video_ext = best_video['ext']
-
-                return video_url, audio_url, info.get('title', 'Unknown'), resolution, video_ext, audio_ext, video_has_audio, has_separate_audio
-
-        except (yt_dlp.utils.DownloadError, requests.exceptions.RequestException, ValueError) as e:
-            debug_print(f"Error occurred: {str(e)}")
-            if attempt < max_retries - 1:
-                print(f"Error occurred: {str(e)}. Retrying... (Attempt {attempt + 1}/{max_retries})")
-                time.sleep(2 ** attempt)  # Exponential backoff
-            else:
-                raise
-
-    raise Exception("Failed to get video information after multiple attempts")
+    info = get_video_info(video_id, proxy=proxy, max_retries=max_retries)
+
+    if DEBUG:
+        debug_print("\nAvailable video formats:")
+        video_formats = [f for f in info.get('formats', []) if f.get('vcodec') != 'none' and f.get('height') is not None]
+        for i, format in enumerate(video_formats, 1):
+            debug_print(f"{i}. Resolution: {format.get('height')}p, "
+                        f"Codec: {format.get('vcodec')}, "
+                        f"FPS: {format.get('fps')}, "
+                        f"Bitrate: {format.get('tbr')}k, "
+                        f"Audio Codec: {format.get('acodec')}")
+        debug_print()  # Add an empty line for better readability
+    return info
+
+def select_media(info, policy=None):
+    best_video, best_audio = select_best_video_and_audio(info, policy)
+    video_has_audio = best_video.get('acodec') != 'none'
+    has_separate_audio = best_audio is not None
+
+    if has_separate_audio:
+        audio_url = best_audio['url']
+        audio_ext = best_audio['ext']
+        audio_codec = best_audio.get('acodec')
+    else:
+        audio_url = None
+        audio_ext = None
+        audio_codec = None
+
+    video_url = best_video['url']
+    resolution = f"{best_video['height']}p"
+    video_ext = best_video['ext']
+    video_codec = best_video.get('vcodec')
+
+    return video_url, audio_url, info.get('title', 'Unknown'), resolution, video_ext, audio_ext, video_has_audio, has_separate_audio, video_codec, audio_codec
 
 def clean_filename(filename):
     return re.sub(r'[\\/*?:"<>|]', "", filename)
 
-def process_video(video_url, output_dir, max_quality=None):
-    try:
-        video_url, audio_url, title, resolution, video_ext, audio_ext, video_has_audio, has_separate_audio = get_best_video_and_audio_url(video_url, max_quality=max_quality)
-        print(f"\nProcessing video: {title}")
-        print(f"Resolution: {resolution}, Format: {video_ext}, Audio: {video_has_audio}")
-        debug_print(f"Video URL: {video_url[:100]}...")  # Print first 100 chars of URL
-
-        print("Downloading...")
-
-        clean_title = clean_filename(title)
-        output_filename = os.path.join(output_dir, f"{clean_title}.{video_ext}")
-        merge_video_audio_moviepy(video_url, audio_url, output_filename)
-
-        print("==================")
+def get_output_path(output_dir, title, video_id, ext):
+    # The ID keeps videos that share a title from overwriting each other
+    name = f"{clean_filename(title)} [{video_id}]" if video_id else clean_filename(title)
+    return os.path.join(output_dir, f"{name}.{ext}")
+
+def get_format_key(info, resolved):
+    # format_ids of the selected streams, e.g. 137+140, which is what the media store is keyed by
+    format_ids = {f.get('url'): f.get('format_id') for f in info.get('formats', [])}
+    keys = [format_ids.get(url) for url in resolved[:2] if url]
+    if all(keys):
+        return "+".join(keys)
+    video_url, audio_url, title, resolution, video_ext, audio_ext, video_has_audio, has_separate_audio, video_codec, audio_codec = resolved
+    return f"{resolution}-{video_codec}-{audio_codec}"
+
+def fetch_media(video_url, audio_url, output_dir, video_id, connections, proxy=None):
+    # Pull both streams to local files over parallel ranged connections so the merger reads from disk
+    video_file = os.path.join(output_dir, f".{video_id}.video")
+    audio_file = os.path.join(output_dir, f".{video_id}.audio") if audio_url else None
+    if ENGINE == "asyncio":
+        # Video and audio ranges all run on one event loop
+        downloads = [(video_url, video_file)] + ([(audio_url, audio_file)] if audio_url else [])
+        download_files_sync(downloads, connections=connections, proxy=proxy)
+        return video_file, audio_file
+    download_file(video_url, video_file, connections=connections, proxy=proxy)
+    if audio_url:
+        download_file(audio_url, audio_file, connections=connections, proxy=proxy)
+    return video_file, audio_file
+
+def download_media(resolved, output_dir, video_id=None, connections=DEFAULT_CONNECTIONS, stream_merge=False, proxy=None):
+    video_url, audio_url, title, resolution, video_ext, audio_ext, video_has_audio, has_separate_audio, video_codec, audio_codec = resolved
+    print(f"\nProcessing video: {title}")
+    print(f"Resolution: {resolution}, Format: {video_ext}, Audio: {video_has_audio}")
+    debug_print(f"Video URL: {video_url[:100]}...")  # Print first 100 chars of URL
+    debug_print(f"Video codec: {video_codec}, Audio codec: {audio_codec}")
+
+    print("Downloading...")
+
+    if stream_merge:
+        # The streaming merger downloads while it muxes, so nothing is fetched up front.
+        # Inputs ffmpeg cannot demux from a pipe are downloaded first instead.
+        if all(is_streamable(url, proxy=proxy) for url in [video_url, audio_url] if url):
+            return None
+        print("Media is not fragmented, downloading before merging instead of streaming")
+        connections = max(1, connections)
+    if connections > 0:
+        return fetch_media(video_url, audio_url, output_dir, video_id or clean_filename(title), connections, proxy=proxy)
+    # Without local copies the merger reads the remote URLs itself
+    return None
 
-        if os.path.exists(output_filename):
-            print(f"File saved to: {output_filename}")
-            return "SUCCESS", output_filename
+def merge_media(resolved, media_files, output_dir, merger=DEFAULT_MERGER, connections=DEFAULT_CONNECTIONS,
+                stream_merge=False, proxy=None, video_id=None, store=None, format_key=None):
+    # With a media store the merge goes into the store and the output name becomes a link to it
+    video_url, audio_url, title, resolution, video_ext, audio_ext, video_has_audio, has_separate_audio, video_codec, audio_codec = resolved
+    if media_files:
+        video_url, audio_url = media_files
+
+    remux_container = None
+    if merger == "ffmpeg" and get_ffmpeg_exe():
+        remux_container = get_remux_container(video_codec, audio_codec, resolution, preferred=video_ext)
+        if not remux_container:
+            print(f"Codecs {video_codec}/{audio_codec} cannot be stream-copied, falling back to moviepy")
+
+    ext = remux_container or video_ext
+    output_filename = get_output_path(output_dir, title, video_id, ext)
+    use_store = store is not None and video_id and format_key
+    merge_filename = store.get_temp_path(video_id, format_key, ext) if use_store else output_filename
+    try:
+        if remux_container and stream_merge and not media_files:
+            merge_video_audio_streaming(video_url, audio_url, merge_filename, connections=max(1, connections), proxy=proxy)
+        elif remux_container:
+            merge_video_audio_ffmpeg(video_url, audio_url, merge_filename, proxy=None if media_files else proxy)
         else:
-            print("Failed to save the file.")
-            return "FAILED", None
-
-    except Exception as e:
-        print(f"Error processing video: {str(e)}")
+            merge_video_audio_moviepy(video_url, audio_url, merge_filename)
+        if use_store and os.path.exists(merge_filename):
+            store.link(store.commit(merge_filename, video_id, format_key, ext), output_filename)
+    finally:
+        for media_file in list(media_files or []) + ([merge_filename] if use_store else []):
+            if media_file and os.path.exists(media_file):
+                os.remove(media_file)
+
+    print("==================")
+
+    if os.path.exists(output_filename):
+        print(f"File saved to: {output_filename}")
+        return "SUCCESS", output_filename
+    else:
+        print("Failed to save the file.")
         return "FAILED", None
 
+# Writes results in input order, whatever order the workers finish in
+class OrderedResultWriter:
+
+    def __init__(self, result_file, journal=None):
+        self.result_file = result_file
+        self.journal = journal
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.next_index = 1
+
+    def submit(self, index, video_url, status, output_path):
+        if self.journal is not None:
+            self.journal.record(extract_video_id(video_url) or video_url, video_url, status, output_path)
+        with self.lock:
+            self.pending[index] = f"{video_url},{status},{output_path if output_path else 'N/A'}\n"
+            while self.next_index in self.pending:
+                self.result_file.write(self.pending.pop(self.next_index))
+                self.next_index += 1
+            self.result_file.flush()  # Ensure the result is written immediately
+
+def process_all_videos(video_urls, output_dir, writer, max_quality=None, jobs=DEFAULT_JOBS, merge_jobs=None,
+                       merger=DEFAULT_MERGER, connections=DEFAULT_CONNECTIONS, buffer_size=DEFAULT_BUFFER_SIZE,
+                       stream_merge=False, policy=None, planner=None, proxy=None, proxy_pool=None, store=None):
+    # Streams videos through resolve -> download -> merge stages. video_urls may be a lazy
+    # iterator; each stage only runs ahead of the next by its bounded buffer.
+    # With a proxy pool every video keeps one proxy from extraction to merge, since the
+    # signed media URLs only work from the IP that requested them.
+    # With a media store, a video already stored in the selected format is linked, not downloaded.
+    policy = policy or SelectionPolicy(max_height=max_quality)
+
+    def stage(name, step):
+        def run(job):
+            if job['status'] is None:
+                try:
+                    with tracing.context(video=job['video_id'] or job['video_url']), \
+                            tracing.span(name):
+                        step(job)
+                except Exception as e:
+                    print(f"Error processing video: {str(e)}")
+                    job['status'] = "FAILED"
+                    # Count network failures against the proxy, not unusable formats (ValueError);
+                    # resolve failures are already counted by proxy_pool.call()
+                    if proxy_pool and name == 'download' and not isinstance(e, ValueError):
+                        proxy_pool.record_failure(job['proxy'], e)
+            return job
+        return run
+
+    def resolve(job):
+        print(f"Processing video {job['index']}: {job['video_url']}")
+        if not proxy_pool:
+            job['info'] = get_video_info_for_url(job['video_url'], proxy=job['proxy'])
+        else:
+            # A video whose proxy is throttled or unreachable moves to another one, at most once per proxy
+            job['info'], job['proxy'] = proxy_pool.call(lambda proxy: get_video_info_for_url(job['video_url'], proxy=proxy))
+            job['pooled'] = True
+        with tracing.span('select'):
+            job['resolved'] = select_media(job['info'], policy)
+
+    def download(job):
+        if planner:
+            # Re-select right before transferring, against the throughput measured so far
+            if planner.estimator.rate is None:
+                with tracing.span('probe'):
+                    planner.probe(job['resolved'][0], proxy=job['proxy'])
+            with tracing.span('select', budget=planner.byte_budget()):
+                resolved = select_media(job['info'], planner.policy(policy))
+            if resolved[0] != job['resolved'][0]:
+                print(f"Bandwidth {planner.estimator.rate / 1024 / 1024:.2f} MB/s, budget "
+                      f"{planner.byte_budget() / 1024 / 1024:.1f} MB: switching to {resolved[3]}")
+            job['resolved'] = resolved
+        if store is not None:
+            job['format_key'] = get_format_key(job['info'], job['resolved'])
+            stored_path = store.find(job['video_id'], job['format_key'])
+            if stored_path:
+                title, ext = job['resolved'][2], os.path.splitext(stored_path)[1][1:]
+                job['status'] = "SUCCESS"
+                job['output_path'] = store.link(stored_path, get_output_path(output_dir, title, job['video_id'], ext))
+                print(f"Already stored, linked {job['output_path']}")
+                return
+        start_time = time.perf_counter()
+        with tracing.span('transfer', resolution=job['resolved'][3]) as transfer_span:
+            job['media_files'] = download_media(job['resolved'], output_dir, video_id=job['video_id'],
+                                                connections=connections, stream_merge=stream_merge, proxy=job['proxy'])
+            downloaded = sum(os.path.getsize(f) for f in job['media_files'] or [] if f)
+            transfer_span.set(bytes=downloaded)
+        if planner and job['media_files']:
+            planner.record_transfer(downloaded, time.perf_counter() - start_time)
+        if proxy_pool and job['media_files']:
+            proxy_pool.record_success(job['proxy'], downloaded, time.perf_counter() - start_time)
+
+    def merge(job):
+        start_time = time.perf_counter()
+        job['status'], job['output_path'] = merge_media(job['resolved'], job['media_files'], output_dir, merger=merger,
+                                                        connections=connections, stream_merge=stream_merge,
+                                                        proxy=job['proxy'], video_id=job['video_id'], store=store,
+                                                        format_key=job.get('format_key'))
+        if planner and not job['media_files'] and job['output_path']:
+            # Without local copies the transfer happens inside the merger
+            planner.record_transfer(os.path.getsize(job['output_path']), time.perf_counter() - start_time)
+
+    jobs = max(1, jobs)
+    video_jobs = ({'index': index, 'video_url': video_url, 'video_id': extract_video_id(video_url), 'status': None,
+                   'output_path': None, 'proxy': proxy}
+                  for index, video_url in enumerate(video_urls, start=1))
+    resolved = run_stage(stage('resolve', resolve), video_jobs, workers=jobs, buffer_size=buffer_size)
+    downloaded = run_stage(stage('download', download), resolved, workers=jobs, buffer_size=buffer_size)
+    # Merging can be CPU-bound, so it gets its own limit independent of --jobs
+    merged = run_stage(stage('merge', merge), downloaded, workers=merge_jobs or os.cpu_count() or 1, buffer_size=buffer_size)
+
+    total_videos = 0
+    for job in merged:
+        writer.submit(job['index'], job['video_url'], job['status'], job['output_path'])
+        if planner:
+            planner.video_finished()
+        if job.get('pooled'):
+            proxy_pool.release(job['proxy'])
+        total_videos += 1
+    return total_videos
+
 def main():
     parser = argparse.ArgumentParser(description="Download YouTube videos from a list")
     parser.add_argument("--input", required=True, help="Input file with video URLs")
     parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Output directory for downloaded videos")
     parser.add_argument("--output-result", default=DEFAULT_OUTPUT_RESULT, help="Output file for download results")
+    parser.add_argument("--analyze-workers", type=int, default=DEFAULT_ANALYZE_WORKERS, help="Number of input URLs to expand concurrently")
+    parser.add_argument("--restart", action="store_true", help="Ignore the results of previous runs and process every video again")
+    parser.add_argument("--no-cache", action="store_true", help="Always re-extract video metadata instead of using the cache")
+    parser.add_argument("--store-dir", help=f"Directory keeping every downloaded video once per ID and format (default: OUTPUT_DIR/{DEFAULT_STORE_DIRNAME})")
+    parser.add_argument("--no-store", action="store_true", help="Write videos straight to the output directory, without the media store")
     parser.add_argument("--debug", action="store_true", help="Enable debug output")
     parser.add_argument("--max-quality", type=int, choices=[144, 240, 360, 480, 720, 1080, 1440, 2160], help="Maximum video quality to download")
+    parser.add_argument("--codec-priority", help="Comma-separated video codecs to prefer at equal resolution, e.g. av01,vp09,avc1")
+    parser.add_argument("--max-bitrate", type=float, help="Maximum video bitrate in kbit/s; lower quality is chosen to stay under it")
+    parser.add_argument("--max-size", type=float, help="Maximum size of each video plus audio in MB; lower quality is chosen to stay under it")
+    budget_group = parser.add_mutually_exclusive_group()
+    budget_group.add_argument("--target-time", type=float,
+                              help="Seconds each video should take to download; quality is adapted to the measured bandwidth")
+    budget_group.add_argument("--deadline", type=float,
+                              help="Seconds the whole batch should take; quality is adapted to the measured bandwidth")
+    parser.add_argument("--proxy", help="Proxy server to use (e.g., socks5://127.0.0.1:9150 for Tor)")
+    parser.add_argument("--proxies", nargs='+',
+                        help="Spread videos over these proxies ('direct' for no proxy), weighted by their measured speed; throttled ones are evicted")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="Number of videos to resolve and download concurrently")
+    parser.add_argument("--merger", choices=["ffmpeg", "moviepy"], default=DEFAULT_MERGER,
+                        help="Merge backend: ffmpeg remuxes without re-encoding, moviepy re-encodes (default: ffmpeg)")
+    parser.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS,
+                        help="Parallel ranged connections per media stream, 0 lets the merger read the URLs directly")
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default="threads",
+                        help="Transfer core for ranged downloads: one thread per connection, or one asyncio event loop")
+    parser.add_argument("--stream-merge", action="store_true",
+                        help="Remux while video and audio are still downloading instead of after (ffmpeg merger only)")
+    parser.add_argument("--merge-jobs", type=int, help="Maximum number of concurrent merges (default: number of CPU cores)")
+    parser.add_argument("--buffer-size", type=int, default=DEFAULT_BUFFER_SIZE,
+                        help="Maximum number of videos queued between pipeline stages")
+    parser.add_argument("--trace", help="Write a JSON lines trace of per-video stage spans to this file and print a summary")
+    parser.add_argument("--profile-stage", help="Comma-separated spans to profile, e.g. merge,transfer")
+    parser.add_argument("--profiler", choices=["cprofile", "sample"], default="cprofile",
+                        help="cProfile (one span at a time, exact calls) or a stack sampler (all threads, includes waits)")
     args = parser.parse_args()
 
-    global DEBUG
+    global DEBUG, ENGINE
     DEBUG = args.debug
+    ENGINE = args.engine
+    metadata_cache.enabled = not args.no_cache
+    if args.trace or args.profile_stage:
+        tracing.configure(trace_path=args.trace, profiler=args.profiler,
+                          profile_stages=args.profile_stage.split(',') if args.profile_stage else None)
 
     if not os.path.exists(args.input):
         print(f"Error: Input file '{args.input}' not found.")
         sys.exit(1)
 
     os.makedirs(args.output_dir, exist_ok=True)
-
-    # Read URLs from input file
-    with open(args.input, 'r', encoding='utf-8') as input_file:
-        input_urls = [line.strip() for line in input_file if line.strip()]
-
-    # Process URLs to extract all video URLs, including those from playlists
-    all_video_urls = collect_all_video_urls(input_urls)
-    total_videos = len(all_video_urls)
-    print(f"\nTotal videos to download: {total_videos}")
-
-    with open(args.output_result, 'w', encoding='utf-8') as result_file:
-        for index, video_url in enumerate(all_video_urls, start=1):
-            print(f"Processing video {index}/{total_videos}: {video_url}")
-            status, output_path = process_video(video_url, args.output_dir, max_quality=args.max_quality)
-            result = f"{video_url},{status},{output_path if output_path else 'N/A'}\n"
-            result_file.write(result)
-            result_file.flush()  # Ensure the result is written immediately
-
+    # Every worker may hold a full set of ranged connections for both video and audio to the same host
+    merge_workers = args.merge_jobs or os.cpu_count() or 1
+    client_pool.configure(max_connections_per_host=2 * max(1, args.jobs, merge_workers) * max(1, args.connections))
+
+    stream_merge = args.stream_merge
+    if stream_merge and (args.merger != "ffmpeg" or not is_streaming_supported()):
+        print("Streaming merge needs the ffmpeg merger on a POSIX system, downloading before merging instead")
+        stream_merge = False
+
+    policy = SelectionPolicy(codec_priority=args.codec_priority.split(',') if args.codec_priority else None,
+                             max_height=args.max_quality, max_video_tbr=args.max_bitrate,
+                             max_total_size=args.max_size * 1024 * 1024 if args.max_size else None)
+
+    store = None if args.no_store else MediaStore(args.store_dir or os.path.join(args.output_dir, DEFAULT_STORE_DIRNAME))
+    journal = CheckpointJournal(get_journal_path(args.output_result))
+    skipped = [0]
+
+    def pending_video_urls(video_urls):
+        # Skip videos the journal already has on disk; FAILED and missing entries are retried
+        for video_url in video_urls:
+            if journal.is_complete(extract_video_id(video_url) or video_url):
+                debug_print(f"Skipping completed video: {video_url}")
+                skipped[0] += 1
+                continue
+            yield video_url
+
+    # The result file is only appended to, so a crashed run keeps everything it already finished
+    result_mode = 'w' if args.restart else 'a'
+    with open(args.input, 'r', encoding='utf-8') as input_file, \
+            open(args.output_result, result_mode, encoding='utf-8') as result_file, \
+            journal.open(restart=args.restart):
+        # Read URLs lazily and expand playlists while earlier videos are already downloading
+        input_urls = (line.strip() for line in input_file if line.strip())
+        pool = ProxyPool(args.proxies + ([args.proxy] if args.proxy else [])) if args.proxies else None
+        proxy = None if pool else args.proxy
+        if pool:
+            # Unreachable proxies are ruled out before the first input is expanded through the pool
+            first_input_url = next(input_urls, None)
+            if first_input_url:
+                pool.check(first_input_url)
+                input_urls = itertools.chain([first_input_url], input_urls)
+        # Every video is processed once, however many inputs list it
+        index = VideoIndex()
+        video_urls = pending_video_urls(iter_all_video_urls(input_urls, workers=args.analyze_workers, proxy=proxy,
+                                                            proxy_pool=pool, index=index))
+        if pool:
+            # The first video doubles as the probe target, so proxies are scored before work is assigned
+            first_video_url = next(video_urls, None)
+            if first_video_url:
+                pool.start(first_video_url)
+                video_urls = itertools.chain([first_video_url], video_urls)
+        planner = None
+        if args.target_time or args.deadline:
+            planner = QualityPlanner(target_time=args.target_time, deadline=args.deadline, jobs=args.jobs)
+            if args.deadline:
+                # Spreading a deadline over the batch needs its size, so expand all inputs first
+                video_urls = list(video_urls)
+                planner.set_total(len(video_urls))
+        writer = OrderedResultWriter(result_file, journal=journal)
+        total_videos = process_all_videos(video_urls, args.output_dir, writer, max_quality=args.max_quality,
+                                          jobs=args.jobs, merge_jobs=args.merge_jobs, merger=args.merger,
+                                          connections=args.connections, buffer_size=args.buffer_size,
+                                          stream_merge=stream_merge, policy=policy, planner=planner,
+                                          proxy=proxy, proxy_pool=pool, store=store)
+        if pool:
+            pool.close()
+
+    print(f"\nTotal videos processed: {total_videos}")
+    if skipped[0]:
+        print(f"Skipped {skipped[0]} videos already downloaded by a previous run")
+    if index.duplicates:
+        print(f"Skipped {index.duplicates} duplicate videos")
     print(f"\nAll videos processed. Results saved to {args.output_result}")
+    metadata_cache.report()
+    if store:
+        store.report()
+    client_pool.report()
+    rate_limiter.report()
+    if pool:
+        pool.report()
+    tracing.close()
+    tracing.report()
+    if args.trace:
+        print(f"Trace saved to {args.trace}")
 
 if __name__ == "__main__":
     main()
@@ -1,75 +1,122 @@
 import argparse
-import yt_dlp
-import requests
 import time
-import sys
+import json
+import csv
+import itertools
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
 
 from utils import get_best_video_and_audio_url
+from metadata_cache import metadata_cache
+from throughput_stats import ThroughputRecorder
+from async_transfer import measure_download_speed_sync
+from speed_test import (DEFAULT_DURATION, RECEIVE_MODES, measure_download_speed, measure_segmented_download_speed,
+                        print_recorder_stats)
+import client_pool
+import proxy_pool
+import rate_limiter
 
 DEFAULT_VIDEO_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
-DEFAULT_DURATION = 10
-CHUNK_SIZE = 3 * 1024 * 1024  # 1 MB
 DEBUG = False
 
 def debug_print(*args, **kwargs):
     if DEBUG:
         print(*args, **kwargs)
 
-def measure_download_speed(url, duration=DEFAULT_DURATION, proxy=None):
+def run_matrix_combination(media_url, proxy, streams, duration, receive_mode="iter"):
+    # Runs `streams` independent connections side by side and reports each one plus the total
     start_time = time.time()
-    downloaded = 0
-    peak_speed = 0
-    last_update_time = start_time
-    retry_delay = 1
-    chunk_times = []
-    last_chunk_time = 0
-
-    proxies = {'http': proxy, 'https': proxy} if proxy else None
-
-    try:
-        while time.time() - start_time < duration:
-            try:
-                with requests.get(url, stream=True, timeout=10, proxies=proxies) as r:
-                    r.raise_for_status()
-                    chunk_start = time.time()  # Move this outside the for loop
-                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
-                        if chunk:
-                            current_time = time.time()
-                            chunk_time = current_time - chunk_start
-                            chunk_times.append(chunk_time)
-                            last_chunk_time = chunk_time  # Store the last chunk time
-                            downloaded += len(chunk)
-                            elapsed_time = current_time - start_time
-                            if elapsed_time >= duration:
-                                break
-                            speed = downloaded / elapsed_time / 1024 / 1024  # MB/s
-                            peak_speed = max(peak_speed, speed)
-                            if current_time - last_update_time >= 1:  # Update display every second
-                                remaining_time = max(0, duration - elapsed_time)
-                                sys.stdout.write(f"\rDownloaded: {downloaded/1024/1024:.2f} MB, Current Speed: {speed:.2f} MB/s, Peak Speed: {peak_speed:.2f} MB/s, Time left: {remaining_time:.0f}s, Last chunk time: {last_chunk_time:.4f}s\n")
-                                sys.stdout.flush()
-                                last_update_time = current_time
-                            chunk_start = current_time  # Set the start time for the next chunk
-                retry_delay = 1  # Reset retry delay on successful download
-            except requests.RequestException as e:
-                error_type = type(e).__name__
-                print(f"Error: {error_type}. Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-                retry_delay = min(retry_delay * 2, duration / 2)  # Exponential backoff, max half the duration
-    except KeyboardInterrupt:
-        print("\nTest interrupted by user.")
-
-    total_time = time.time() - start_time
-    avg_speed = downloaded / total_time / 1024 / 1024  # MB/s
-
-    # Calculate and print chunk time statistics
-    if chunk_times:
-        avg_chunk_time = sum(chunk_times) / len(chunk_times)
-        min_chunk_time = min(chunk_times)
-        max_chunk_time = max(chunk_times)
-        print(f"\nChunk time stats - Avg: {avg_chunk_time:.4f}s, Min: {min_chunk_time:.4f}s, Max: {max_chunk_time:.4f}s")
-
-    return avg_speed, downloaded / 1024 / 1024, peak_speed  # avg speed in MB/s, downloaded in MB, peak speed in MB/s
+    with ThreadPoolExecutor(max_workers=streams) as executor:
+        futures = [executor.submit(measure_download_speed, media_url, duration=duration, proxy=proxy, quiet=True,
+                                   recorder=None, receive_mode=receive_mode)
+                   for _ in range(streams)]
+        results = [future.result() for future in futures]
+    wall_time = time.time() - start_time
+    downloaded = sum(result[1] for result in results)
+    return {
+        'streams': streams,
+        'aggregate_speed': downloaded / wall_time,  # MB/s
+        'per_stream_speeds': [result[0] for result in results],  # MB/s
+        'downloaded': downloaded,  # MB
+        'wall_time': wall_time,
+    }
+
+def run_speed_matrix(video_urls, proxies, stream_counts, duration=DEFAULT_DURATION, rounds=1, schedule="rounds",
+                     receive_mode="iter"):
+    # Resolve each video once per proxy: signed media URLs only work from the IP that requested them
+    targets = []
+    for video_url, proxy in itertools.product(video_urls, proxies):
+        try:
+            media_url, _, _, _, _, _, _, _ = get_best_video_and_audio_url(video_url, proxy=proxy)
+            targets.append((video_url, proxy, media_url))
+        except Exception as e:
+            print(f"Skipping {video_url} via {proxy or 'direct'}: {str(e)}")
+
+    combinations = [(target, streams) for target in targets for streams in stream_counts]
+    rows = []
+
+    def run(round_index, target, streams):
+        video_url, proxy, media_url = target
+        result = run_matrix_combination(media_url, proxy, streams, duration, receive_mode)
+        result.update({
+            'round': round_index,
+            'video_url': video_url,
+            'host': urlparse(media_url).hostname,
+            'proxy': proxy or 'direct',
+            'started_at': time.time() - result['wall_time'],
+        })
+        print(f"Round {round_index} | {result['proxy']} | {result['host']} | {streams} stream(s): "
+              f"{result['aggregate_speed']:.2f} MB/s total, "
+              f"{result['aggregate_speed'] / streams:.2f} MB/s per stream")
+        return result
+
+    for round_index in range(1, rounds + 1):
+        if schedule == "concurrent":
+            # Every combination at once: shows the combined ceiling of the link
+            with ThreadPoolExecutor(max_workers=len(combinations) or 1) as executor:
+                futures = [executor.submit(run, round_index, target, streams) for target, streams in combinations]
+                rows.extend(future.result() for future in futures)
+        else:
+            # One combination at a time so they do not compete for the link
+            rows.extend(run(round_index, target, streams) for target, streams in combinations)
+    return rows
+
+def write_matrix_json(rows, filename):
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(rows, f, indent=2)
+
+def write_matrix_csv(rows, filename):
+    fields = ['round', 'started_at', 'video_url', 'host', 'proxy', 'streams', 'aggregate_speed',
+              'per_stream_speeds', 'downloaded', 'wall_time']
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            row = dict(row, per_stream_speeds=';'.join(f"{speed:.3f}" for speed in row['per_stream_speeds']))
+            writer.writerow({field: row[field] for field in fields})
+
+def main_matrix(args):
+    video_urls = args.urls or [args.url]
+    proxies = [None if proxy == 'direct' else proxy for proxy in (args.proxies or [args.proxy])]
+    stream_counts = [int(count) for count in args.streams.split(',')]
+    # Concurrent scheduling opens every combination's streams to the same host at once
+    client_pool.configure(max_connections_per_host=sum(stream_counts) * len(video_urls) * len(proxies)
+                          if args.schedule == "concurrent" else max(stream_counts))
+    print(f"Matrix: {len(video_urls)} video(s) x {len(proxies)} proxy(ies) x streams {stream_counts}, "
+          f"{args.rounds} round(s) of {args.duration}s, schedule: {args.schedule}")
+
+    rows = run_speed_matrix(video_urls, proxies, stream_counts, duration=args.duration,
+                            rounds=args.rounds, schedule=args.schedule, receive_mode=args.receive_mode)
+
+    if args.output_json:
+        write_matrix_json(rows, args.output_json)
+        print(f"Matrix results saved to {args.output_json}")
+    if args.output_csv:
+        write_matrix_csv(rows, args.output_csv)
+        print(f"Matrix results saved to {args.output_csv}")
+    metadata_cache.report()
+    client_pool.report()
+    rate_limiter.report()
 
 
 def main():
@@ -77,8 +124,35 @@ def main():
     parser.add_argument("--url", default=DEFAULT_VIDEO_URL, help="YouTube video URL to test")
     parser.add_argument("--duration", type=int, default=DEFAULT_DURATION, help="Duration of the speed test in seconds")
     parser.add_argument("--proxy", help="Proxy server to use (e.g., socks5://127.0.0.1:9150 for Tor)")
+    parser.add_argument("--connections", type=int, default=1, help="Number of parallel ranged connections (default: 1)")
+    parser.add_argument("--no-cache", action="store_true", help="Always re-extract video metadata instead of using the cache")
     parser.add_argument("--debug", action="store_true", help="Enable debug output")
+    parser.add_argument("--engine", choices=["threads", "asyncio"], default="threads",
+                        help="threads: one OS thread per connection; asyncio: all connections as full streams on one event loop")
+    parser.add_argument("--receive-mode", choices=RECEIVE_MODES, default="iter",
+                        help="iter allocates a new buffer per chunk; readinto reuses one buffer to cut measurement overhead")
+    parser.add_argument("--timeseries", help="Write per-100ms throughput samples and stats to this file (.csv or .json)")
+    parser.add_argument("--matrix", action="store_true", help="Compare several videos, proxies and stream counts in one run")
+    parser.add_argument("--urls", nargs='+', help="Matrix mode: YouTube video URLs to test")
+    parser.add_argument("--proxies", nargs='+',
+                        help="Proxies to choose from, 'direct' for no proxy: all are probed and the fastest healthy one is tested "
+                             "(in matrix mode: proxies to compare)")
+    parser.add_argument("--streams", default="1", help="Matrix mode: comma-separated parallel stream counts (e.g., 1,2,4,8)")
+    parser.add_argument("--rounds", type=int, default=1, help="Matrix mode: number of times to repeat every combination")
+    parser.add_argument("--schedule", choices=["rounds", "concurrent"], default="rounds",
+                        help="Matrix mode: run combinations one after another or all at once")
+    parser.add_argument("--output-json", help="Matrix mode: write results to this JSON file")
+    parser.add_argument("--output-csv", help="Matrix mode: write results to this CSV file")
     args = parser.parse_args()
+    # Only the single-connection threads path reads through a reusable buffer; the others would ignore it
+    if args.receive_mode == "readinto" and not args.matrix and (args.engine == "asyncio" or args.connections > 1):
+        parser.error("--receive-mode readinto only works with --engine threads and --connections 1")
+
+    metadata_cache.enabled = not args.no_cache
+
+    if args.matrix:
+        main_matrix(args)
+        return
 
     if args.debug:
         debug_print("Debug mode enabled")
@@ -86,7 +160,14 @@ def main():
     video_url = args.url
     print(f"Video URL: {video_url}")
     print(f"Test duration: {args.duration} seconds")
-    if args.proxy:
+    if args.proxies:
+        pool = proxy_pool.ProxyPool(args.proxies + ([args.proxy] if args.proxy else []))
+        print(f"Probing {len(pool.stats)} proxies...")
+        pool.probe(video_url)
+        pool.report()
+        args.proxy = pool.best()
+        print(f"Testing the best proxy: {proxy_pool.get_proxy_name(args.proxy)}")
+    elif args.proxy:
         print(f"Using proxy: {args.proxy}")
 
     try:
@@ -98,12 +179,25 @@ def main():
         print("Speed Test...")
         print("==================")
 
-        avg_speed, downloaded, peak_speed = measure_download_speed(video_url, duration=args.duration, proxy=args.proxy)
+        recorder = ThroughputRecorder()
+        if args.engine == "asyncio":
+            avg_speed, downloaded, peak_speed = measure_download_speed_sync(video_url, args.duration, proxy=args.proxy, streams=args.connections, recorder=recorder)
+            print_recorder_stats(recorder)
+        elif args.connections > 1:
+            avg_speed, downloaded, peak_speed = measure_segmented_download_speed(video_url, duration=args.duration, proxy=args.proxy, connections=args.connections, recorder=recorder)
+        else:
+            avg_speed, downloaded, peak_speed = measure_download_speed(video_url, duration=args.duration, proxy=args.proxy, recorder=recorder, receive_mode=args.receive_mode)
 
         print("==================")
         print(f"Average download speed: {avg_speed:.2f} MB/s")
         print(f"Peak download speed: {peak_speed:.2f} MB/s")
         print(f"Total data downloaded: {downloaded:.2f} MB")
+        if args.timeseries:
+            recorder.export(args.timeseries)
+            print(f"Throughput time series saved to {args.timeseries}")
+        metadata_cache.report()
+        client_pool.report()
+        rate_limiter.report()
 
     except Exception as e:
         print(f"An error occurred: {str(e)}")
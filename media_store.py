@@ -0,0 +1,78 @@
+import os
+import re
+import shutil
+import threading
+from collections import Counter
+
+DEFAULT_STORE_DIRNAME = ".store"
+TEMP_PREFIX = ".tmp-"
+
+def get_safe_name(name):
+    return re.sub(r'[^0-9A-Za-z_.+-]', '_', name)
+
+class MediaStore:
+    # Merged videos kept once per video ID and format, as store_dir/<video_id>/<format>.<ext>.
+    # The human-readable names in the output directory are hardlinks to these files (symlinks or
+    # copies where hardlinks are not possible), so a video that several inputs, runs or jobs ask
+    # for in the same format is only transferred and merged once.
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.hits = 0
+        self.links = Counter()
+        self.lock = threading.Lock()
+
+    def get_video_dir(self, video_id):
+        return os.path.join(self.store_dir, get_safe_name(video_id))
+
+    def find(self, video_id, format_key):
+        # The container is only chosen at merge time, so any extension matches
+        video_dir = self.get_video_dir(video_id)
+        prefix = get_safe_name(format_key) + "."
+        if os.path.isdir(video_dir):
+            for name in sorted(os.listdir(video_dir)):
+                if name.startswith(prefix) and not name.startswith(TEMP_PREFIX):
+                    with self.lock:
+                        self.hits += 1
+                    return os.path.join(video_dir, name)
+        return None
+
+    def get_temp_path(self, video_id, format_key, ext):
+        # Merges write here first, so a crash never leaves a partial file under the final name.
+        # The real extension stays last because ffmpeg picks the container from it.
+        video_dir = self.get_video_dir(video_id)
+        os.makedirs(video_dir, exist_ok=True)
+        return os.path.join(video_dir, f"{TEMP_PREFIX}{os.getpid()}-{threading.get_ident()}-"
+                                       f"{get_safe_name(format_key)}.{ext}")
+
+    def commit(self, temp_path, video_id, format_key, ext):
+        path = os.path.join(self.get_video_dir(video_id), f"{get_safe_name(format_key)}.{ext}")
+        os.replace(temp_path, path)
+        return path
+
+    def link(self, path, output_path):
+        # Points output_path at the stored file, replacing whatever had that name before
+        if os.path.exists(output_path) and os.path.samefile(path, output_path):
+            return output_path
+        temp_path = output_path + ".link"
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+        try:
+            os.link(path, temp_path)
+            mode = 'hardlink'
+        except OSError:
+            try:
+                os.symlink(os.path.relpath(path, os.path.dirname(output_path) or "."), temp_path)
+                mode = 'symlink'
+            except OSError:
+                shutil.copyfile(path, temp_path)
+                mode = 'copy'
+        os.replace(temp_path, output_path)
+        with self.lock:
+            self.links[mode] += 1
+        return output_path
+
+    def report(self):
+        if self.hits or self.links:
+            links = ", ".join(f"{count} {mode}{'s' if count != 1 else ''}" for mode, count in sorted(self.links.items()))
+            print(f"Media store: {self.hits} videos reused without downloading ({links or 'no links'})")
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "metadata")
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL = 6 * 60 * 60  # Used when no format URL carries an expire parameter
+EXPIRY_MARGIN = 5 * 60  # Drop entries a little early so a download never starts on an expiring URL
+
+# Only the fields format selection and downloading need; the full info dict is large
+FORMAT_FIELDS = ['format_id', 'url', 'ext', 'vcodec', 'acodec', 'height', 'width', 'fps',
+                 'tbr', 'vbr', 'abr', 'filesize', 'filesize_approx', 'protocol']
+
+def get_url_expiry(url):
+    # googlevideo URLs carry their signature expiry either as ?expire=<ts> or as /expire/<ts>/
+    match = re.search(r'[?&/]expire[=/](\d+)', url or '')
+    return int(match.group(1)) if match else None
+
+class MetadataCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_entries=DEFAULT_MAX_ENTRIES, enabled=True):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def make_key(self, video_id, proxy=None):
+        # Signed URLs are bound to the IP that extracted them, so each proxy gets its own entry
+        if not proxy:
+            return video_id
+        return f"{video_id}-{hashlib.sha1(proxy.encode('utf-8')).hexdigest()[:10]}"
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, video_id, proxy=None):
+        if not self.enabled:
+            return None
+        key = self.make_key(video_id, proxy)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry['expires_at'] > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    self.saved_seconds += entry.get('extract_seconds', 0)
+                    return entry['info']
+                del self.entries[key]
+
+        entry = self.read_entry(key)
+        with self.lock:
+            if entry is None or entry['expires_at'] <= now:
+                self.misses += 1
+                return None
+            self.remember(key, entry)
+            self.hits += 1
+            self.disk_hits += 1
+            self.saved_seconds += entry.get('extract_seconds', 0)
+            return entry['info']
+
+    def put(self, video_id, info, proxy=None, extract_seconds=0.0):
+        if not self.enabled:
+            return
+        formats = [{field: f.get(field) for field in FORMAT_FIELDS if f.get(field) is not None}
+                   for f in info.get('formats', [])]
+        expiries = [expiry for expiry in (get_url_expiry(f.get('url')) for f in formats) if expiry]
+        expires_at = (min(expiries) if expiries else time.time() + DEFAULT_TTL) - EXPIRY_MARGIN
+        entry = {
+            'info': {
+                'id': info.get('id', video_id),
+                'title': info.get('title', 'Unknown'),
+                'duration': info.get('duration'),
+                'formats': formats,
+            },
+            'expires_at': expires_at,
+            'extract_seconds': extract_seconds,
+        }
+        key = self.make_key(video_id, proxy)
+        with self.lock:
+            self.remember(key, entry)
+        self.write_entry(key, entry)
+
+    def remember(self, key, entry):
+        # In-process LRU layer; the caller holds the lock
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def read_entry(self, key):
+        path = self.get_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('expires_at', 0) <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def write_entry(self, key, entry):
+        path = self.get_path(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not write metadata cache entry {path}: {str(e)}")
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'saved_seconds': self.saved_seconds,
+            }
+
+    def report(self):
+        stats = self.stats()
+        lookups = stats['hits'] + stats['misses']
+        if not self.enabled or not lookups:
+            return
+        print(f"Metadata cache: {stats['hits']}/{lookups} hits ({stats['disk_hits']} from disk), "
+              f"{stats['misses']} misses, ~{stats['saved_seconds']:.1f}s of extraction saved")
+
+metadata_cache = MetadataCache()
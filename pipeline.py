@@ -0,0 +1,74 @@
+import queue
+import threading
+
+DEFAULT_BUFFER_SIZE = 8
+
+_DONE = object()
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+def run_stage(func, items, workers=1, buffer_size=DEFAULT_BUFFER_SIZE):
+    # Runs func over items on `workers` threads and yields results in completion order.
+    # Both the input and output buffers are bounded, so a slow consumer stalls this stage
+    # and, through it, every stage upstream instead of letting work pile up in memory.
+    inbox = queue.Queue(maxsize=buffer_size)
+    outbox = queue.Queue(maxsize=buffer_size)
+    stop_event = threading.Event()
+
+    def put(target, value):
+        while not stop_event.is_set():
+            try:
+                target.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def feed():
+        try:
+            for item in items:
+                if not put(inbox, item):
+                    return
+        except Exception as e:
+            put(outbox, _StageError(e))
+        finally:
+            for _ in range(workers):
+                put(inbox, _DONE)
+
+    def work():
+        try:
+            while not stop_event.is_set():
+                try:
+                    item = inbox.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    return
+                try:
+                    result = func(item)
+                except Exception as e:
+                    result = _StageError(e)
+                if not put(outbox, result):
+                    return
+        finally:
+            put(outbox, _DONE)
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    threads += [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        finished = 0
+        while finished < workers:
+            result = outbox.get()
+            if result is _DONE:
+                finished += 1
+            elif isinstance(result, _StageError):
+                raise result.error
+            else:
+                yield result
+    finally:
+        stop_event.set()
@@ -0,0 +1,251 @@
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bandwidth_planner import DEFAULT_SMOOTHING, BandwidthEstimator, get_moving_average
+from rate_limiter import get_error_response, get_extraction_bucket, is_connection_error
+from speed_test import measure_download_speed
+from throughput_stats import ThroughputRecorder
+
+DEFAULT_PROBE_SECONDS = 2
+DEFAULT_PROBE_INTERVAL = 120  # Seconds without traffic after which a proxy is probed again
+EVICTION_SECONDS = 300  # Time out after a proxy is throttled, doubled every further time
+MAX_EVICTION_SECONDS = 3600
+MAX_ERROR_RATE = 0.5  # Proxies failing more often only get work when no other proxy is healthy
+
+def parse_proxies(proxies):
+    # 'direct' stands for no proxy, as in ping --matrix; duplicates are dropped
+    parsed = []
+    for proxy in proxies:
+        proxy = None if proxy == 'direct' else proxy
+        if proxy not in parsed:
+            parsed.append(proxy)
+    return parsed
+
+def get_proxy_name(proxy):
+    return proxy or 'direct'
+
+def is_proxy_failure(error):
+    # Errors another proxy may not get: throttling, or no connection through this one at all
+    return get_error_response(error)[0] == 429 or is_connection_error(error)
+
+class ProxyStats:
+    def __init__(self, proxy, smoothing=DEFAULT_SMOOTHING):
+        self.proxy = proxy
+        self.bandwidth = BandwidthEstimator(smoothing)
+        self.ttfb = None  # Seconds to the first media byte
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.evictions = 0
+        self.evicted_until = 0.0
+        self.last_sample = None
+
+    @property
+    def throughput(self):
+        return self.bandwidth.rate  # Bytes/s of single downloads
+
+class ProxyPool:
+    # Scores every proxy by moving averages of its download throughput, time to first byte and
+    # error rate, fed by short probes (speed_test's measure_download_speed) and by real work.
+    # Work goes to healthy proxies at random, weighted by throughput over the work they already
+    # have. A proxy that gets throttled, or whose YouTube rate limiter is paused, gets no new work
+    # until its time out ends.
+
+    def __init__(self, proxies, smoothing=DEFAULT_SMOOTHING, probe_seconds=DEFAULT_PROBE_SECONDS,
+                 probe_interval=DEFAULT_PROBE_INTERVAL):
+        self.stats = {proxy: ProxyStats(proxy, smoothing) for proxy in parse_proxies(proxies)}
+        if not self.stats:
+            raise ValueError("The proxy pool needs at least one proxy")
+        self.smoothing = smoothing
+        self.probe_seconds = probe_seconds
+        self.probe_interval = probe_interval
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.prober = None
+
+    def average(self, old, sample):
+        return get_moving_average(old, sample, self.smoothing)
+
+    def record_success(self, proxy, nbytes=0, seconds=0, ttfb=None):
+        with self.lock:
+            stats = self.stats[proxy]
+            stats.requests += 1
+            stats.error_rate = self.average(stats.error_rate, 0.0)
+            stats.bandwidth.update(nbytes, seconds)
+            if ttfb is not None:
+                stats.ttfb = self.average(stats.ttfb, ttfb)
+            stats.last_sample = time.monotonic()
+
+    def record_failure(self, proxy, error):
+        status, _ = get_error_response(error)
+        unreachable = is_connection_error(error)
+        with self.lock:
+            stats = self.stats[proxy]
+            stats.requests += 1
+            stats.errors += 1
+            was_healthy = stats.error_rate <= MAX_ERROR_RATE
+            # A proxy that cannot be reached at all is out at once rather than after several
+            # failures; probes bring it back once it answers again
+            stats.error_rate = 1.0 if unreachable else self.average(stats.error_rate, 1.0)
+            stats.last_sample = time.monotonic()
+            if status == 429:
+                stats.evictions += 1
+                timeout = min(MAX_EVICTION_SECONDS, EVICTION_SECONDS * 2 ** (stats.evictions - 1))
+                stats.evicted_until = time.monotonic() + timeout
+        if status == 429:
+            print(f"Proxy {get_proxy_name(proxy)} is throttled (HTTP 429), no new work for {timeout} seconds")
+        elif unreachable and was_healthy:
+            print(f"Proxy {get_proxy_name(proxy)} is unreachable ({type(error).__name__}), no new work until a probe succeeds")
+
+    def is_healthy(self, stats, now):
+        if stats.evicted_until > now or stats.error_rate > MAX_ERROR_RATE:
+            return False
+        return get_extraction_bucket(stats.proxy).paused_until <= now
+
+    def weights(self, candidates):
+        # Proxies without a throughput sample yet count as typical, so they still get tried
+        measured = [stats.throughput for stats in self.stats.values() if stats.throughput]
+        typical = statistics.median(measured) if measured else 1.0
+        return [(stats.throughput or typical) * (1 - stats.error_rate) / (1 + stats.in_flight) for stats in candidates]
+
+    def get_candidates(self, exclude=()):
+        now = time.monotonic()
+        available = [stats for stats in self.stats.values() if stats.proxy not in exclude] or list(self.stats.values())
+        healthy = [stats for stats in available if self.is_healthy(stats, now)]
+        if healthy:
+            return healthy
+        # Nothing is healthy: keep going on the proxy whose time out ends first
+        return [min(available, key=lambda stats: (stats.evicted_until, stats.error_rate))]
+
+    def acquire(self, exclude=()):
+        # Picks a proxy for one unit of work, if possible not one in exclude;
+        # call release() with it when the work is done
+        with self.lock:
+            candidates = self.get_candidates(exclude)
+            stats = random.choices(candidates, weights=[max(weight, 1e-9) for weight in self.weights(candidates)])[0]
+            stats.in_flight += 1
+            return stats.proxy
+
+    def release(self, proxy):
+        with self.lock:
+            self.stats[proxy].in_flight -= 1
+
+    def call(self, func):
+        # Runs func(proxy) on a pool proxy and returns (result, proxy), with the proxy still acquired.
+        # When a proxy is throttled or unreachable the call moves on to one not tried yet, and only
+        # raises once every proxy has failed. Failures are recorded, except ValueErrors, which are
+        # about the input rather than the proxy.
+        tried = []
+        proxy = self.acquire()
+        while True:
+            tried.append(proxy)
+            try:
+                result = func(proxy)
+            except Exception as e:
+                if not isinstance(e, ValueError):
+                    self.record_failure(proxy, e)
+                self.release(proxy)
+                if not is_proxy_failure(e) or len(tried) == len(self.stats):
+                    raise
+                proxy = self.acquire(exclude=tried)
+                print(f"Retrying through {get_proxy_name(proxy)}")
+                continue
+            self.record_success(proxy)
+            return result, proxy
+
+    def best(self):
+        with self.lock:
+            candidates = self.get_candidates()
+            weights = self.weights(candidates)
+            return candidates[weights.index(max(weights))].proxy
+
+    def probe_proxy(self, video_url, proxy):
+        # Imported here so analyze, which never probes, does not load yt-dlp format selection
+        from utils import extract_video_id, get_video_info, select_best_video_and_audio
+
+        # Media URLs are signed for the IP that extracted them, so every proxy resolves its own
+        try:
+            info = get_video_info(extract_video_id(video_url), proxy=proxy)
+            media_url = select_best_video_and_audio(info)[0]['url']
+            recorder = ThroughputRecorder()
+            _, downloaded, _ = measure_download_speed(media_url, duration=self.probe_seconds, proxy=proxy,
+                                                      quiet=True, recorder=recorder)
+        except Exception as e:
+            self.record_failure(proxy, e)
+            return
+        if not downloaded:
+            self.record_failure(proxy, ConnectionError("No data received"))
+            return
+        self.record_success(proxy, downloaded * 1024 * 1024, self.probe_seconds, ttfb=recorder.summary()['ttfb_first'])
+
+    def check_proxy(self, url, proxy):
+        # Imported here since url_analyzer itself imports this module
+        from url_analyzer import extract_url_info
+
+        # One flat extraction of any input URL, without retries: it only shows whether YouTube can be reached
+        try:
+            extract_url_info(url, get_extraction_bucket(proxy), proxy, max_attempts=1)
+        except Exception as e:
+            if is_proxy_failure(e):
+                self.record_failure(proxy, e)
+                return
+        self.record_success(proxy)
+
+    def check(self, url):
+        # Quick reachability check of every proxy, so no work goes to a dead proxy before the first probe
+        print(f"Checking {len(self.stats)} proxies...")
+        with ThreadPoolExecutor(max_workers=len(self.stats)) as executor:
+            for proxy in self.stats:
+                executor.submit(self.check_proxy, url, proxy)
+
+    def probe(self, video_url, proxies=None):
+        proxies = list(self.stats) if proxies is None else proxies
+        if not proxies:
+            return
+        with ThreadPoolExecutor(max_workers=len(proxies)) as executor:
+            for proxy in proxies:
+                executor.submit(self.probe_proxy, video_url, proxy)
+
+    def get_stale_proxies(self):
+        # Proxies nothing has gone through for a while, including those whose time out just ended
+        now = time.monotonic()
+        with self.lock:
+            return [stats.proxy for stats in self.stats.values()
+                    if stats.evicted_until <= now and stats.in_flight == 0
+                    and (stats.last_sample is None or now - stats.last_sample >= self.probe_interval)]
+
+    def start(self, video_url):
+        # Probes all proxies that passed check() now, then keeps re-probing idle ones in the background
+        now = time.monotonic()
+        with self.lock:
+            proxies = [stats.proxy for stats in self.stats.values() if self.is_healthy(stats, now)]
+        print(f"Probing {len(proxies)} proxies...")
+        self.probe(video_url, proxies)
+        self.report()
+        self.prober = threading.Thread(target=self.keep_probing, args=(video_url,), daemon=True)
+        self.prober.start()
+
+    def keep_probing(self, video_url):
+        while not self.stop_event.wait(min(self.probe_interval, EVICTION_SECONDS) / 4):
+            self.probe(video_url, self.get_stale_proxies())
+
+    def close(self):
+        self.stop_event.set()
+
+    def report(self):
+        now = time.monotonic()
+        print(f"{'Proxy':<40}{'MB/s':>8}{'TTFB s':>8}{'Errors':>8}{'Requests':>10}  Status")
+        with self.lock:
+            for stats in sorted(self.stats.values(), key=lambda stats: stats.throughput or 0, reverse=True):
+                throughput = f"{stats.throughput / 1024 / 1024:.2f}" if stats.throughput else '-'
+                ttfb = f"{stats.ttfb:.3f}" if stats.ttfb is not None else '-'
+                if stats.evicted_until > now:
+                    status = f"evicted for {stats.evicted_until - now:.0f}s"
+                else:
+                    status = 'healthy' if self.is_healthy(stats, now) else 'unhealthy'
+                print(f"{get_proxy_name(stats.proxy):<40}{throughput:>8}{ttfb:>8}{stats.error_rate:>8.0%}"
+                      f"{stats.requests:>10}  {status}")
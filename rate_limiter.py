@@ -0,0 +1,258 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.error import URLError
+from urllib.parse import urlparse
+
+import requests
+import yt_dlp
+from yt_dlp.networking.exceptions import TransportError
+
+from tracing import span
+
+DEFAULT_RATE = 2.0  # Requests per second
+DEFAULT_BURST = 4
+DEFAULT_MIN_RATE = 0.1
+THROTTLE_PAUSE = 10  # Seconds every worker waits after a 429, plus jitter
+MAX_THROTTLE_PAUSE = 120  # Cap on the pause after repeated 429s in a row
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 1.0
+TRANSFER_BASE_DELAY = 0.25  # Dropped media connections resume from the last byte, so reconnect sooner
+MAX_RETRY_DELAY = 30.0
+YOUTUBE_HOST = 'www.youtube.com'  # Bucket shared by all metadata extraction
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+# yt-dlp reports network trouble only in the message; anything else (private, removed, unsupported) is final
+TRANSIENT_ERROR_MARKERS = ['timed out', 'Connection', 'Temporary failure', 'IncompleteRead', 'Read timed out']
+# Messages of errors where the server, or the proxy in front of it, could not be reached at all
+CONNECTION_ERROR_MARKERS = ['connection', 'timed out', 'unable to connect', 'proxy', 'temporary failure',
+                            'name or service not known']
+CONNECTION_ERROR_TYPES = (ConnectionError, TimeoutError, URLError, TransportError,
+                          requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+class AdaptiveTokenBucket:
+    # Token bucket shared by all workers: halves its rate on 429 and creeps back up on success.
+    # A 429 also opens a circuit breaker that pauses every worker using the bucket, for
+    # Retry-After seconds when the server says so, otherwise for longer with every 429 in a row.
+    # With rate=None requests are not rate limited, only paused while the circuit is open.
+    # clock and rng stand in for time.monotonic and the random module in tests.
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, min_rate=DEFAULT_MIN_RATE, max_rate=None, name=None,
+                 clock=time.monotonic, rng=random):
+        self.name = name or 'origin'
+        self.clock = clock
+        self.rng = rng
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate
+        self.tokens = burst
+        self.last_refill = clock()
+        self.paused_until = 0.0
+        self.consecutive_throttles = 0
+        self.throttle_count = 0
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def try_acquire(self):
+        # Takes a token and returns 0, or returns how many seconds to wait before trying again
+        with self.lock:
+            now = self.clock()
+            self.refill(now)
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.rate is None:
+                return 0.0
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self, deadline=None, sleep=time.sleep):
+        # Blocks until a request may be sent. With a deadline on the bucket's clock, gives up
+        # and returns False once waiting would go past it.
+        while True:
+            wait_time = self.try_acquire()
+            if wait_time <= 0:
+                return True
+            if deadline is not None and self.clock() + wait_time >= deadline:
+                sleep(max(0, deadline - self.clock()))
+                return False
+            with span('rate_limit_wait', bucket=self.name):
+                sleep(wait_time)
+
+    def on_throttled(self, retry_after=None):
+        with self.lock:
+            now = self.clock()
+            if self.rate is not None:
+                self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            self.consecutive_throttles += 1
+            self.throttle_count += 1
+            if retry_after is not None:
+                pause = retry_after
+            else:
+                backoff = THROTTLE_PAUSE * 2 ** (self.consecutive_throttles - 1)
+                pause = min(MAX_THROTTLE_PAUSE, backoff) + self.rng.uniform(0, 5)
+            self.paused_until = max(self.paused_until, now + pause)
+            return pause
+
+    def on_success(self):
+        with self.lock:
+            self.consecutive_throttles = 0
+            if self.rate is not None:
+                # Additive increase: a tenth of the original rate per successful request
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+class Backoff:
+    # Decorrelated jitter: each delay is random between the base and three times the previous
+    # one, so workers that failed together do not retry together
+
+    def __init__(self, base_delay=DEFAULT_BASE_DELAY, max_delay=MAX_RETRY_DELAY, rng=random):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delay = base_delay
+        self.rng = rng
+
+    def next_delay(self):
+        self.delay = min(self.max_delay, self.rng.uniform(self.base_delay, self.delay * 3))
+        return self.delay
+
+    def reset(self):
+        self.delay = self.base_delay
+
+buckets = {}
+buckets_lock = threading.Lock()
+
+def get_bucket(url_or_host, proxy=None, rate=None):
+    # One process-wide bucket per (host, proxy). rate only applies when the bucket is created;
+    # None leaves requests to that host unlimited but still subject to the circuit breaker.
+    host = urlparse(url_or_host).hostname if '://' in url_or_host else url_or_host
+    key = (host, proxy)
+    with buckets_lock:
+        bucket = buckets.get(key)
+        if bucket is None:
+            name = f"{host} via {proxy}" if proxy else host
+            bucket = buckets[key] = AdaptiveTokenBucket(rate=rate, name=name)
+        return bucket
+
+def get_extraction_bucket(proxy=None):
+    return get_bucket(YOUTUBE_HOST, proxy, rate=DEFAULT_RATE)
+
+def get_error_chain(error):
+    # The error and the errors behind it, as far as requests, aiohttp and yt-dlp keep them
+    exc_info = getattr(error, 'exc_info', None)
+    candidates = [error, error.__cause__, exc_info[1] if exc_info else None]
+    # yt-dlp keeps the HTTP error of a failed extraction in ExtractorError.cause
+    candidates += [getattr(candidate, 'cause', None) for candidate in candidates]
+    return [candidate for candidate in candidates if candidate is not None]
+
+def get_error_response(error):
+    # (status, headers) of the HTTP response behind an error from requests, aiohttp or yt-dlp
+    for candidate in get_error_chain(error):
+        response = getattr(candidate, 'response', None)
+        for source in (response, candidate):
+            status = getattr(source, 'status_code', None) or getattr(source, 'status', None) or getattr(source, 'code', None)
+            if isinstance(status, int):
+                return status, getattr(response, 'headers', None) or getattr(candidate, 'headers', None)
+    match = re.search(r'HTTP Error (\d{3})', str(error))
+    return (int(match.group(1)), None) if match else (None, None)
+
+def parse_retry_after(headers, now=None):
+    # Delta-seconds or an HTTP-date; now is the time.time() the date is measured from
+    value = headers.get('Retry-After') if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - (time.time() if now is None else now))
+    except (TypeError, ValueError):
+        return None
+
+def is_connection_error(error):
+    # True when no HTTP response came back: refused or reset connections, timeouts, dead proxies
+    if get_error_response(error)[0] is not None:
+        return False
+    if any(isinstance(candidate, CONNECTION_ERROR_TYPES) for candidate in get_error_chain(error)):
+        return True
+    # yt-dlp often reports network trouble only in the message
+    return isinstance(error, yt_dlp.utils.DownloadError) and \
+        any(marker in str(error).lower() for marker in CONNECTION_ERROR_MARKERS)
+
+def is_retryable(error):
+    status, _ = get_error_response(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    if isinstance(error, yt_dlp.utils.DownloadError):
+        return any(marker in str(error) for marker in TRANSIENT_ERROR_MARKERS)
+    return True
+
+def get_retry_delay(error, bucket, backoff, deadline=None, quiet=False):
+    # Throttling opens the bucket's circuit for every worker and returns 0, since the next
+    # acquire() waits it out; other errors return how long this caller alone should back off
+    status, headers = get_error_response(error)
+    retry_after = parse_retry_after(headers)
+    if status == 429 or (status in RETRYABLE_STATUSES and retry_after is not None):
+        pause = bucket.on_throttled(retry_after)
+        if not quiet:
+            print(f"Throttled by {bucket.name} (HTTP {status}). All workers pausing {pause:.1f} seconds...")
+        return 0.0
+    delay = backoff.next_delay()
+    if deadline is not None:
+        delay = min(delay, max(0, deadline - bucket.clock()))
+    if not quiet:
+        print(f"Error: {type(error).__name__}. Retrying in {delay:.1f} seconds...")
+    return delay
+
+def wait_before_retry(error, bucket, backoff, attempt=None, deadline=None, quiet=False, sleep=time.sleep):
+    delay = get_retry_delay(error, bucket, backoff, deadline=deadline, quiet=quiet)
+    if delay:
+        with span('backoff', reason=type(error).__name__, attempt=attempt):
+            sleep(delay)
+
+async def acquire_async(bucket, deadline=None):
+    # AdaptiveTokenBucket.acquire() for coroutines: waits with asyncio.sleep so the event loop keeps going
+    while True:
+        wait_time = bucket.try_acquire()
+        if wait_time <= 0:
+            return True
+        if deadline is not None and bucket.clock() + wait_time >= deadline:
+            await asyncio.sleep(max(0, deadline - bucket.clock()))
+            return False
+        await asyncio.sleep(wait_time)
+
+def call_with_retry(func, bucket, max_attempts=DEFAULT_MAX_ATTEMPTS, retry_on=(Exception,),
+                    base_delay=DEFAULT_BASE_DELAY, max_delay=MAX_RETRY_DELAY):
+    # Runs func() under the bucket's rate limit, retrying retryable errors up to max_attempts times
+    backoff = Backoff(base_delay, max_delay)
+    for attempt in range(1, max_attempts + 1):
+        bucket.acquire()
+        try:
+            result = func()
+        except retry_on as e:
+            if attempt == max_attempts or not is_retryable(e):
+                raise
+            print(f"Error occurred: {str(e)}. Retrying... (Attempt {attempt}/{max_attempts})")
+            wait_before_retry(e, bucket, backoff, attempt=attempt, quiet=True)
+            continue
+        bucket.on_success()
+        return result
+
+def get_stats():
+    with buckets_lock:
+        return {bucket.name: {'rate': bucket.rate, 'throttled': bucket.throttle_count} for bucket in buckets.values()}
+
+def report():
+    throttled = {name: stats for name, stats in get_stats().items() if stats['throttled']}
+    for name, stats in throttled.items():
+        rate = f", rate now {stats['rate']:.2f}/s" if stats['rate'] is not None else ""
+        print(f"Throttled {stats['throttled']} time(s) by {name}{rate}")
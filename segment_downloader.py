@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from client_pool import get_session
+from rate_limiter import TRANSFER_BASE_DELAY, Backoff, get_bucket, get_error_response, is_retryable, wait_before_retry
+
+DEFAULT_CONNECTIONS = 4
+DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024  # 8 MB, googlevideo throttles much larger ranges
+READ_CHUNK_SIZE = 256 * 1024
+DEFAULT_TIMEOUT = 30
+
+def get_content_length(session, url, timeout=DEFAULT_TIMEOUT):
+    # A one-byte range request tells us both the size and whether the server honours ranges
+    with session.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        content_range = r.headers.get('Content-Range')
+        if r.status_code == 206 and content_range and '/' in content_range:
+            total = content_range.rsplit('/', 1)[1]
+            if total != '*':
+                return int(total), True
+        content_length = r.headers.get('Content-Length')
+        return (int(content_length) if content_length else None), False
+
+def split_ranges(total_size, segment_size=DEFAULT_SEGMENT_SIZE):
+    return [(start, min(start + segment_size, total_size) - 1) for start in range(0, total_size, segment_size)]
+
+def fetch_range(session, url, start, end, sink, stop_event=None, timeout=DEFAULT_TIMEOUT):
+    # Streams bytes start..end (inclusive) into sink(offset, data); returns the number of bytes received
+    headers = {'Range': f"bytes={start}-{end}"} if end is not None else {'Range': f"bytes={start}-"}
+    received = 0
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        if r.status_code != 206 and start > 0:
+            raise requests.exceptions.HTTPError(f"Server ignored range request (status {r.status_code})")
+        for chunk in r.iter_content(chunk_size=READ_CHUNK_SIZE):
+            if stop_event is not None and stop_event.is_set():
+                break
+            if not chunk:
+                continue
+            sink(start + received, chunk)
+            received += len(chunk)
+    return received
+
+class FileWriter:
+    # Writes each chunk straight to its offset in a preallocated file
+
+    def __init__(self, filename, total_size):
+        mode = 'r+b' if os.path.exists(filename) else 'w+b'
+        self.file = open(filename, mode)
+        if os.fstat(self.file.fileno()).st_size != total_size:
+            self.file.truncate(total_size)
+        self.fd = self.file.fileno()
+        self.lock = threading.Lock()
+
+    def write(self, offset, data):
+        if hasattr(os, 'pwrite'):
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(self.fd, view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            with self.lock:
+                self.file.seek(offset)
+                self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+def load_state(state_filename, part_filename, total_size, segment_size):
+    # State maps each segment start to the number of bytes already on disk for it. Those bytes live
+    # in part_filename, so a state whose part file is gone or shorter is stale and is deleted;
+    # trusting it would leave the segments it marks done as zeros in a fresh file.
+    if os.path.exists(state_filename):
+        if not os.path.exists(part_filename) or os.path.getsize(part_filename) < total_size:
+            os.remove(state_filename)
+        else:
+            try:
+                with open(state_filename, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get('total_size') == total_size and state.get('segment_size') == segment_size:
+                    return {int(start): done for start, done in state['segments'].items()}
+            except (ValueError, KeyError, OSError):
+                pass
+    return {start: 0 for start, _ in split_ranges(total_size, segment_size)}
+
+def save_state(state_filename, total_size, segment_size, segments):
+    temp_filename = state_filename + '.tmp'
+    with open(temp_filename, 'w', encoding='utf-8') as f:
+        json.dump({'total_size': total_size, 'segment_size': segment_size,
+                   'segments': {str(start): done for start, done in segments.items()}}, f)
+    os.replace(temp_filename, state_filename)
+
+def download_file(url, output_filename, connections=DEFAULT_CONNECTIONS, segment_size=DEFAULT_SEGMENT_SIZE,
+                  proxy=None, max_retries=3, session=None):
+    session = session or get_session(proxy)
+    total_size, supports_ranges = get_content_length(session, url)
+    if not total_size or not supports_ranges:
+        # Fall back to one plain stream when the server cannot split the file
+        connections = 1
+        segment_size = total_size or 0
+
+    if total_size and os.path.exists(output_filename) and os.path.getsize(output_filename) == total_size:
+        return total_size
+
+    part_filename = output_filename + '.part'
+    state_filename = part_filename + '.json'
+
+    if not total_size:
+        with open(part_filename, 'wb') as f:
+            received = fetch_range(session, url, 0, None, lambda offset, data: f.write(data))
+        os.replace(part_filename, output_filename)
+        return received
+
+    segments = load_state(state_filename, part_filename, total_size, segment_size) if supports_ranges else {0: 0}
+    ranges = dict(split_ranges(total_size, segment_size))
+    state_lock = threading.Lock()
+    writer = FileWriter(part_filename, total_size)
+    # One bucket per CDN host and proxy: a 429 on any segment pauses every connection to it
+    bucket = get_bucket(url, proxy)
+    backoff = Backoff(TRANSFER_BASE_DELAY)
+
+    def fetch_segment(start):
+        end = ranges[start]
+
+        def sink(offset, data):
+            writer.write(offset, data)
+            with state_lock:
+                segments[start] += len(data)
+
+        bucket.acquire()
+        fetch_range(session, url, start + segments[start], end, sink)
+        with state_lock:
+            save_state(state_filename, total_size, segment_size, segments)
+        if segments[start] < end - start + 1:
+            raise requests.exceptions.ConnectionError(f"Segment {start}-{end} ended early")
+        bucket.on_success()
+
+    try:
+        for attempt in range(max_retries):
+            if not supports_ranges:
+                segments[0] = 0  # Without ranges a retry can only start over
+            pending = [start for start, done in segments.items() if done < ranges[start] - start + 1]
+            if not pending:
+                break
+            errors = []
+            with ThreadPoolExecutor(max_workers=connections) as executor:
+                for future in [executor.submit(fetch_segment, start) for start in pending]:
+                    try:
+                        future.result()
+                    except (requests.exceptions.RequestException, OSError) as e:
+                        errors.append(e)
+            if not errors:
+                break
+            # A throttled segment decides the wait, since it pauses the whole host
+            error = max(errors, key=lambda e: get_error_response(e)[0] == 429)
+            if attempt < max_retries - 1 and is_retryable(error):
+                print(f"{len(errors)} segment(s) failed: {error}. Resuming... (Attempt {attempt + 1}/{max_retries})")
+                wait_before_retry(error, bucket, backoff, attempt=attempt + 1, quiet=True)
+            else:
+                raise error
+    finally:
+        writer.close()
+        with state_lock:
+            save_state(state_filename, total_size, segment_size, segments)
+
+    if any(done < ranges[start] - start + 1 for start, done in segments.items()):
+        raise requests.exceptions.ConnectionError(f"Download of {output_filename} is incomplete")
+
+    # State first: a crash in between leaves a part file without state, which is downloaded again
+    os.remove(state_filename)
+    os.replace(part_filename, output_filename)
+    return total_size
@@ -0,0 +1,185 @@
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import client_pool
+from rate_limiter import TRANSFER_BASE_DELAY, Backoff, get_bucket, wait_before_retry
+from segment_downloader import get_content_length, split_ranges, fetch_range
+from throughput_stats import ThroughputRecorder
+
+DEFAULT_DURATION = 10
+CHUNK_SIZE = 3 * 1024 * 1024  # 1 MB
+RECEIVE_MODES = ["iter", "readinto"]
+
+def iter_received_sizes(r, receive_mode, buffer):
+    # Yields the size of every chunk received. "iter" lets requests allocate a new bytes object per
+    # chunk; "readinto" has the socket fill one reused buffer, so nothing is allocated or copied
+    # after the kernel hands the data over and it is simply discarded.
+    if receive_mode == "readinto":
+        # urllib3's public readinto() goes through read() and copies, which costs as much as "iter".
+        # So this reads the private http.client response (r.raw._fp) and does urllib3's bookkeeping
+        # itself: a body cut short raises, and a fully read connection goes back to the pool.
+        # Encoded bodies, and urllib3 versions without _fp, use the public readinto().
+        fp = getattr(r.raw, '_fp', None)
+        if fp is None or not hasattr(fp, 'length') or r.headers.get('Content-Encoding', 'identity') != 'identity':
+            fp = r.raw
+        view = memoryview(buffer)
+        while True:
+            received = fp.readinto(view)
+            if not received:
+                break
+            yield received
+        if fp is not r.raw:
+            if fp.length:
+                raise requests.exceptions.ConnectionError(f"Response ended {fp.length} bytes early")
+            r.raw.release_conn()
+    else:
+        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+            if chunk:
+                yield len(chunk)
+
+def measure_download_speed(url, duration=DEFAULT_DURATION, proxy=None, quiet=False, recorder=None, receive_mode="iter"):
+    recorder = recorder or ThroughputRecorder()
+    buffer = bytearray(CHUNK_SIZE) if receive_mode == "readinto" else None
+    # Media is never compressed; asking for identity keeps readinto() seeing the raw body
+    headers = {'Accept-Encoding': 'identity'}
+    cpu_start = time.process_time()
+    start_time = recorder.start()
+    downloaded = 0
+    deadline = time.monotonic() + duration
+    last_update_time = start_time
+    last_chunk_time = 0
+    # Shared with every other connection to the same host, so a 429 pauses all of them
+    bucket = get_bucket(url, proxy)
+    backoff = Backoff(TRANSFER_BASE_DELAY, max_delay=duration / 2)
+
+    # Reconnects reuse the pooled keep-alive connection instead of a new TCP/TLS handshake
+    session = client_pool.get_session(proxy)
+
+    try:
+        while time.perf_counter() - start_time < duration:
+            if not bucket.acquire(deadline=deadline):
+                break
+            try:
+                recorder.request_started()
+                with session.get(url, stream=True, timeout=10, headers=headers) as r:
+                    r.raise_for_status()
+                    chunk_start = time.perf_counter()  # Move this outside the for loop
+                    for chunk_size in iter_received_sizes(r, receive_mode, buffer):
+                        current_time = time.perf_counter()
+                        chunk_time = current_time - chunk_start
+                        last_chunk_time = chunk_time  # Store the last chunk time
+                        downloaded += chunk_size
+                        recorder.record_chunk(chunk_size, chunk_time, current_time)
+                        elapsed_time = current_time - start_time
+                        if elapsed_time >= duration:
+                            break
+                        if not quiet and current_time - last_update_time >= 1:  # Update display every second
+                            speed = downloaded / elapsed_time / 1024 / 1024  # MB/s
+                            remaining_time = max(0, duration - elapsed_time)
+                            sys.stdout.write(f"\rDownloaded: {downloaded/1024/1024:.2f} MB, Current Speed: {speed:.2f} MB/s, Peak Speed: {recorder.peak_speed:.2f} MB/s, Time left: {remaining_time:.0f}s, Last chunk time: {last_chunk_time:.4f}s\n")
+                            sys.stdout.flush()
+                            last_update_time = current_time
+                        chunk_start = current_time  # Set the start time for the next chunk
+                bucket.on_success()
+                backoff.reset()
+            except requests.RequestException as e:
+                wait_before_retry(e, bucket, backoff, deadline=deadline, quiet=quiet)
+    except KeyboardInterrupt:
+        print("\nTest interrupted by user.")
+
+    total_time = recorder.finish() - start_time
+    recorder.cpu_time += time.process_time() - cpu_start
+    avg_speed = downloaded / total_time / 1024 / 1024  # MB/s
+
+    if not quiet:
+        print_recorder_stats(recorder)
+
+    return avg_speed, downloaded / 1024 / 1024, recorder.peak_speed  # avg speed in MB/s, downloaded in MB, peak speed in MB/s
+
+def print_recorder_stats(recorder):
+    stats = recorder.summary()
+    latency = stats['chunk_latency']
+    if latency['count']:
+        print(f"\nChunk time stats - p50: {latency['p50']:.4f}s, p95: {latency['p95']:.4f}s, p99: {latency['p99']:.4f}s, "
+              f"Min: {latency['min']:.4f}s, Max: {latency['max']:.4f}s")
+    if stats['ttfb_first'] is not None:
+        print(f"Time to first byte: {stats['ttfb_first']:.4f}s (max over reconnects: {stats['ttfb_max']:.4f}s)")
+    print(f"Stalls: {stats['stall_count']} ({stats['stall_time']:.2f}s total)")
+    if stats['cpu_seconds_per_gb'] is not None:
+        print(f"Measurement CPU cost: {stats['cpu_seconds_per_gb']:.3f} CPU-s/GB")
+
+def measure_segmented_download_speed(url, duration=DEFAULT_DURATION, proxy=None, connections=4, recorder=None):
+    recorder = recorder or ThroughputRecorder()
+    client_pool.configure(max_connections_per_host=connections)
+    session = client_pool.get_session(proxy)
+    total_size, supports_ranges = get_content_length(session, url)
+    if not total_size or not supports_ranges:
+        print("Server does not support range requests, falling back to a single connection")
+        return measure_download_speed(url, duration=duration, proxy=proxy, recorder=recorder)
+
+    ranges = split_ranges(total_size)
+    next_range = [0]
+    downloaded = [0]
+    lock = threading.Lock()
+    stop_event = threading.Event()
+
+    def worker():
+        # Each connection keeps taking the next range, wrapping around the file until the deadline.
+        # It has its own timing in the shared recorder, as in the single-connection test: the first
+        # chunk of a range gives the time to first byte, later ones the chunk time.
+        stream = recorder.add_stream()
+        backoff = Backoff(TRANSFER_BASE_DELAY, max_delay=duration / 2)
+
+        def sink(offset, data):
+            current_time = time.perf_counter()
+            with lock:
+                downloaded[0] += len(data)
+                chunk_time = current_time - stream.last_chunk_time if stream.request_time is None else None
+                stream.record_chunk(len(data), chunk_time, current_time)
+
+        while not stop_event.is_set():
+            if not bucket.acquire(deadline=deadline):
+                return
+            with lock:
+                start, end = ranges[next_range[0] % len(ranges)]
+                next_range[0] += 1
+                stream.request_started()
+            try:
+                fetch_range(session, url, start, end, sink, stop_event=stop_event)
+                bucket.on_success()
+                backoff.reset()
+            except requests.RequestException as e:
+                wait_before_retry(e, bucket, backoff, deadline=deadline, sleep=stop_event.wait)
+
+    bucket = get_bucket(url, proxy)
+    cpu_start = time.process_time()
+    start_time = recorder.start()
+    deadline = time.monotonic() + duration
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        for _ in range(connections):
+            executor.submit(worker)
+        try:
+            while time.perf_counter() - start_time < duration:
+                time.sleep(min(1, max(0, duration - (time.perf_counter() - start_time))))
+                elapsed_time = time.perf_counter() - start_time
+                speed = downloaded[0] / elapsed_time / 1024 / 1024  # MB/s
+                with lock:
+                    peak_speed = recorder.peak_speed
+                remaining_time = max(0, duration - elapsed_time)
+                sys.stdout.write(f"\rDownloaded: {downloaded[0]/1024/1024:.2f} MB, Current Speed: {speed:.2f} MB/s, Peak Speed: {peak_speed:.2f} MB/s, Time left: {remaining_time:.0f}s, Connections: {connections}\n")
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            print("\nTest interrupted by user.")
+        finally:
+            stop_event.set()
+
+    with lock:
+        total_time = recorder.finish() - start_time
+        recorder.cpu_time += time.process_time() - cpu_start
+        avg_speed = downloaded[0] / total_time / 1024 / 1024  # MB/s
+        print_recorder_stats(recorder)
+        return avg_speed, downloaded[0] / 1024 / 1024, recorder.peak_speed  # avg speed in MB/s, downloaded in MB, peak speed in MB/s
@@ -0,0 +1,181 @@
+import os
+import struct
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from client_pool import get_session
+from ffmpeg_merger import get_ffmpeg_exe, probe_media
+from segment_downloader import DEFAULT_CONNECTIONS, get_content_length, split_ranges, fetch_range
+from rate_limiter import TRANSFER_BASE_DELAY, Backoff, get_bucket, is_retryable, wait_before_retry
+
+STREAM_SEGMENT_SIZE = 2 * 1024 * 1024  # Smaller than for file downloads so the muxer gets data sooner
+STREAM_WINDOW = 2  # Segments in flight per connection; bounds memory to window * connections * segment size
+PROBE_SIZE = 64 * 1024  # Head of each input read to tell whether it can be streamed; fragmented MP4 headers are small
+MATROSKA_MAGIC = b'\x1a\x45\xdf\xa3'
+
+def is_streaming_supported():
+    # Feeding both inputs through extra pipe descriptors needs POSIX fd inheritance
+    return os.name == 'posix' and get_ffmpeg_exe() is not None
+
+def iter_boxes(data):
+    # (type, body) of the MP4 boxes at one level; the last body is cut short if data ends inside it
+    offset = 0
+    while offset + 8 <= len(data):
+        size, kind = struct.unpack('>I4s', data[offset:offset + 8])
+        header = 8
+        if size == 1:
+            if offset + 16 > len(data):
+                return
+            size = struct.unpack('>Q', data[offset + 8:offset + 16])[0]
+            header = 16
+        elif size == 0:
+            size = len(data) - offset  # The box runs to the end of the file
+        if size < header:
+            return
+        yield kind, data[offset + header:offset + size]
+        offset += size
+
+def is_streamable_head(head):
+    # ffmpeg can only demux a pipe front to back. WebM does that; MP4 only when it is fragmented
+    # (moov announces fragments with mvex, as in YouTube's DASH formats). A plain MP4 has its
+    # sample index in moov, often at the end, and then ffmpeg writes a file without frames.
+    if head.startswith(MATROSKA_MAGIC):
+        return True
+    for kind, body in iter_boxes(head):
+        if kind == b'moov':
+            return any(child == b'mvex' for child, _ in iter_boxes(body))
+        if kind in (b'moof', b'mdat'):
+            return kind == b'moof'
+    return False
+
+def is_streamable(url, proxy=None):
+    head = bytearray()
+    stop_event = threading.Event()
+
+    def sink(offset, data):
+        head.extend(data)
+        if len(head) >= PROBE_SIZE:
+            stop_event.set()  # Servers without Range support send the whole file
+
+    fetch_range(get_session(proxy), url, 0, PROBE_SIZE - 1, sink, stop_event=stop_event)
+    return is_streamable_head(bytes(head[:PROBE_SIZE]))
+
+def write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+def fetch_segment(session, url, start, end, max_retries=3, proxy=None):
+    # Downloads one segment into memory, resuming from the last byte received on errors
+    buffer = bytearray(end - start + 1)
+    received = [0]
+    bucket = get_bucket(url, proxy)
+    backoff = Backoff(TRANSFER_BASE_DELAY)
+
+    def sink(offset, data):
+        buffer[offset - start:offset - start + len(data)] = data
+        received[0] = offset - start + len(data)
+
+    for attempt in range(max_retries):
+        bucket.acquire()
+        try:
+            fetch_range(session, url, start + received[0], end, sink)
+            if received[0] == len(buffer):
+                bucket.on_success()
+                return buffer
+            raise requests.exceptions.ConnectionError(f"Segment {start}-{end} ended early")
+        except requests.exceptions.RequestException as e:
+            if attempt == max_retries - 1 or not is_retryable(e):
+                raise
+            wait_before_retry(e, bucket, backoff, attempt=attempt + 1, quiet=True)
+
+def stream_url_to_fd(url, fd, connections=DEFAULT_CONNECTIONS, segment_size=STREAM_SEGMENT_SIZE, proxy=None):
+    # Fetches ranges in parallel but writes them to fd strictly in order, so the reader sees one stream
+    session = get_session(proxy)
+    try:
+        total_size, supports_ranges = get_content_length(session, url)
+        if not total_size or not supports_ranges:
+            fetch_range(session, url, 0, None, lambda offset, data: write_all(fd, data))
+            return
+
+        ranges = iter(split_ranges(total_size, segment_size))
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            try:
+                for start, end in ranges:
+                    in_flight.append(executor.submit(fetch_segment, session, url, start, end, proxy=proxy))
+                    if len(in_flight) >= connections * STREAM_WINDOW:
+                        write_all(fd, in_flight.popleft().result())
+                while in_flight:
+                    write_all(fd, in_flight.popleft().result())
+            finally:
+                for future in in_flight:
+                    future.cancel()
+    finally:
+        os.close(fd)
+
+def merge_video_audio_streaming(video_url, audio_url, output_filename, connections=DEFAULT_CONNECTIONS, proxy=None):
+    ffmpeg = get_ffmpeg_exe()
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg executable not found")
+
+    print("Downloading and remuxing with ffmpeg while streams arrive...")
+    pipes = [os.pipe() for _ in ([video_url, audio_url] if audio_url else [video_url])]
+    command = [ffmpeg, '-y', '-loglevel', 'error']
+    for read_fd, _ in pipes:
+        command += ['-i', f"pipe:{read_fd}"]
+    if audio_url:
+        command += ['-map', '0:v:0', '-map', '1:a:0']
+    command += ['-c', 'copy']
+    if output_filename.lower().endswith('.mp4'):
+        # Fragmented MP4 is written front to back, with no index to patch in at the end
+        command += ['-movflags', 'frag_keyframe+empty_moov+default_base_moof']
+    command.append(output_filename)
+
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               pass_fds=[read_fd for read_fd, _ in pipes])
+    for read_fd, _ in pipes:
+        os.close(read_fd)
+
+    errors = []
+
+    def feed(url, write_fd):
+        try:
+            stream_url_to_fd(url, write_fd, connections=connections, proxy=proxy)
+        except BrokenPipeError:
+            pass  # ffmpeg exited early; its own error is reported below
+        except Exception as e:
+            errors.append(e)
+
+    feeders = [threading.Thread(target=feed, args=(url, write_fd), daemon=True)
+               for url, (_, write_fd) in zip([video_url, audio_url], pipes)]
+    for feeder in feeders:
+        feeder.start()
+
+    stderr = process.stderr.read().decode('utf-8', errors='replace')
+    process.wait()
+    for feeder in feeders:
+        feeder.join()
+
+    if errors or process.returncode != 0:
+        # Do not leave a truncated file behind that looks like a finished download
+        if os.path.exists(output_filename):
+            os.remove(output_filename)
+    if errors:
+        raise errors[0]
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed with exit code {process.returncode}: {stderr.strip()}")
+
+    # ffmpeg can exit 0 on input it could not demux from a pipe, leaving a file with no frames
+    duration, kinds = probe_media(output_filename)
+    expected = {'video', 'audio'} if audio_url else {'video'}
+    if not duration or not expected <= kinds:
+        os.remove(output_filename)
+        raise RuntimeError(f"Streamed merge wrote no playable media (duration: {duration}, "
+                           f"streams: {', '.join(sorted(kinds)) or 'none'}) {stderr.strip()}".strip())
+    print(f"Video saved as {output_filename}")
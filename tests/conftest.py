@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root, next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_server import FakeYouTubeServer
+
+MEDIA_SIZE = 3 * 1024 * 1024 + 12345  # Not a multiple of any segment size used in the tests
+
+@pytest.fixture
+def media_file(tmp_path):
+    path = tmp_path / "media.bin"
+    path.write_bytes(os.urandom(MEDIA_SIZE))
+    return str(path)
+
+@pytest.fixture
+def fake_server(media_file):
+    # Serves media_file as both /media/video.mp4 and /media/audio.m4a
+    server = FakeYouTubeServer(media_file, media_file).start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def media_url(fake_server):
+    return f"{fake_server.base_url}/media/video.mp4"
@@ -0,0 +1,47 @@
+import pytest
+
+from async_transfer import check_proxy, measure_download_speed_sync
+from throughput_stats import ThroughputRecorder
+
+RATE = 1024 * 1024  # Bytes per second per connection
+SLACK = 256 * 1024  # Bytes a stream may leave unread in socket buffers when the deadline cancels it
+
+def test_measurement_adds_up_every_stream(fake_server, media_url):
+    # Limited per connection, so several streams only go faster by running in parallel
+    fake_server.rate = RATE
+    streams = 3
+    recorder = ThroughputRecorder()
+    avg_speed, downloaded_mb, peak_speed = measure_download_speed_sync(media_url, duration=1.5, streams=streams,
+                                                                       recorder=recorder)
+
+    stats, _ = fake_server.get_stats()
+    assert stats['media_requests'] == streams
+    assert downloaded_mb * 1024 * 1024 == recorder.total_bytes
+    assert stats['bytes_sent'] - streams * SLACK <= recorder.total_bytes <= stats['bytes_sent']
+    assert recorder.total_bytes > 2 * 1.5 * RATE
+    assert 0 < avg_speed <= peak_speed
+    # Every stream times its own first byte; none of them waits long enough to count as a stall
+    assert 0 < recorder.ttfb_first <= recorder.ttfb_max < 1
+    assert recorder.stall_count == 0
+
+def test_socks_proxies_are_rejected():
+    with pytest.raises(ValueError):
+        check_proxy("socks5://127.0.0.1:9150")
+    assert check_proxy("http://127.0.0.1:8080") == "http://127.0.0.1:8080"
+
+def test_streams_time_their_own_first_byte_and_stalls():
+    recorder = ThroughputRecorder(stall_threshold=1.0)
+    recorder.start(now=0.0)
+    first, second = recorder.add_stream(), recorder.add_stream()
+    first.request_started(now=0.0)
+    second.request_started(now=0.5)
+    first.record_chunk(100, now=0.1)
+    second.record_chunk(100, now=0.8)
+    first.record_chunk(100, now=1.0)  # 0.9s after this stream's last chunk
+    second.record_chunk(100, now=2.0)  # 1.2s after this stream's last chunk
+
+    assert recorder.ttfb_first == pytest.approx(0.1)
+    assert recorder.ttfb_max == pytest.approx(0.3)
+    assert recorder.stall_count == 1
+    assert recorder.stall_time == pytest.approx(1.2)
+    assert recorder.total_bytes == 400
@@ -0,0 +1,118 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.fake_server import FakeYouTubeServer, make_media
+from checkpoint_journal import CheckpointJournal, get_journal_path
+from ffmpeg_merger import get_ffmpeg_exe
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def write_output(path, data=b"merged video"):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+def test_journal_path_sits_next_to_the_result_file():
+    assert get_journal_path(os.path.join("out", "done.txt")) == os.path.join("out", "done.journal.jsonl")
+
+def test_success_is_complete_after_reopening(tmp_path):
+    output = write_output(tmp_path / "a.mp4")
+    with CheckpointJournal(str(tmp_path / "done.journal.jsonl")).open() as journal:
+        journal.record("a", "https://youtu.be/a", "SUCCESS", output)
+        journal.record("b", "https://youtu.be/b", "FAILED", None)
+
+    journal = CheckpointJournal(str(tmp_path / "done.journal.jsonl"))
+    journal.load()
+    assert journal.is_complete("a")
+    # Failed and unknown videos are retried
+    assert not journal.is_complete("b")
+    assert not journal.is_complete("c")
+
+def test_later_record_replaces_an_earlier_one(tmp_path):
+    output = write_output(tmp_path / "a.mp4")
+    with CheckpointJournal(str(tmp_path / "done.journal.jsonl")).open() as journal:
+        journal.record("a", "https://youtu.be/a", "FAILED", None)
+        journal.record("a", "https://youtu.be/a", "SUCCESS", output)
+
+    journal = CheckpointJournal(str(tmp_path / "done.journal.jsonl"))
+    journal.load()
+    assert journal.is_complete("a")
+
+def test_missing_or_changed_output_is_not_complete(tmp_path):
+    deleted = write_output(tmp_path / "a.mp4")
+    changed = write_output(tmp_path / "b.mp4")
+    with CheckpointJournal(str(tmp_path / "done.journal.jsonl")).open() as journal:
+        journal.record("a", "https://youtu.be/a", "SUCCESS", deleted)
+        journal.record("b", "https://youtu.be/b", "SUCCESS", changed)
+    os.remove(deleted)
+    write_output(changed, b"truncated")
+
+    journal = CheckpointJournal(str(tmp_path / "done.journal.jsonl"))
+    journal.load()
+    assert not journal.is_complete("a")
+    assert not journal.is_complete("b")
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / "done.journal.jsonl")
+    output = write_output(tmp_path / "a.mp4")
+    with CheckpointJournal(path).open() as journal:
+        journal.record("a", "https://youtu.be/a", "SUCCESS", output)
+    # A crash in the middle of the next write
+    with open(path, 'ab') as f:
+        f.write(b'{"video_id": "b", "status": "SUC')
+
+    with CheckpointJournal(path).open() as journal:
+        assert journal.is_complete("a")
+        assert not journal.is_complete("b")
+        journal.record("c", "https://youtu.be/c", "SUCCESS", output)
+
+    journal = CheckpointJournal(path)
+    assert set(journal.load()) == {"a", "c"}
+
+def test_restart_forgets_earlier_records(tmp_path):
+    path = str(tmp_path / "done.journal.jsonl")
+    output = write_output(tmp_path / "a.mp4")
+    with CheckpointJournal(path).open() as journal:
+        journal.record("a", "https://youtu.be/a", "SUCCESS", output)
+
+    with CheckpointJournal(path).open(restart=True) as journal:
+        assert not journal.is_complete("a")
+    assert os.path.getsize(path) == 0
+
+@pytest.mark.skipif(not get_ffmpeg_exe(), reason="ffmpeg executable not found")
+def test_download_skips_completed_videos_and_retries_the_rest(tmp_path):
+    video_path, audio_path = make_media(str(tmp_path / "media"), seconds=1, video_bitrate="1M")
+    server = FakeYouTubeServer(video_path, audio_path, videos=3).start()
+    try:
+        input_file = tmp_path / "videos.txt"
+        input_file.write_text("\n".join(server.video_urls()) + "\n", encoding='utf-8')
+        output_dir = tmp_path / "output"
+        command = [sys.executable, '-m', 'benchmarks.run_tool', 'main_download', '--input', str(input_file),
+                   '--output-dir', str(output_dir), '--output-result', str(tmp_path / "done.txt"),
+                   '--no-store', '--no-cache']
+        env = dict(os.environ, FAKE_YOUTUBE_SERVER=server.base_url, BENCHMARK_CACHE_DIR=str(tmp_path / "cache"))
+
+        def run():
+            server.reset_stats()
+            subprocess.run(command, cwd=REPO_DIR, env=env, check=True, capture_output=True)
+            stats, _ = server.get_stats()
+            return stats['media_requests']
+
+        first_run = run()
+        assert first_run > 0
+        outputs = sorted(name for name in os.listdir(output_dir) if not name.startswith("."))
+        assert len(outputs) == 3
+
+        # Everything is in the journal and still on disk, so nothing is fetched again
+        assert run() == 0
+
+        # Only the video whose output went missing is downloaded again
+        os.remove(output_dir / outputs[0])
+        assert run() == first_run // 3
+        assert sorted(name for name in os.listdir(output_dir) if not name.startswith(".")) == outputs
+        assert run() == 0
+    finally:
+        server.stop()
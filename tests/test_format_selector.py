@@ -0,0 +1,108 @@
+import random
+
+import pytest
+
+from benchmarks.format_selection import make_info
+from format_selector import SelectionPolicy, select_format
+from format_table import FormatTable, select_formats
+
+def video(format_id, height, tbr, vcodec='avc1.64001f', filesize=None, acodec='none'):
+    return {'format_id': format_id, 'vcodec': vcodec, 'acodec': acodec, 'height': height, 'tbr': tbr,
+            'filesize': filesize}
+
+def audio(format_id, abr, acodec='mp4a.40.2', filesize=None):
+    return {'format_id': format_id, 'vcodec': 'none', 'acodec': acodec, 'abr': abr, 'tbr': abr, 'filesize': filesize}
+
+def select(formats, policy=None, duration=100):
+    # Both selection paths must agree; returns the chosen format_ids
+    info = {'duration': duration, 'formats': formats}
+    best_video, best_audio = select_format(info, policy)
+    assert select_formats([info], policy) == [(best_video, best_audio)]
+    return (best_video or {}).get('format_id'), (best_audio or {}).get('format_id')
+
+FORMATS = [
+    audio('a48', 48), audio('a128', 128), audio('a160o', 160, acodec='opus'),
+    video('360', 360, 500), video('720', 720, 1500), video('720hi', 720, 2500),
+    video('1080', 1080, 3000), video('1080vp9', 1080, 2800, vcodec='vp09.00.40.08'),
+]
+
+def test_default_picks_highest_resolution_then_bitrate():
+    assert select(FORMATS) == ('1080', 'a160o')
+    assert select(FORMATS[:6]) == ('720hi', 'a160o')
+
+def test_no_formats():
+    assert select([]) == (None, None)
+    assert select([audio('a128', 128)]) == (None, 'a128')
+    assert select_formats([]) == []
+
+def test_ties_go_to_the_earliest_format():
+    assert select([video('first', 720, 1500), video('second', 720, 1500)]) == ('first', None)
+
+def test_formats_without_height_are_not_videos():
+    assert select([video('storyboard', None, 10000), video('360', 360, 500)]) == ('360', None)
+
+def test_max_height_is_a_hard_limit():
+    assert select(FORMATS, SelectionPolicy(max_height=720)) == ('720hi', 'a160o')
+    assert select(FORMATS, SelectionPolicy(max_height=240)) == (None, 'a160o')
+
+def test_codec_priority_breaks_ties_at_the_same_height():
+    assert select(FORMATS, SelectionPolicy(codec_priority=['vp09', 'avc1'])) == ('1080vp9', 'a160o')
+    # It never beats a higher resolution
+    assert select(FORMATS, SelectionPolicy(codec_priority=['av01'])) == ('1080', 'a160o')
+
+def test_codec_limits_drop_the_preference_above_them():
+    assert select(FORMATS, SelectionPolicy(codec_priority=['vp09'], codec_max_height={'vp09': 720})) == ('1080', 'a160o')
+    assert select(FORMATS, SelectionPolicy(codec_priority=['vp09'], codec_max_tbr={'vp09': 2000})) == ('1080', 'a160o')
+    assert select(FORMATS, SelectionPolicy(codec_priority=['vp09'], codec_max_tbr={'vp09': 3000})) == ('1080vp9', 'a160o')
+
+def test_bitrate_budget_falls_back_to_the_smallest_overshoot():
+    assert select(FORMATS, SelectionPolicy(max_video_tbr=2600)) == ('720hi', 'a160o')
+    assert select(FORMATS, SelectionPolicy(max_video_tbr=100)) == ('360', 'a160o')
+
+def test_size_budget_counts_the_audio_of_video_only_formats():
+    formats = [audio('a128', 128, filesize=2000), video('720', 720, 1500, filesize=9000),
+               video('1080', 1080, 3000, filesize=10000)]
+    assert select(formats, SelectionPolicy(max_total_size=12000)) == ('1080', 'a128')
+    assert select(formats, SelectionPolicy(max_total_size=11500)) == ('720', 'a128')
+    # Nothing fits: the format closest to the budget, in bytes
+    assert select(formats, SelectionPolicy(max_total_size=100)) == ('720', 'a128')
+
+def test_size_budget_does_not_add_audio_to_muxed_formats():
+    formats = [audio('a128', 128, filesize=5000), video('360', 360, 500, filesize=4000),
+               video('720muxed', 720, 1500, filesize=9000, acodec='mp4a.40.2')]
+    assert select(formats, SelectionPolicy(max_total_size=10000)) == ('720muxed', 'a128')
+
+def test_size_budget_estimates_missing_sizes_from_the_bitrate():
+    # 3000 kbit/s for 100 s is 37.5 MB, 1500 kbit/s is 18.75 MB
+    formats = [video('720', 720, 1500), video('1080', 1080, 3000)]
+    assert select(formats, SelectionPolicy(max_total_size=30 * 1000 * 1000)) == ('720', None)
+    # Without a duration the size is unknown, which counts as fitting
+    assert select(formats, SelectionPolicy(max_total_size=30 * 1000 * 1000), duration=None) == ('1080', None)
+
+def test_container_prefers_stream_copy_compatible_codecs():
+    formats = [audio('a160o', 160, acodec='opus'), audio('a128', 128), video('1080', 1080, 3000),
+               video('720vp9', 720, 1500, vcodec='vp09.00.40.08')]
+    # avc1 and AAC cannot go into WebM, so lower quality that can is preferred
+    assert select(formats, SelectionPolicy(container='webm')) == ('720vp9', 'a160o')
+    # MP4 holds all of them
+    assert select(formats, SelectionPolicy(container='mp4')) == ('1080', 'a160o')
+    # An incompatible format is still used when nothing else exists
+    assert select(formats[1:3], SelectionPolicy(container='webm')) == ('1080', 'a128')
+
+@pytest.mark.parametrize('policy', [
+    SelectionPolicy(),
+    SelectionPolicy(max_height=720),
+    SelectionPolicy(codec_priority=['av01', 'vp09', 'avc1']),
+    SelectionPolicy(codec_priority=['av01', 'vp09'], codec_max_height={'av01': 720}, codec_max_tbr={'vp09': 2000}),
+    SelectionPolicy(max_video_tbr=1500),
+    SelectionPolicy(max_total_size=50 * 1024 * 1024),
+    SelectionPolicy(container='webm'),
+])
+def test_format_table_matches_select_format(policy):
+    rng = random.Random(7)
+    infos = [make_info(rng, index) for index in range(300)]
+    infos[0] = dict(infos[0], duration=None)
+    infos[1] = dict(infos[1], formats=[])
+    table = FormatTable.from_infos(infos)
+    assert len(table) == sum(len(info['formats']) for info in infos)
+    assert select_formats(table, policy) == [select_format(info, policy) for info in infos]
@@ -0,0 +1,159 @@
+from email.utils import formatdate
+
+import pytest
+import requests
+import yt_dlp
+
+from rate_limiter import (MAX_THROTTLE_PAUSE, THROTTLE_PAUSE, AdaptiveTokenBucket, Backoff, get_error_response,
+                          get_retry_delay, is_connection_error, is_retryable, parse_retry_after)
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class FakeRandom:
+    # uniform(a, b) returns the point at fraction of the way from a to b
+    def __init__(self, fraction):
+        self.fraction = fraction
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.fraction
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.exceptions.HTTPError(f"{status} error", response=response)
+
+def make_bucket(clock, **kwargs):
+    return AdaptiveTokenBucket(clock=clock, rng=FakeRandom(0.0), **kwargs)
+
+def test_bucket_allows_a_burst_then_paces_at_the_rate():
+    clock = FakeClock()
+    bucket = make_bucket(clock, rate=2.0, burst=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.try_acquire() == 0.0
+    # Tokens never pile up past the burst
+    clock.now += 60
+    assert [bucket.try_acquire() for _ in range(4)][-1] == pytest.approx(0.5)
+
+def test_acquire_waits_for_a_token_and_gives_up_at_the_deadline():
+    clock = FakeClock()
+    bucket = make_bucket(clock, rate=1.0, burst=1)
+    assert bucket.acquire(sleep=clock.sleep)
+    assert bucket.acquire(sleep=clock.sleep)
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+    assert not bucket.acquire(deadline=clock.now + 0.25, sleep=clock.sleep)
+    assert clock.sleeps[-1] == pytest.approx(0.25)
+
+def test_throttling_halves_the_rate_and_success_restores_it():
+    clock = FakeClock()
+    bucket = make_bucket(clock, rate=2.0, min_rate=0.3)
+    for expected in (1.0, 0.5, 0.3, 0.3):
+        bucket.on_throttled(retry_after=0)
+        assert bucket.rate == expected
+    assert bucket.throttle_count == 4
+    # Additive increase of a tenth of the original rate, up to the original rate
+    bucket.on_success()
+    assert bucket.rate == pytest.approx(0.5)
+    for _ in range(20):
+        bucket.on_success()
+    assert bucket.rate == 2.0
+
+def test_circuit_breaker_pauses_for_retry_after():
+    clock = FakeClock()
+    bucket = make_bucket(clock, rate=None)
+    assert bucket.try_acquire() == 0.0
+    assert bucket.on_throttled(retry_after=7) == 7
+    assert bucket.try_acquire() == pytest.approx(7)
+    clock.now += 7
+    # Without a rate the bucket is unlimited once the circuit closes
+    assert [bucket.try_acquire() for _ in range(10)] == [0.0] * 10
+
+def test_circuit_breaker_backs_off_on_throttles_in_a_row():
+    clock = FakeClock()
+    bucket = AdaptiveTokenBucket(rate=None, clock=clock, rng=FakeRandom(1.0))
+    pauses = [bucket.on_throttled() for _ in range(6)]
+    # Doubling from THROTTLE_PAUSE up to the cap, plus up to 5 seconds of jitter
+    assert pauses == [min(MAX_THROTTLE_PAUSE, THROTTLE_PAUSE * 2 ** n) + 5 for n in range(6)]
+    assert bucket.try_acquire() == pytest.approx(pauses[-1])
+    # A success ends the streak
+    bucket.on_success()
+    assert bucket.on_throttled() == THROTTLE_PAUSE + 5
+
+def test_later_throttle_never_shortens_a_pause():
+    clock = FakeClock()
+    bucket = make_bucket(clock, rate=None)
+    bucket.on_throttled(retry_after=30)
+    bucket.on_throttled(retry_after=1)
+    assert bucket.try_acquire() == pytest.approx(30)
+
+def test_backoff_is_decorrelated_jitter_within_bounds():
+    highest = Backoff(1.0, max_delay=20, rng=FakeRandom(1.0))
+    assert [highest.next_delay() for _ in range(4)] == [3.0, 9.0, 20, 20]
+    highest.reset()
+    assert highest.next_delay() == 3.0
+
+    lowest = Backoff(1.0, max_delay=20, rng=FakeRandom(0.0))
+    assert [lowest.next_delay() for _ in range(3)] == [1.0, 1.0, 1.0]
+
+    middle = Backoff(1.0, max_delay=20, rng=FakeRandom(0.5))
+    # Each delay is drawn between the base and three times the previous one
+    assert [middle.next_delay() for _ in range(3)] == [2.0, 3.5, 5.75]
+
+def test_parse_retry_after():
+    now = 1_700_000_000.0
+    assert parse_retry_after({'Retry-After': '5'}, now=now) == 5.0
+    assert parse_retry_after({'Retry-After': '-3'}, now=now) == 0.0
+    assert parse_retry_after({'Retry-After': formatdate(now + 90, usegmt=True)}, now=now) == 90.0
+    assert parse_retry_after({'Retry-After': formatdate(now - 90, usegmt=True)}, now=now) == 0.0
+    assert parse_retry_after({'Retry-After': 'soon'}, now=now) is None
+    assert parse_retry_after({}, now=now) is None
+    assert parse_retry_after(None) is None
+
+def test_throttled_error_opens_the_circuit_for_every_worker():
+    clock = FakeClock()
+    bucket = make_bucket(clock, rate=None)
+    backoff = Backoff(1.0, rng=FakeRandom(1.0))
+    assert get_retry_delay(http_error(429, {'Retry-After': '12'}), bucket, backoff, quiet=True) == 0.0
+    assert bucket.try_acquire() == pytest.approx(12)
+    # A 503 with Retry-After is treated the same way
+    clock.now += 12
+    assert get_retry_delay(http_error(503, {'Retry-After': '4'}), bucket, backoff, quiet=True) == 0.0
+    assert bucket.try_acquire() == pytest.approx(4)
+
+def test_other_errors_back_off_only_the_caller():
+    clock = FakeClock()
+    bucket = make_bucket(clock, rate=None)
+    backoff = Backoff(1.0, rng=FakeRandom(1.0))
+    assert get_retry_delay(http_error(503), bucket, backoff, quiet=True) == 3.0
+    assert get_retry_delay(requests.exceptions.ConnectionError(), bucket, backoff, quiet=True) == 9.0
+    # Never past the deadline
+    assert get_retry_delay(requests.exceptions.ConnectionError(), bucket, backoff, deadline=clock.now + 2,
+                           quiet=True) == 2.0
+    assert bucket.try_acquire() == 0.0
+
+def test_error_classification():
+    assert get_error_response(http_error(429, {'Retry-After': '3'}))[0] == 429
+    assert get_error_response(yt_dlp.utils.DownloadError("ERROR: HTTP Error 403: Forbidden")) == (403, None)
+
+    assert is_retryable(http_error(503))
+    assert not is_retryable(http_error(404))
+    assert is_retryable(yt_dlp.utils.DownloadError("ERROR: Read timed out"))
+    assert not is_retryable(yt_dlp.utils.DownloadError("ERROR: Private video"))
+
+    assert is_connection_error(requests.exceptions.ConnectionError("refused"))
+    assert is_connection_error(yt_dlp.utils.DownloadError("ERROR: Unable to connect to proxy"))
+    assert not is_connection_error(http_error(503))
+    assert not is_connection_error(yt_dlp.utils.DownloadError("ERROR: Video unavailable"))
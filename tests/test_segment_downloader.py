@@ -0,0 +1,109 @@
+import json
+import os
+
+import pytest
+import requests
+
+from async_transfer import download_file_sync
+from segment_downloader import download_file, split_ranges
+
+SEGMENT_SIZE = 512 * 1024
+
+ENGINES = {'threads': download_file, 'asyncio': download_file_sync}
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_split_ranges_covers_the_file_without_gaps():
+    ranges = split_ranges(10 * SEGMENT_SIZE + 1, SEGMENT_SIZE)
+    assert len(ranges) == 11
+    assert ranges[0] == (0, SEGMENT_SIZE - 1)
+    assert ranges[-1] == (10 * SEGMENT_SIZE, 10 * SEGMENT_SIZE)
+    assert all(end + 1 == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    assert split_ranges(100, SEGMENT_SIZE) == [(0, 99)]
+    assert split_ranges(0, SEGMENT_SIZE) == []
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_ranged_download(engine, fake_server, media_url, media_file, tmp_path):
+    output = str(tmp_path / "out.mp4")
+    size = ENGINES[engine](media_url, output, connections=4, segment_size=SEGMENT_SIZE)
+
+    assert size == os.path.getsize(media_file)
+    assert read_bytes(output) == read_bytes(media_file)
+    stats, _ = fake_server.get_stats()
+    # One probe for the size plus one request per segment
+    assert stats['media_requests'] == 1 + len(split_ranges(size, SEGMENT_SIZE))
+    assert not os.path.exists(output + '.part') and not os.path.exists(output + '.part.json')
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_resume_fetches_only_missing_bytes(engine, fake_server, media_url, media_file, tmp_path):
+    output = str(tmp_path / "out.mp4")
+    size = os.path.getsize(media_file)
+
+    # Every response is cut off part way, so the first run stops with a partial file
+    fake_server.disconnect_rate = 1.0
+    with pytest.raises(Exception):
+        ENGINES[engine](media_url, output, connections=4, segment_size=SEGMENT_SIZE, max_retries=1)
+    with open(output + '.part.json', 'r', encoding='utf-8') as f:
+        received = sum(json.load(f)['segments'].values())
+    assert 0 < received < size
+    assert not os.path.exists(output)
+
+    fake_server.disconnect_rate = 0.0
+    fake_server.reset_stats()
+    ENGINES[engine](media_url, output, connections=4, segment_size=SEGMENT_SIZE)
+
+    assert read_bytes(output) == read_bytes(media_file)
+    stats, _ = fake_server.get_stats()
+    # The one-byte size probe plus exactly the bytes the first run did not get
+    assert stats['bytes_sent'] == 1 + size - received
+    assert not os.path.exists(output + '.part.json')
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_state_without_part_file_is_ignored(engine, fake_server, media_url, media_file, tmp_path):
+    output = str(tmp_path / "out.mp4")
+    size = os.path.getsize(media_file)
+
+    fake_server.disconnect_rate = 1.0
+    with pytest.raises(Exception):
+        ENGINES[engine](media_url, output, connections=4, segment_size=SEGMENT_SIZE, max_retries=1)
+    assert os.path.exists(output + '.part.json')
+    os.remove(output + '.part')
+
+    fake_server.disconnect_rate = 0.0
+    fake_server.reset_stats()
+    ENGINES[engine](media_url, output, connections=4, segment_size=SEGMENT_SIZE)
+
+    # Segments the stale state marked done are fetched again rather than left as zeros
+    assert read_bytes(output) == read_bytes(media_file)
+    stats, _ = fake_server.get_stats()
+    assert stats['bytes_sent'] == 1 + size
+    assert not os.path.exists(output + '.part.json')
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_falls_back_to_one_stream_without_ranges(engine, fake_server, media_url, media_file, tmp_path):
+    fake_server.ranges = False
+    output = str(tmp_path / "out.mp4")
+    ENGINES[engine](media_url, output, connections=4, segment_size=SEGMENT_SIZE)
+
+    assert read_bytes(output) == read_bytes(media_file)
+    stats, _ = fake_server.get_stats()
+    # The size probe gets the whole file too, then one plain stream downloads it
+    assert stats['media_requests'] == 2
+    assert not os.path.exists(output + '.part.json')
+
+def test_completed_file_is_not_downloaded_again(fake_server, media_url, tmp_path):
+    output = str(tmp_path / "out.mp4")
+    download_file(media_url, output, connections=2, segment_size=SEGMENT_SIZE)
+    fake_server.reset_stats()
+    download_file(media_url, output, connections=2, segment_size=SEGMENT_SIZE)
+
+    stats, _ = fake_server.get_stats()
+    assert stats['media_requests'] == 1
+
+def test_missing_media_is_not_retried(fake_server, tmp_path):
+    with pytest.raises(requests.exceptions.HTTPError):
+        download_file(f"{fake_server.base_url}/media/missing.mp4", str(tmp_path / "out.mp4"))
+    stats, _ = fake_server.get_stats()
+    assert stats['media_requests'] == 1
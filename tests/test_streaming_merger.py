@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.fake_server import FakeYouTubeServer, make_media
+from ffmpeg_merger import probe_media
+from streaming_merger import MATROSKA_MAGIC, is_streamable, is_streamable_head, is_streaming_supported,\
+    merge_video_audio_streaming
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytestmark = pytest.mark.skipif(not is_streaming_supported(), reason="needs ffmpeg on a POSIX system")
+
+@pytest.fixture(scope='module')
+def media(tmp_path_factory):
+    media_dir = str(tmp_path_factory.mktemp("media"))
+    plain = make_media(media_dir, seconds=1, video_bitrate="1M")
+    fragmented = make_media(media_dir, seconds=1, video_bitrate="1M", fragmented=True)
+    return plain, fragmented
+
+@pytest.fixture
+def mixed_server(media):
+    # A plain MP4 video, whose index ffmpeg cannot reach from a pipe, with fragmented audio
+    (plain_video, _), (_, fragmented_audio) = media
+    server = FakeYouTubeServer(plain_video, fragmented_audio, videos=1).start()
+    yield server
+    server.stop()
+
+def read_head(path):
+    with open(path, 'rb') as f:
+        return f.read(64 * 1024)
+
+def test_only_fragmented_mp4_and_webm_are_streamable(media):
+    (plain_video, plain_audio), (fragmented_video, fragmented_audio) = media
+    assert is_streamable_head(read_head(fragmented_video))
+    assert is_streamable_head(read_head(fragmented_audio))
+    assert not is_streamable_head(read_head(plain_video))
+    assert not is_streamable_head(read_head(plain_audio))
+    assert is_streamable_head(MATROSKA_MAGIC + b"\x00" * 32)
+    assert not is_streamable_head(b"")
+
+@pytest.mark.parametrize('ranges', [True, False])
+def test_streamable_check_against_the_server(mixed_server, ranges):
+    mixed_server.ranges = ranges
+    assert not is_streamable(f"{mixed_server.base_url}/media/video.mp4")
+    assert is_streamable(f"{mixed_server.base_url}/media/audio.m4a")
+
+def test_streamed_merge_of_fragmented_inputs(media, tmp_path):
+    _, (fragmented_video, fragmented_audio) = media
+    server = FakeYouTubeServer(fragmented_video, fragmented_audio).start()
+    try:
+        output = str(tmp_path / "out.mp4")
+        merge_video_audio_streaming(f"{server.base_url}/media/video.mp4", f"{server.base_url}/media/audio.m4a", output)
+    finally:
+        server.stop()
+
+    duration, kinds = probe_media(output)
+    assert duration > 0
+    assert kinds == {'video', 'audio'}
+
+def test_streamed_merge_without_frames_fails(mixed_server, tmp_path):
+    output = str(tmp_path / "out.mp4")
+    with pytest.raises(RuntimeError):
+        merge_video_audio_streaming(f"{mixed_server.base_url}/media/video.mp4",
+                                    f"{mixed_server.base_url}/media/audio.m4a", output)
+    assert not os.path.exists(output)
+
+def test_download_falls_back_when_an_input_is_not_fragmented(mixed_server, tmp_path):
+    input_file = tmp_path / "videos.txt"
+    input_file.write_text("\n".join(mixed_server.video_urls()) + "\n", encoding='utf-8')
+    result_file = tmp_path / "done.txt"
+    command = [sys.executable, '-m', 'benchmarks.run_tool', 'main_download', '--input', str(input_file),
+               '--output-dir', str(tmp_path / "output"), '--output-result', str(result_file),
+               '--stream-merge', '--no-store', '--no-cache']
+    env = dict(os.environ, FAKE_YOUTUBE_SERVER=mixed_server.base_url, BENCHMARK_CACHE_DIR=str(tmp_path / "cache"))
+    subprocess.run(command, cwd=REPO_DIR, env=env, check=True, capture_output=True)
+
+    video_url, status, output_path = result_file.read_text(encoding='utf-8').strip().split(',')
+    assert status == "SUCCESS"
+    duration, kinds = probe_media(output_path)
+    assert duration > 0
+    assert kinds == {'video', 'audio'}
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from speed_test import measure_segmented_download_speed
+from throughput_stats import ThroughputRecorder, percentile
+
+MB = 1024 * 1024
+
+def test_percentile():
+    values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert percentile(values, 0.5) == 5
+    assert percentile(values, 0.95) == 10
+    assert percentile(values, 0.0) == 1
+    assert percentile([], 0.5) == 0.0
+
+def test_interval_buffer_keeps_the_most_recent_intervals():
+    recorder = ThroughputRecorder(interval=1.0, max_intervals=4, peak_window=1.0)
+    recorder.start(now=0.0)
+    for second in range(10):
+        recorder.record_chunk((second + 1) * MB, now=second + 0.5)
+    recorder.finish(now=9.9)
+
+    # Only the last four seconds are left after the buffer wrapped around twice
+    assert recorder.timeseries() == [(6.0, 7.0), (7.0, 8.0), (8.0, 9.0), (9.0, 10.0)]
+    assert recorder.total_bytes == 55 * MB
+    # The peak survives the intervals it was measured in being overwritten
+    assert recorder.peak_speed == 10.0
+
+def test_chunk_latency_buffer_keeps_the_most_recent_chunks():
+    recorder = ThroughputRecorder(max_chunks=4)
+    recorder.start(now=0.0)
+    for index in range(10):
+        recorder.record_chunk(1, chunk_latency=float(index), now=index * 0.01)
+
+    latency = recorder.chunk_latency_percentiles()
+    assert latency['count'] == 10
+    assert (latency['min'], latency['p50'], latency['max']) == (6.0, 7.0, 9.0)
+
+def test_peak_is_the_busiest_window_not_the_busiest_interval():
+    recorder = ThroughputRecorder(interval=0.1, peak_window=0.5)
+    recorder.start(now=0.0)
+    # A steady 1 MB/s, then 0.3s at 10 MB/s, then steady again
+    for index in range(30):
+        now = index * 0.1 + 0.05
+        recorder.record_chunk(MB if 10 <= index < 13 else 0.1 * MB, now=now)
+    recorder.finish(now=3.0)
+
+    # The best 0.5s window holds the 3 MB burst plus two steady intervals
+    assert recorder.peak_speed == pytest.approx(3.2 / 0.5)
+    assert recorder.total_bytes == pytest.approx(3 * MB + 27 * 0.1 * MB)
+
+def test_peak_of_a_short_run_uses_the_open_window():
+    recorder = ThroughputRecorder(interval=0.1, peak_window=1.0)
+    recorder.start(now=0.0)
+    recorder.record_chunk(MB, now=0.05)
+    recorder.finish(now=0.2)
+    assert recorder.peak_speed == pytest.approx(1.0)
+
+def test_stalls_count_gaps_between_chunks_but_not_reconnects():
+    recorder = ThroughputRecorder(stall_threshold=1.0)
+    recorder.start(now=0.0)
+    recorder.request_started(now=0.0)
+    recorder.record_chunk(100, now=0.2)
+    recorder.record_chunk(100, now=0.7)
+    recorder.record_chunk(100, now=2.2)  # 1.5s gap
+    recorder.record_chunk(100, now=3.0)
+    recorder.record_chunk(100, now=5.0)  # 2.0s gap
+    # A new request waits for its first byte; that wait is TTFB, not a stall
+    recorder.request_started(now=5.0)
+    recorder.record_chunk(100, now=7.0)
+
+    assert recorder.stall_count == 2
+    assert recorder.stall_time == pytest.approx(3.5)
+    assert recorder.ttfb_first == pytest.approx(0.2)
+    assert recorder.ttfb_max == pytest.approx(2.0)
+
+def test_export(tmp_path):
+    recorder = ThroughputRecorder(interval=1.0)
+    recorder.start(now=0.0)
+    recorder.record_chunk(2 * MB, 0.01, now=0.5)
+    recorder.finish(now=1.5)
+
+    recorder.export(str(tmp_path / "run.csv"))
+    assert (tmp_path / "run.csv").read_text(encoding='utf-8').splitlines() == ['time,speed_mb_s', '0.0,2.0', '1.0,0.0']
+    recorder.export(str(tmp_path / "run.json"))
+    data = json.loads((tmp_path / "run.json").read_text(encoding='utf-8'))
+    assert data['summary']['total_bytes'] == 2 * MB
+    assert data['timeseries'] == [[0.0, 2.0], [1.0, 0.0]]
+
+def test_segmented_measurement_records_timing(fake_server, media_url):
+    fake_server.rate = MB
+    recorder = ThroughputRecorder()
+    measure_segmented_download_speed(media_url, duration=1, connections=2, recorder=recorder)
+
+    assert recorder.total_bytes > 0
+    assert recorder.ttfb_first is not None
+    assert recorder.chunk_latency_percentiles()['count'] > 0
@@ -0,0 +1,173 @@
+import csv
+import json
+import math
+import time
+from array import array
+
+DEFAULT_INTERVAL = 0.1  # Seconds per throughput sample
+DEFAULT_MAX_INTERVALS = 36000  # One hour of 100ms samples
+DEFAULT_MAX_CHUNKS = 8192  # Most recent chunk latencies kept for percentiles
+DEFAULT_PEAK_WINDOW = 1.0  # Seconds the peak speed is averaged over
+DEFAULT_STALL_THRESHOLD = 1.0  # A gap between chunks longer than this counts as a stall
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+class StreamTiming:
+    # Request and chunk times of one of several connections feeding the same ThroughputRecorder,
+    # so time to first byte and stalls are measured within each connection while bytes, peaks and
+    # chunk latencies add up across all of them
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.request_time = None
+        self.last_chunk_time = None
+
+    def request_started(self, now=None):
+        self.request_time = time.perf_counter() if now is None else now
+
+    def record_chunk(self, nbytes, chunk_latency=None, now=None):
+        self.recorder.record_chunk(nbytes, chunk_latency, now, stream=self)
+
+class ThroughputRecorder:
+    # Fixed-size, array-backed ring buffers so recording a chunk is O(1) and allocation-free,
+    # whatever the link speed or test duration.
+
+    def __init__(self, interval=DEFAULT_INTERVAL, max_intervals=DEFAULT_MAX_INTERVALS,
+                 max_chunks=DEFAULT_MAX_CHUNKS, peak_window=DEFAULT_PEAK_WINDOW,
+                 stall_threshold=DEFAULT_STALL_THRESHOLD):
+        self.interval = interval
+        self.max_intervals = max_intervals
+        self.max_chunks = max_chunks
+        self.window_intervals = max(1, min(max_intervals, round(peak_window / interval)))
+        self.stall_threshold = stall_threshold
+
+        self.interval_bytes = array('d', bytes(8 * max_intervals))
+        self.chunk_latencies = array('d', bytes(8 * max_chunks))
+        self.chunk_count = 0
+        self.current_interval = 0
+        self.window_bytes = 0.0
+        self.peak_window_bytes = 0.0
+
+        self.start_time = None
+        self.request_time = None
+        self.last_chunk_time = None
+        self.ttfb_first = None
+        self.ttfb_max = 0.0
+        self.total_bytes = 0
+        self.stall_count = 0
+        self.stall_time = 0.0
+        self.cpu_time = 0.0  # Process CPU seconds spent measuring, filled in by the caller
+
+    def start(self, now=None):
+        self.start_time = time.perf_counter() if now is None else now
+        return self.start_time
+
+    def request_started(self, now=None):
+        self.request_time = time.perf_counter() if now is None else now
+
+    def add_stream(self):
+        # Timing of one more concurrent connection; a single connection can use the recorder itself
+        return StreamTiming(self)
+
+    def advance(self, interval_index):
+        # Close every interval up to interval_index, keeping the rolling window sum for the peak
+        while self.current_interval < interval_index:
+            oldest = self.current_interval - self.window_intervals + 1
+            if self.window_bytes > self.peak_window_bytes:
+                self.peak_window_bytes = self.window_bytes
+            if oldest >= 0:
+                self.window_bytes -= self.interval_bytes[oldest % self.max_intervals]
+            self.current_interval += 1
+            self.interval_bytes[self.current_interval % self.max_intervals] = 0.0
+
+    def record_chunk(self, nbytes, chunk_latency=None, now=None, stream=None):
+        now = time.perf_counter() if now is None else now
+        stream = stream or self
+        if self.start_time is None:
+            self.start(now)
+        if stream.request_time is not None:
+            # First chunk of a request: the wait since the request is the time to first byte
+            ttfb = now - stream.request_time
+            if self.ttfb_first is None:
+                self.ttfb_first = ttfb
+            self.ttfb_max = max(self.ttfb_max, ttfb)
+            stream.request_time = None
+        elif stream.last_chunk_time is not None and now - stream.last_chunk_time > self.stall_threshold:
+            self.stall_count += 1
+            self.stall_time += now - stream.last_chunk_time
+
+        if chunk_latency is not None:
+            self.chunk_latencies[self.chunk_count % self.max_chunks] = chunk_latency
+            self.chunk_count += 1
+
+        self.advance(int((now - self.start_time) / self.interval))
+        self.interval_bytes[self.current_interval % self.max_intervals] += nbytes
+        self.window_bytes += nbytes
+        self.total_bytes += nbytes
+        stream.last_chunk_time = now
+
+    def finish(self, now=None):
+        now = time.perf_counter() if now is None else now
+        if self.start_time is not None:
+            self.advance(int((now - self.start_time) / self.interval))
+        return now
+
+    @property
+    def peak_speed(self):
+        # Highest throughput over any peak_window span, in MB/s
+        peak_bytes = max(self.peak_window_bytes, self.window_bytes)
+        return peak_bytes / (self.window_intervals * self.interval) / 1024 / 1024
+
+    def chunk_latency_percentiles(self):
+        count = min(self.chunk_count, self.max_chunks)
+        latencies = sorted(self.chunk_latencies[:count])
+        return {
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'min': latencies[0] if latencies else 0.0,
+            'max': latencies[-1] if latencies else 0.0,
+            'count': self.chunk_count,
+        }
+
+    def timeseries(self):
+        # (seconds since start, MB/s) for every retained interval, oldest first
+        first = max(0, self.current_interval - self.max_intervals + 1)
+        return [(round(index * self.interval, 6),
+                 self.interval_bytes[index % self.max_intervals] / self.interval / 1024 / 1024)
+                for index in range(first, self.current_interval + 1)]
+
+    @property
+    def cpu_seconds_per_gb(self):
+        if not self.total_bytes or not self.cpu_time:
+            return None
+        return self.cpu_time / (self.total_bytes / 1024 / 1024 / 1024)
+
+    def summary(self):
+        return {
+            'total_bytes': self.total_bytes,
+            'peak_speed': self.peak_speed,
+            'peak_window': self.window_intervals * self.interval,
+            'ttfb_first': self.ttfb_first,
+            'ttfb_max': self.ttfb_max,
+            'stall_count': self.stall_count,
+            'stall_time': self.stall_time,
+            'chunk_latency': self.chunk_latency_percentiles(),
+            'cpu_seconds_per_gb': self.cpu_seconds_per_gb,
+        }
+
+    def export(self, filename):
+        # CSV for plotting tools, JSON (with the summary) for diffing runs
+        if filename.lower().endswith('.csv'):
+            with open(filename, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['time', 'speed_mb_s'])
+                writer.writerows(self.timeseries())
+        else:
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump({'interval': self.interval, 'summary': self.summary(),
+                           'timeseries': self.timeseries()}, f, indent=2)
@@ -0,0 +1,252 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from throughput_stats import percentile
+
+DEFAULT_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples of the sampling profiler
+PROFILE_TOP = 15  # Functions shown per profiled stage
+
+class NoopSpan:
+    # Returned by span() while tracing is off, so disabled instrumentation costs one call
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+NOOP_SPAN = NoopSpan()
+
+class Span:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.start_time = None
+        self.profile = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.tracer.enter_stage(self.name)
+        if self.name in self.tracer.profile_stages and self.tracer.profiler == 'cprofile':
+            self.profile = self.tracer.start_cprofile(self.name)
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start_time
+        if self.profile is not None:
+            self.tracer.stop_cprofile(self.name, self.profile)
+        self.tracer.leave_stage()
+        if exc_type is not None:
+            self.attrs['error'] = f"{exc_type.__name__}: {exc}"
+        self.tracer.finish(self.name, self.start_time, duration, self.attrs)
+        return False
+
+class Tracer:
+    # Per-video spans for each pipeline stage, written as JSON lines and summarized at the end.
+    # Attributes set with context() (such as the video) are added to every span of that thread.
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_file = None
+        self.profile_stages = set()
+        self.profiler = 'cprofile'
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.origin = time.perf_counter()
+        self.durations = defaultdict(list)
+        self.bytes = Counter()
+        self.errors = Counter()
+        self.profiles = {}
+        self.cprofile_lock = threading.Lock()
+        self.cprofile_skipped = Counter()
+        self.stage_threads = {}  # Thread id -> stack of the spans it is in, read by the sampler
+        self.samples = defaultdict(lambda: defaultdict(lambda: [0, 0]))  # Stage -> function -> [self, on stack]
+        self.sample_counts = Counter()
+        self.sampler = None
+        self.stop_sampler = threading.Event()
+
+    def configure(self, trace_path=None, profile_stages=None, profiler='cprofile'):
+        self.enabled = True
+        self.origin = time.perf_counter()
+        self.profile_stages = set(profile_stages or [])
+        self.profiler = profiler
+        if trace_path:
+            self.trace_file = open(trace_path, 'w', encoding='utf-8')
+        if self.profile_stages and profiler == 'sample':
+            self.sampler = threading.Thread(target=self.sample_stacks, daemon=True)
+            self.sampler.start()
+
+    def context(self):
+        context = getattr(self.local, 'context', None)
+        if context is None:
+            context = self.local.context = {}
+        return context
+
+    def enter_stage(self, name):
+        stages = getattr(self.local, 'stages', None)
+        if stages is None:
+            stages = self.local.stages = []
+            self.stage_threads[threading.get_ident()] = stages
+        stages.append(name)
+
+    def leave_stage(self):
+        self.local.stages.pop()
+
+    def finish(self, name, start_time, duration, attrs):
+        record = dict(self.context())
+        record.update(attrs)
+        record.update({'span': name, 'start': round(start_time - self.origin, 6), 'duration': round(duration, 6),
+                       'thread': threading.current_thread().name})
+        with self.lock:
+            self.durations[name].append(duration)
+            if attrs.get('bytes'):
+                self.bytes[name] += attrs['bytes']
+            if 'error' in attrs:
+                self.errors[name] += 1
+            if self.trace_file is not None:
+                self.trace_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def start_cprofile(self, name):
+        # Only one cProfile can be active at a time (Python 3.12 refuses a second one), so spans
+        # that overlap an already profiled one are counted as skipped instead
+        if not self.cprofile_lock.acquire(blocking=False):
+            with self.lock:
+                self.cprofile_skipped[name] += 1
+            return None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop_cprofile(self, name, profile):
+        profile.disable()
+        self.cprofile_lock.release()
+        with self.lock:
+            if name in self.profiles:
+                self.profiles[name].add(profile)
+            else:
+                self.profiles[name] = pstats.Stats(profile)
+
+    def sample_stacks(self):
+        # Sampling profiler: counts the functions on the stack of every thread that is inside a
+        # profiled stage. Sees all threads at once and also shows where time is spent waiting.
+        while not self.stop_sampler.wait(DEFAULT_SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            for thread_id, stages in list(self.stage_threads.items()):
+                frame = frames.get(thread_id)
+                profiled = self.profile_stages.intersection(list(stages))
+                if not profiled or frame is None:
+                    continue
+                locations = []
+                while frame is not None:
+                    code = frame.f_code
+                    locations.append(f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})")
+                    frame = frame.f_back
+                for stage in profiled:
+                    self.sample_counts[stage] += 1
+                    counts = self.samples[stage]
+                    counts[locations[0]][0] += 1
+                    for location in set(locations):
+                        counts[location][1] += 1
+
+    def close(self):
+        self.stop_sampler.set()
+        if self.sampler is not None:
+            self.sampler.join()
+        if self.trace_file is not None:
+            self.trace_file.close()
+            self.trace_file = None
+
+    def summary(self):
+        rows = []
+        with self.lock:
+            for name, durations in self.durations.items():
+                ordered = sorted(durations)
+                total = sum(ordered)
+                rows.append({
+                    'span': name,
+                    'count': len(ordered),
+                    'total': total,
+                    'mean': total / len(ordered),
+                    'p50': percentile(ordered, 0.50),
+                    'p95': percentile(ordered, 0.95),
+                    'max': ordered[-1],
+                    'errors': self.errors[name],
+                    'mb_s': self.bytes[name] / total / 1024 / 1024 if self.bytes[name] and total else None,
+                })
+        return sorted(rows, key=lambda row: row['total'], reverse=True)
+
+    def report(self):
+        if not self.enabled:
+            return
+        rows = self.summary()
+        if rows:
+            print(f"\n{'Span':<16}{'Count':>7}{'Total s':>10}{'Mean s':>9}{'p50 s':>9}{'p95 s':>9}{'Max s':>9}{'Errors':>8}{'MB/s':>9}")
+            for row in rows:
+                mb_s = f"{row['mb_s']:.2f}" if row['mb_s'] is not None else '-'
+                print(f"{row['span']:<16}{row['count']:>7}{row['total']:>10.2f}{row['mean']:>9.3f}{row['p50']:>9.3f}"
+                      f"{row['p95']:>9.3f}{row['max']:>9.3f}{row['errors']:>8}{mb_s:>9}")
+            print("Span times overlap across workers; Total is summed over all of them.")
+        for stage, stats in sorted(self.profiles.items()):
+            print(f"\ncProfile of stage '{stage}'"
+                  + (f" ({self.cprofile_skipped[stage]} overlapping spans not profiled)" if self.cprofile_skipped[stage] else "")
+                  + ":")
+            output = io.StringIO()
+            stats.stream = output
+            stats.sort_stats('cumulative').print_stats(PROFILE_TOP)
+            print(output.getvalue().strip())
+        for stage, counts in sorted(self.samples.items()):
+            total = self.sample_counts[stage]
+            print(f"\nSampled profile of stage '{stage}' ({total} samples; share of samples in the function itself and on the stack):")
+            print(f"  {'Self':>6}  {'Stack':>6}  Function")
+            for location, (self_count, stack_count) in sorted(counts.items(), key=lambda item: item[1][1], reverse=True)[:PROFILE_TOP]:
+                print(f"  {self_count / total:>6.1%}  {stack_count / total:>6.1%}  {location}")
+
+tracer = Tracer()
+
+def span(name, **attrs):
+    if not tracer.enabled:
+        return NOOP_SPAN
+    return Span(tracer, name, attrs)
+
+def record(name, duration, **attrs):
+    # A span measured by the caller, e.g. time spent sleeping in a backoff
+    if tracer.enabled:
+        tracer.finish(name, time.perf_counter() - duration, duration, attrs)
+
+@contextmanager
+def context(**attrs):
+    # with context(video=video_id): ... adds video=video_id to every span in the block
+    if not tracer.enabled:
+        yield
+        return
+    current = tracer.context()
+    saved = dict(current)
+    current.update(attrs)
+    try:
+        yield
+    finally:
+        tracer.local.context = saved
+
+def configure(trace_path=None, profile_stages=None, profiler='cprofile'):
+    tracer.configure(trace_path=trace_path, profile_stages=profile_stages, profiler=profiler)
+
+def report():
+    tracer.report()
+
+def close():
+    tracer.close()
@@ -1,59 +1,106 @@
 import yt_dlp
-import time
-import random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from rate_limiter import call_with_retry, get_extraction_bucket, is_retryable
+from client_pool import ydl_pool
+from proxy_pool import is_proxy_failure
+from tracing import span, context
+from video_index import VideoIndex
 
-def analyze_youtube_url(url):
+DEFAULT_WORKERS = 4
+
+def analyze_youtube_url(url, rate_limiter=None, proxy=None, proxy_pool=None):
+    # With a proxy pool, the URL goes through one of its proxies and the outcome feeds its score;
+    # when that proxy is throttled or unreachable, the URL moves on to the next one
+    def extract(proxy):
+        return extract_url_info(url, rate_limiter or get_extraction_bucket(proxy), proxy)
+
+    try:
+        if proxy_pool:
+            info, proxy = proxy_pool.call(extract)
+            proxy_pool.release(proxy)
+        else:
+            info = extract(proxy)
+    except yt_dlp.utils.DownloadError as e:
+        if proxy_pool and is_proxy_failure(e):
+            print(f"Failed to get information for {url} through any of {len(proxy_pool.stats)} proxies: {str(e)}")
+        elif is_retryable(e):
+            print("Maximum number of attempts reached. Failed to get information.")
+        else:
+            print(f"An error occurred during download: {str(e)}")
+        return []
+    except Exception as e:
+        print(f"Unknown error: {str(e)}")
+        return []
+
+    if isinstance(info, dict):
+        if info.get('_type') == 'playlist':
+            # It's a playlist or channel
+            return [entry['url'] for entry in info['entries'] if entry.get('url')]
+        elif info.get('_type') == 'url' or (info.get('webpage_url') and 'youtube.com' in info['webpage_url']):
+            # It's a single video
+            return [info.get('webpage_url') or info.get('url')]
+        else:
+            print(f"Unsupported URL type: {info.get('_type')}")
+            return []
+    else:
+        print(f"Unexpected data type: {type(info)}")
+        return []
+
+def extract_url_info(url, rate_limiter, proxy=None, max_attempts=3):
     ydl_opts = {
         'quiet': True,
         'extract_flat': True,
         'force_generic_extractor': True,
     }
+    if proxy:
+        ydl_opts['proxy'] = proxy
 
-    max_retries = 3
-    retry_delay = 10
-
-    for attempt in range(max_retries):
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-
-                if isinstance(info, dict):
-                    if info.get('_type') == 'playlist':
-                        # It's a playlist or channel
-                        return [entry['url'] for entry in info['entries'] if entry.get('url')]
-                    elif info.get('_type') == 'url' or (info.get('webpage_url') and 'youtube.com' in info['webpage_url']):
-                        # It's a single video
-                        return [info.get('webpage_url') or info.get('url')]
-                    else:
-                        print(f"Unsupported URL type: {info.get('_type')}")
-                        return []
-                else:
-                    print(f"Unexpected data type: {type(info)}")
-                    return []
-
-        except yt_dlp.utils.DownloadError as e:
-            if 'HTTP Error 429' in str(e):
-                if attempt < max_retries - 1:
-                    wait_time = retry_delay + random.uniform(0, 5)
-                    print(f"Too many requests. Waiting {wait_time:.2f} seconds before retrying...")
-                    time.sleep(wait_time)
-                else:
-                    print("Maximum number of attempts reached. Failed to get information.")
-                    return []
-            else:
-                print(f"An error occurred during download: {str(e)}")
-                return []
-        except Exception as e:
-            print(f"Unknown error: {str(e)}")
-            return []
+    def extract():
+        with ydl_pool.acquire(ydl_opts) as ydl, span('extract'):
+            return ydl.extract_info(url, download=False)
+
+    # Throttling pauses every worker sharing the bucket, other transient errors back off with jitter
+    return call_with_retry(extract, rate_limiter, max_attempts=max_attempts, retry_on=(yt_dlp.utils.DownloadError,))
+
+def iter_all_video_urls(urls, workers=DEFAULT_WORKERS, rate_limiter=None, ordered=True, proxy=None, proxy_pool=None,
+                        index=None):
+    # Like iter_expanded_video_urls, but yields every video ID only once, at its first occurrence,
+    # however many inputs list it. Pass a VideoIndex to carry the seen IDs across calls or runs.
+    index = index if index is not None else VideoIndex()
+    return index.unique(iter_expanded_video_urls(urls, workers=workers, rate_limiter=rate_limiter, ordered=ordered,
+                                                 proxy=proxy, proxy_pool=proxy_pool))
 
-def collect_all_video_urls(urls):
-    all_video_urls = []
-    for url in urls:
+def iter_expanded_video_urls(urls, workers=DEFAULT_WORKERS, rate_limiter=None, ordered=True, proxy=None, proxy_pool=None):
+    # Expands inputs concurrently and yields video URLs as soon as each input is analyzed.
+    # With ordered=True results keep the input order; otherwise they come in completion order.
+    # Only a small window of inputs is analyzed ahead of the consumer.
+    workers = max(1, workers)
+
+    def analyze(url):
         print(f"\nAnalyzing URL: {url}")
-        video_urls = analyze_youtube_url(url)
+        with context(url=url), span('analyze') as analyze_span:
+            video_urls = analyze_youtube_url(url, rate_limiter=rate_limiter, proxy=proxy, proxy_pool=proxy_pool)
+            analyze_span.set(videos=len(video_urls))
         print(f"Videos found: {len(video_urls)}")
-        all_video_urls.extend(video_urls)
-    return all_video_urls
-
+        return video_urls
 
+    urls = iter(urls)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        pending = deque()
+        for url in urls:
+            pending.append(executor.submit(analyze, url))
+            if len(pending) < workers * 2:
+                continue
+            if ordered:
+                yield from pending.popleft().result()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield from future.result()
+        for future in (pending if ordered else as_completed(pending)):
+            yield from future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,31 +1,18 @@
 import yt_dlp
 import requests
 import time
-import re
 import sys
+from metadata_cache import metadata_cache
+from client_pool import ydl_pool
+from format_selector import select_format
+from rate_limiter import call_with_retry, get_extraction_bucket
+from tracing import span, record
+from video_index import extract_video_id
 
 def debug_print(*args, **kwargs):
     print(*args, **kwargs)
 
-def extract_video_id(url):
-    patterns = [
-        r'(?:v=|\/)([0-9A-Za-z_-]{11}).*',
-        r'(?:embed\/|v\/|youtu.be\/)([0-9A-Za-z_-]{11})',
-        r'(?:watch\?v=)([0-9A-Za-z_-]{11})'
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
-
-def get_best_video_and_audio_url(video_url, proxy=None, max_retries=3):
-    video_id = extract_video_id(video_url)
-    if not video_id:
-        raise ValueError(f"Could not extract video ID from URL: {video_url}")
-
-    debug_print(f"Extracted video ID: {video_id}")
+def get_video_info(video_id, proxy=None, max_retries=3):
     ydl_opts = {
         'format': 'bestvideo+bestaudio/best',
         'quiet': True,
@@ -34,43 +21,46 @@ def get_best_video_and_audio_url(video_url, proxy=None, max_retries=3):
     if proxy:
         ydl_opts['proxy'] = proxy
 
-    for attempt in range(max_retries):
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
-                formats = info.get('formats', [])
-
-                video_formats = [f for f in formats if f.get('vcodec') != 'none' and f.get('height') is not None]
-                if not video_formats:
-                    raise ValueError("No valid video formats found")
-
-                best_video = max(video_formats, key=lambda x: (x['height'], x.get('tbr', 0)))
-                video_has_audio = best_video.get('acodec') != 'none'
+    lookup_start = time.perf_counter()
+    info = metadata_cache.get(video_id, proxy)
+    if info is not None:
+        record('extract', time.perf_counter() - lookup_start, cached=True)
+        return info
 
-                audio_formats = [f for f in formats if f.get('acodec') != 'none']
-                has_separate_audio = bool(audio_formats)
-
-                if has_separate_audio:
-                    best_audio = max(audio_formats, key=lambda x: (x.get('abr', 0) or 0, x.get('tbr', 0) or 0))
-                    audio_url = best_audio['url']
-                    audio_ext = best_audio['ext']
-                else:
-                    audio_url = None
-                    audio_ext = None
-
-                video_url = best_video['url']
-                resolution = f"{best_video['height']}p"
-                video_ext = best_video['ext']
-
-                return video_url, audio_url, info.get('title', 'Unknown'), resolution, video_ext, audio_ext, video_has_audio, has_separate_audio
-
-        except (yt_dlp.utils.DownloadError, requests.exceptions.RequestException, ValueError) as e:
-            if attempt < max_retries - 1:
-                print(f"Error occurred: {str(e)}. Retrying... (Attempt {attempt + 1}/{max_retries})")
-                time.sleep(2 ** attempt)  # Exponential backoff
-            else:
-                raise
+    def extract():
+        with span('extract', cached=False):
+            extract_start = time.time()
+            with ydl_pool.acquire(ydl_opts) as ydl:
+                info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
+            metadata_cache.put(video_id, info, proxy, extract_seconds=time.time() - extract_start)
+        return info
+
+    # Cache hits above skip the rate limiter; only real requests to YouTube take a token
+    return call_with_retry(extract, get_extraction_bucket(proxy), max_attempts=max_retries,
+                           retry_on=(yt_dlp.utils.DownloadError, requests.exceptions.RequestException))
+
+def select_best_video_and_audio(info, policy=None):
+    best_video, best_audio = select_format(info, policy)
+    if best_video is None:
+        formats = info.get('formats', [])
+        if policy and policy.max_height and any(f.get('vcodec') != 'none' and f.get('height') is not None for f in formats):
+            raise ValueError(f"No video formats found with quality {policy.max_height}p or lower")
+        raise ValueError("No valid video formats found")
+    return best_video, best_audio
+
+def get_best_video_and_audio_url(video_url, proxy=None, max_retries=3, policy=None):
+    video_id = extract_video_id(video_url)
+    if not video_id:
+        raise ValueError(f"Could not extract video ID from URL: {video_url}")
 
-    raise Exception("Failed to get video information after multiple attempts")
+    debug_print(f"Extracted video ID: {video_id}")
+    info = get_video_info(video_id, proxy=proxy, max_retries=max_retries)
+    best_video, best_audio = select_best_video_and_audio(info, policy)
 
+    video_has_audio = best_video.get('acodec') != 'none'
+    has_separate_audio = best_audio is not None
+    audio_url = best_audio['url'] if best_audio else None
+    audio_ext = best_audio['ext'] if best_audio else None
+    resolution = f"{best_video['height']}p"
 
+    return best_video['url'], audio_url, info.get('title', 'Unknown'), resolution, best_video['ext'], audio_ext, video_has_audio, has_separate_audio
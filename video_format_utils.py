@@ -1,20 +1,21 @@
-def select_best_format(codecs, resolution):
-    # Priority order for codecs
-    codec_priority = ['av01', 'vp09', 'avc1']
-
-    # Find the highest priority codec from the input list
-    selected_codec = None
-    for priority_codec in codec_priority:
-        for codec in codecs:
-            if priority_codec in codec.lower():
-                selected_codec = codec
-                break
-        if selected_codec:
-            break
-
-    # If no preferred codec found, select the first one
-    if not selected_codec and codecs:
-        selected_codec = codecs[0]
+# Priority order for codecs
+CODEC_PRIORITY = ['av01', 'vp09', 'avc1']
+
+# Codec families recognised in yt-dlp codec strings such as 'avc1.4d401f' or 'vp09.00.40.08'
+VIDEO_CODEC_FAMILIES = ['av01', 'vp09', 'vp9', 'vp8', 'avc1', 'hev1', 'hvc1']
+AUDIO_CODEC_FAMILIES = ['opus', 'vorbis', 'mp4a', 'ac-3', 'ec-3']
+
+def get_codec_family(codec, families=VIDEO_CODEC_FAMILIES + AUDIO_CODEC_FAMILIES):
+    codec = (codec or '').lower()
+    for family in families:
+        if codec.startswith(family) or family in codec:
+            return family
+    return None
+
+def select_best_format(codecs, resolution, codec_priority=CODEC_PRIORITY):
+    # Rank each codec once by the priority of its family; unknown codecs rank last, ties keep input order
+    ranks = {family: rank for rank, family in enumerate(codec_priority)}
+    selected_codec = min(codecs, key=lambda codec: ranks.get(get_codec_family(codec), len(ranks)), default=None)
 
     # Determine the best format
     if selected_codec:
@@ -48,6 +49,36 @@ def get_optimal_format(codec, resolution):
     # If codec not found, return mp4 as the most universal format
     return 'mp4'
 
+def is_stream_copy_compatible(container, video_codec, audio_codec=None):
+    # Codecs each container can hold without re-encoding
+    container_codecs = {
+        'mp4': {
+            'video': ['av01', 'avc1', 'hev1', 'hvc1', 'vp09'],
+            'audio': ['mp4a', 'opus', 'ac-3', 'ec-3'],
+        },
+        'webm': {
+            'video': ['av01', 'vp09', 'vp8', 'vp9'],
+            'audio': ['opus', 'vorbis'],
+        },
+    }
+
+    supported = container_codecs.get(container.lower())
+    if not supported:
+        return False
+    if video_codec and not any(key in video_codec.lower() for key in supported['video']):
+        return False
+    if audio_codec and audio_codec != 'none' and not any(key in audio_codec.lower() for key in supported['audio']):
+        return False
+    return True
+
+def get_remux_container(video_codec, audio_codec, resolution, preferred=None):
+    # Try the caller's container first, then the one preferred for the video codec
+    candidates = [preferred, get_optimal_format(video_codec, resolution), 'mp4', 'webm']
+    for container in candidates:
+        if container and is_stream_copy_compatible(container, video_codec, audio_codec):
+            return container
+    return None
+
 # Example usage
 # codecs = ['vp09.00.40.08', 'avc1.4d401f', 'av01.0.12M.08', 'vp09.00.50.08']
 # resolution = '720p'
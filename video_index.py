@@ -0,0 +1,83 @@
+import os
+import re
+import threading
+
+def extract_video_id(url):
+    patterns = [
+        r'(?:v=|\/)([0-9A-Za-z_-]{11}).*',
+        r'(?:embed\/|v\/|youtu.be\/)([0-9A-Za-z_-]{11})',
+        r'(?:watch\?v=)([0-9A-Za-z_-]{11})'
+    ]
+
+    for pattern in patterns:
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
+    return None
+
+def get_video_key(video_url):
+    # The video ID, so watch, youtu.be and embed URLs of one video match; the URL if it has none
+    return extract_video_id(video_url) or video_url
+
+class VideoIndex:
+    # Order-preserving set of video IDs. With a path, every new ID is also appended to that file
+    # (one per line), and IDs listed there by earlier runs count as already seen.
+
+    def __init__(self, path=None):
+        self.path = path
+        self.ids = {}  # Dicts keep insertion order, so this doubles as the first-seen order
+        self.duplicates = 0
+        self.lock = threading.Lock()
+        self.file = None
+
+    def load(self):
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        self.ids[line.strip()] = None
+        return self
+
+    def open(self):
+        self.load()
+        if self.path:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        return self
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __contains__(self, video_url):
+        return get_video_key(video_url) in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(list(self.ids))
+
+    def add(self, video_url):
+        # True the first time a video is seen, False for every repeat
+        key = get_video_key(video_url)
+        with self.lock:
+            if key in self.ids:
+                self.duplicates += 1
+                return False
+            self.ids[key] = None
+            if self.file is not None:
+                self.file.write(f"{key}\n")
+                self.file.flush()
+            return True
+
+    def unique(self, video_urls):
+        for video_url in video_urls:
+            if self.add(video_url):
+                yield video_url